@@ -0,0 +1,123 @@
+"""Compares the parser throughput against the legacy line-by-line parser."""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.models import File
+from usdb_downloader.parser import Parser
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+_ID_PATTERN: Final[re.Pattern[str]] = re.compile(r"(?:a=|v=)([A-Za-z0-9_-]{11})")
+_SYLLABLES: Final[tuple[str, ...]] = ("la", "na", "oh", "love", "you", "me", "sing")
+
+
+def _legacy_parse_file(path: Path) -> File | None:
+    name = path.stem
+    video_id: str | None = None
+    headers: dict[str, str] = {}
+    lyrics: list[str] = []
+
+    with path.open("r", encoding="utf-8") as src:
+        for raw_line in src:
+            line = raw_line.rstrip("\n").lstrip()
+
+            if not line or line.startswith(("#MP3", "#COVER")):
+                continue
+
+            match line:
+                case l if l.startswith("#VIDEO"):
+                    match = _ID_PATTERN.search(l)
+                    video_id = match.group(1) if match else None
+                case s if s.startswith("#"):
+                    key, _, value = s[1:].partition(":")
+                    headers[key.strip()] = value.strip()
+                case _:
+                    lyrics.append(line)
+
+    if video_id is None:
+        return None
+
+    headers["COVER"] = f"{name}.jpg"
+    headers["MP3"] = f"{name}.mp3"
+    headers["VIDEO"] = f"{name}.webm"
+    return File(name=name, video_id=video_id, headers=headers, lyrics=lyrics)
+
+
+def _write_corpus(directory: Path, count: int, notes: int) -> list[Path]:
+    rng = random.Random(0)
+    paths: list[Path] = []
+    for idx in range(count):
+        lines = [
+            f"#TITLE:Song {idx}",
+            f"#ARTIST:Artist {idx % 97}",
+            "#LANGUAGE:English",
+            "#YEAR:2025",
+            "#MP3:song.mp3",
+            "#COVER:song.jpg",
+            f"#BPM:{rng.randint(100, 400)},5",
+            f"#GAP:{rng.randint(0, 20000)}",
+            "#VIDEO:v=dQw4w9WgXcQ,co=cover.jpg",
+        ]
+        beat = 0
+        for note in range(notes):
+            if note and note % 8 == 0:
+                lines.append(f"- {beat}")
+            length = rng.randint(1, 6)
+            pitch = rng.randint(-5, 20)
+            lines.append(f": {beat} {length} {pitch} {rng.choice(_SYLLABLES)} ")
+            beat += length + rng.randint(0, 2)
+        lines.append("E")
+
+        path = directory / f"Artist {idx % 97} - Song {idx}.txt"
+        path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        paths.append(path)
+
+    return paths
+
+
+def _measure(
+    parse: Callable[[Path], File | None],
+    paths: list[Path],
+    repeats: int,
+) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for path in paths:
+            parse(path)
+        best = min(best, time.perf_counter() - start)
+
+    return len(paths) / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--notes", type=int, default=400)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        paths = _write_corpus(directory, count=args.files, notes=args.notes)
+        current = Parser(input_dir=directory, output_dir=directory)
+
+        legacy = _measure(_legacy_parse_file, paths, args.repeats)
+        fast = _measure(current._parse_file, paths, args.repeats)
+
+    print(f"Corpus: {args.files} files with {args.notes} notes each")
+    print(f"Legacy parser:  {legacy:10.0f} files/s")
+    print(f"Current parser: {fast:10.0f} files/s ({fast / legacy:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
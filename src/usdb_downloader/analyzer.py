@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import functools
+import importlib.util
+import logging
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.batch_pool import BatchPool, BatchPoolException
+from usdb_downloader.models import Timing
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping, Sequence
+    from pathlib import Path
+
+    from usdb_downloader.models import File
+
+logger = logging.getLogger(__name__)
+
+_PREVIEW_HEADER: Final[str] = "PREVIEWSTART"
+_MEDLEY_HEADERS: Final[tuple[str, str]] = ("MEDLEYSTARTBEAT", "MEDLEYENDBEAT")
+
+
+class PreviewAnalyzerException(Exception):
+    """Custom exception for PreviewAnalyzer errors."""
+
+
+@dataclass(frozen=True)
+class PreviewAnalysis:
+    name: str
+    headers: Mapping[str, str] = field(default_factory=dict[str, str])
+    error: str | None = None
+
+
+@dataclass(frozen=True)
+class _Song:
+    name: str
+    audio: Path
+    headers: Mapping[str, str]
+    lyrics: Sequence[str]
+    medley: bool
+
+
+class PreviewAnalyzer:
+    _DEFAULT_WORKERS: Final[int] = min(4, os.cpu_count() or 1)
+    _DEFAULT_BATCH_SIZE: Final[int] = 4
+    _DEFAULT_LENGTH: Final[float] = 15.0
+
+    def __init__(
+        self,
+        workers: int = _DEFAULT_WORKERS,
+        batch_size: int = _DEFAULT_BATCH_SIZE,
+        length: float = _DEFAULT_LENGTH,
+        medley: bool = False,
+        ffmpeg: str | None = None,
+    ) -> None:
+        self._medley = medley
+        self._ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        # Decoding and the NumPy analysis run in a process pool, songs that
+        # finish their audio at about the same time are analysed in one batch.
+        self._batches: BatchPool[_Song, PreviewAnalysis] = BatchPool(
+            functools.partial(_analyze_batch, self._ffmpeg, length),
+            workers=workers,
+            batch_size=batch_size,
+        )
+
+    @property
+    def available(self) -> bool:
+        return (
+            self._ffmpeg is not None and importlib.util.find_spec("numpy") is not None
+        )
+
+    async def analyze(self, file: File, song_dir: Path) -> PreviewAnalysis:
+        if self._ffmpeg is None:
+            raise PreviewAnalyzerException("ffmpeg is not installed")
+
+        # Headers that come with the song file are never overridden.
+        medley = (
+            self._medley
+            and not any(key in file.headers for key in _MEDLEY_HEADERS)
+            and file.headers.get("CALCMEDLEY", "").strip().lower() != "off"
+        )
+        if _PREVIEW_HEADER in file.headers and not medley:
+            return PreviewAnalysis(name=file.name)
+
+        try:
+            analysis = await self._batches.submit(
+                _Song(
+                    name=file.name,
+                    audio=song_dir / file.headers.get("MP3", f"{file.name}.mp3"),
+                    headers=file.headers,
+                    lyrics=file.lyrics,
+                    medley=medley,
+                )
+            )
+        except BatchPoolException as e:
+            raise PreviewAnalyzerException(str(e)) from e
+
+        logger.info(
+            "Analyzed song %s: %s",
+            file.name,
+            analysis.error or dict(analysis.headers),
+        )
+        return analysis
+
+    def close(self) -> None:
+        self._batches.close()
+
+
+def _analyze_batch(
+    ffmpeg: str | None,
+    length: float,
+    songs: Sequence[_Song],
+) -> list[PreviewAnalysis]:
+    if ffmpeg is None:
+        raise PreviewAnalyzerException("ffmpeg is not installed")
+    return [_analyze_song(ffmpeg, length, song) for song in songs]
+
+
+def _analyze_song(ffmpeg: str, length: float, song: _Song) -> PreviewAnalysis:
+    # The workers import NumPy, so the parent process does not need it.
+    from usdb_downloader import preview
+    from usdb_downloader.notes import Notes
+
+    try:
+        samples = preview.decode_audio(ffmpeg, song.audio)
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode(errors="replace").strip()
+        return PreviewAnalysis(name=song.name, error=stderr or str(e))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return PreviewAnalysis(name=song.name, error=str(e))
+
+    detected = preview.detect_preview(samples, length=length)
+    if detected is None:
+        return PreviewAnalysis(name=song.name, error="Audio is too short or silent")
+
+    headers: dict[str, str] = {}
+    if _PREVIEW_HEADER not in song.headers:
+        headers[_PREVIEW_HEADER] = f"{detected.start:.1f}"
+
+    timing = Timing.from_headers(song.headers) if song.medley else None
+    # Medleys are given in beats, which relative songs restart at every line.
+    if timing is not None and not timing.relative:
+        beats = preview.medley_beats(
+            Notes.from_lines(song.lyrics),
+            timing,
+            start=detected.start,
+            end=detected.end,
+        )
+        if beats is not None:
+            headers.update(zip(_MEDLEY_HEADERS, map(str, beats), strict=True))
+
+    return PreviewAnalysis(name=song.name, headers=headers)
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+from typing import TYPE_CHECKING, Final, Self
+
+from usdb_downloader.app import App
+from usdb_downloader.console import NullConsole
+from usdb_downloader.job_queue import JobState, SongResult
+from usdb_downloader.layout import Layout
+from usdb_downloader.models import SongSource
+from usdb_downloader.parser import Parser
+from usdb_downloader.youtube_downloader import YoutubeDownloader
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Iterable
+    from pathlib import Path
+
+    from usdb_downloader.analyzer import PreviewAnalyzer
+    from usdb_downloader.bandwidth import BandwidthLimiter
+    from usdb_downloader.models import File
+    from usdb_downloader.proxy_pool import ProxyPool
+    from usdb_downloader.replaygain import ReplayGainTagger
+
+__all__ = ["Downloader", "JobState", "Layout", "SongResult", "download_song"]
+
+logger = logging.getLogger(__name__)
+
+
+class Downloader:
+    _DEFAULT_VIDEO_CONCURRENCY: Final[int] = 2
+    _DEFAULT_STALL_TIMEOUT: Final[float] = 120.0
+
+    def __init__(
+        self,
+        input_dir: Path,
+        output_dir: Path,
+        layout: Layout = Layout.FLAT,
+        allow_duplicates: bool = False,
+        video_concurrency: int = _DEFAULT_VIDEO_CONCURRENCY,
+        download_timeout: float | None = None,
+        stall_timeout: float = _DEFAULT_STALL_TIMEOUT,
+        proxy_pool: ProxyPool | None = None,
+        bandwidth_limiter: BandwidthLimiter | None = None,
+        analyzer: PreviewAnalyzer | None = None,
+        tagger: ReplayGainTagger | None = None,
+    ) -> None:
+        self._input_dir = input_dir
+        self._output_dir = output_dir
+        self._parser = Parser(input_dir=input_dir, output_dir=output_dir)
+        self._results: asyncio.Queue[SongResult | None] | None = None
+        # Batches run one after another, the downloader state stays warm.
+        self._lock = asyncio.Lock()
+        self._app = App(
+            input_dir=input_dir,
+            output_dir=output_dir,
+            console=NullConsole(),
+            youtube_downloader=YoutubeDownloader(
+                deadline=download_timeout,
+                stall_timeout=stall_timeout,
+                proxy_pool=proxy_pool,
+                bandwidth_limiter=bandwidth_limiter,
+            ),
+            allow_duplicates=allow_duplicates,
+            layout=layout,
+            analyzer=analyzer,
+            tagger=tagger,
+            video_concurrency=video_concurrency,
+            on_result=self._on_result,
+        )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._app.close()
+
+    async def download_song(self, path: Path) -> SongResult:
+        results = [result async for result in self.download_batch([path])]
+        if len(results) != 1:
+            raise ValueError(f"Expected a single song in {path}, got {len(results)}")
+        return results[0]
+
+    async def download_batch(
+        self,
+        paths: Iterable[Path] | None = None,
+    ) -> AsyncGenerator[SongResult]:
+        async with self._lock:
+            results: asyncio.Queue[SongResult | None] = asyncio.Queue()
+            self._results = results
+
+            files, failures = await asyncio.to_thread(
+                self._parse,
+                [self._input_dir] if paths is None else list(paths),
+            )
+            for failure in failures:
+                yield failure
+
+            # Songs of the input directory are reconciled with it later on.
+            source = SongSource.INPUT if paths is None else SongSource.API
+            task = asyncio.create_task(self._app.process(files, source))
+            task.add_done_callback(lambda _: results.put_nowait(None))
+            try:
+                while (result := await results.get()) is not None:
+                    yield result
+                await task
+            finally:
+                self._results = None
+                if not task.done():
+                    task.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await task
+
+    def _on_result(self, result: SongResult) -> None:
+        if self._results is not None:
+            self._results.put_nowait(result)
+
+    def _parse(self, paths: Iterable[Path]) -> tuple[list[File], list[SongResult]]:
+        files: list[File] = []
+        failures: list[SongResult] = []
+        for path in paths:
+            if path.is_dir():
+                songs: Iterable[File | None] = Parser(
+                    input_dir=path,
+                    output_dir=self._output_dir,
+                ).iter_files()
+            else:
+                songs = self._parser.parse_path(path)
+
+            for song in songs:
+                if song is None:
+                    failures.append(
+                        SongResult(
+                            name=path.stem,
+                            video_id=None,
+                            state=JobState.FAILED,
+                            error="Song file has no video ID",
+                        )
+                    )
+                else:
+                    files.append(song)
+
+        logger.info("Parsed %d song(s) for download", len(files))
+        return files, failures
+
+
+async def download_song(path: Path, output_dir: Path) -> SongResult:
+    async with Downloader(input_dir=path.parent, output_dir=output_dir) as downloader:
+        return await downloader.download_song(path)
@@ -1,87 +1,743 @@
 from __future__ import annotations
 
 import asyncio
+import dataclasses
 import logging
+import shutil
 import urllib.parse
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Final
 
+from usdb_downloader.analyzer import PreviewAnalyzerException
+from usdb_downloader.catalog import Catalog
 from usdb_downloader.console import Console
+from usdb_downloader.job_queue import JobQueue, JobState, SongResult
+from usdb_downloader.layout import (
+    Layout,
+    LayoutMigrator,
+    iter_song_dirs,
+    remove_empty_parents,
+)
+from usdb_downloader.locks import SongLocks
+from usdb_downloader.metadata_cache import MetadataCache
+from usdb_downloader.models import SongSource, Summary
 from usdb_downloader.parser import Parser
+from usdb_downloader.replaygain import ReplayGainTaggerException, TagRequest
+from usdb_downloader.resolver import Resolver
+from usdb_downloader.rewriter import LibraryRewriter, RewriteState
+from usdb_downloader.verifier import MediaVerifier
 from usdb_downloader.youtube_downloader import (
     YoutubeDownloader,
     YoutubeDownloaderException,
 )
 
 if TYPE_CHECKING:
+    from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+    from contextlib import AbstractContextManager
     from pathlib import Path
 
+    from usdb_downloader.analyzer import PreviewAnalysis, PreviewAnalyzer
+    from usdb_downloader.catalog import CatalogEntry
     from usdb_downloader.console import Console
+    from usdb_downloader.job_queue import Job
+    from usdb_downloader.models import File, VideoInfo
+    from usdb_downloader.replaygain import ReplayGain, ReplayGainTagger
+    from usdb_downloader.shard import Shard
 
 logger = logging.getLogger(__name__)
 
 
 class App:
+    STATE_DIR_NAME: Final[str] = ".usdb_downloader"
+    _RESOLVE_LOOKAHEAD: Final[int] = 16
+    _DEFAULT_VIDEO_CONCURRENCY: Final[int] = 2
+    _VIDEO_BACKLOG_FACTOR: Final[int] = 4
+    # Far below the age at which other nodes break a lock.
+    _LOCK_REFRESH_INTERVAL: Final[float] = 60.0
+    _SCAN_BATCH_SIZE: Final[int] = 64
+    _SCAN_POLL_INTERVAL: Final[float] = 0.2
+
     def __init__(
         self,
         input_dir: Path,
         output_dir: Path,
         console: Console,
+        shard: Shard | None = None,
+        youtube_downloader: YoutubeDownloader | None = None,
+        allow_duplicates: bool = False,
+        layout: Layout = Layout.FLAT,
+        verifier: MediaVerifier | None = None,
+        analyzer: PreviewAnalyzer | None = None,
+        tagger: ReplayGainTagger | None = None,
+        video_concurrency: int = _DEFAULT_VIDEO_CONCURRENCY,
+        on_result: Callable[[SongResult], None] | None = None,
     ) -> None:
         self._input_dir = input_dir
         self._output_dir = output_dir
         self._console = console
-        self._parser = Parser(input_dir=input_dir, output_dir=output_dir)
-        self._youtube_downloader = YoutubeDownloader()
+        self._allow_duplicates = allow_duplicates
+        self._layout = layout
+        self._shard = shard
+        self._video_concurrency = video_concurrency
+        self._on_result = on_result
+        state_dir = output_dir / self.STATE_DIR_NAME
+        self._catalog = Catalog(state_dir / "catalog.sqlite3")
+        self._parser = Parser(
+            input_dir=input_dir,
+            output_dir=output_dir,
+            shard=shard,
+            catalog=self._catalog,
+            layout=layout,
+        )
+        self._youtube_downloader = youtube_downloader or YoutubeDownloader()
+        self._verifier = verifier or MediaVerifier()
+        if not self._verifier.available:
+            logger.warning("ffprobe is not installed, media will not be verified")
+        if analyzer is not None and not analyzer.available:
+            logger.warning("ffmpeg or numpy is missing, previews will not be detected")
+            analyzer = None
+        self._analyzer = analyzer
+        if tagger is not None and not tagger.available:
+            logger.warning("ffmpeg or numpy is missing, loudness will not be measured")
+            tagger = None
+        self._tagger = tagger
+        self._locks = SongLocks(state_dir / "locks")
+        self._job_queue = JobQueue.for_host(state_dir)
+        self._metadata_cache = MetadataCache(state_dir / "metadata")
 
     async def run(self) -> None:
         logger.info("Starting application")
 
-        files = list(self._parser.iter_files())
+        # Songs are downloaded while the input is still being scanned, so the
+        # first download starts without waiting for a large tree.
+        self._job_queue.requeue_interrupted()
+        summary = Summary()
+        scan = asyncio.create_task(self._scan(), name="scan")
+        try:
+            await self._run_jobs(self._claim_pending(scan), summary)
+        except BaseException:
+            scan.cancel()
+            raise
+        if not await scan:
+            return
+
+        self._console.print_summary(
+            processed=summary.processed,
+            failed=summary.failed,
+            skipped=summary.skipped,
+        )
+        logger.info("Finished application")
+
+    def enqueue(self) -> int:
+        files = self._parser.iter_files()
+        if not self._allow_duplicates:
+            files = self._skip_duplicates(files, {})
+
+        pending = self._job_queue.enqueue(files)
+        self._console.print_song_count(pending)
+        return pending
+
+    def scanning(self) -> AbstractContextManager[None]:
+        # Workers of other processes keep waiting for songs while it is open.
+        return self._job_queue.scanning()
+
+    async def work(self) -> Summary:
+        summary = Summary()
+        await self._run_jobs(self._claim_pending(), summary)
+        return summary
+
+    async def process(
+        self,
+        files: Iterable[File],
+        source: SongSource = SongSource.API,
+    ) -> Summary:
+        if not self._allow_duplicates:
+            files = self._skip_duplicates(files, {})
+        files = list(files)
+        self._job_queue.enqueue(files, source)
+
+        summary = Summary()
+        await self._run_jobs(self._claim_each(files, summary), summary)
+        return summary
+
+    def close(self) -> None:
+        self._verifier.close()
+        if self._analyzer is not None:
+            self._analyzer.close()
+        if self._tagger is not None:
+            self._tagger.close()
+        self._job_queue.close()
+        self._catalog.close()
+
+    async def _run_jobs(self, jobs: AsyncIterator[Job], summary: Summary) -> None:
+        # Metadata of upcoming songs is resolved concurrently while the current
+        # song downloads, so unavailable videos are rejected without delay.
+        resolver = Resolver(self._youtube_downloader, self._metadata_cache)
+        # Audio is downloaded one song after another, while videos follow in a
+        # background lane. A song is singable as soon as its audio has landed.
+        video_lane = asyncio.Semaphore(self._video_concurrency)
+        video_backlog = asyncio.Semaphore(
+            self._video_concurrency * self._VIDEO_BACKLOG_FACTOR
+        )
+        lock_refresher = asyncio.create_task(self._refresh_locks())
+
+        try:
+            async with asyncio.TaskGroup() as videos:
+                async for job in jobs:
+                    resolver.prefetch(
+                        self._job_queue.pending_video_ids(self._RESOLVE_LOOKAHEAD)
+                    )
+                    status = self._job_queue.status()
+                    self._console.print_song_start(
+                        idx=sum(
+                            count
+                            for state, count in status.items()
+                            if state != JobState.PENDING
+                        ),
+                        total=sum(status.values()),
+                        name=job.file.name,
+                        video_id=job.file.video_id,
+                    )
+
+                    # Waits while too many videos are queued, so a single worker
+                    # does not claim all songs of a shared queue.
+                    await video_backlog.acquire()
+                    info = await self._process_audio(job, resolver, summary)
+                    if info is None:
+                        video_backlog.release()
+                        continue
+                    videos.create_task(
+                        self._process_video(job, info, summary, video_lane),
+                        name=f"video-{job.file.video_id}",
+                    ).add_done_callback(lambda _: video_backlog.release())
+        finally:
+            lock_refresher.cancel()
+            await resolver.aclose()
+
+    async def _scan(self) -> int:
+        pending = self._job_queue.status().get(JobState.PENDING, 0)
+        files = self._parser.iter_files()
+        seen: dict[str, str] = {}
+        batch: list[File] = []
+        # The scanner blocks while it walks the tree, so files are taken off
+        # the loop. Duplicates are checked on the loop, which owns the catalog
+        # connection.
+        while (file := await asyncio.to_thread(next, files, None)) is not None:
+            if self._allow_duplicates:
+                batch.append(file)
+            else:
+                batch.extend(self._skip_duplicates([file], seen))
+            # Songs are enqueued in batches, unless workers are waiting for them.
+            if len(batch) >= self._SCAN_BATCH_SIZE or (
+                batch and not self._job_queue.pending_video_ids(1)
+            ):
+                pending += self._job_queue.add(batch)
+                batch = []
+        pending += self._job_queue.add(batch)
+
+        self._console.print_song_count(pending)
+        return pending
+
+    async def _claim_pending(
+        self, scan: asyncio.Task[int] | None = None
+    ) -> AsyncIterator[Job]:
+        while True:
+            # Checked before claiming, so songs enqueued by a scan that just
+            # finished are not missed.
+            scanning = (
+                scan is not None and not scan.done()
+            ) or self._job_queue.is_scanning()
+            if (job := self._job_queue.claim()) is not None:
+                yield job
+            elif scanning:
+                await asyncio.sleep(self._SCAN_POLL_INTERVAL)
+            else:
+                if scan is not None:
+                    # Raises the error of a failed scan.
+                    scan.result()
+                return
 
-        self._console.print_song_count(len(files))
-        if not files:
+    async def _refresh_locks(self) -> None:
+        while True:
+            await asyncio.sleep(self._LOCK_REFRESH_INTERVAL)
+            self._locks.refresh()
+
+    def status(self) -> None:
+        counts = self._job_queue.status()
+        self._console.print_queue_status(
+            counts={state: counts.get(state, 0) for state in JobState},
+            failures=self._job_queue.failures(),
+        )
+
+    def search(self, query: str) -> None:
+        self._console.print_search_results(query, self._catalog.search(query))
+
+    async def verify(self) -> None:
+        if not self._verifier.available:
+            self._console.print_failure("ffprobe is required to verify media")
             return
 
-        processed = 0
-        failed = 0
+        logger.info("Verifying media of the song library")
+        summary = Summary()
+        # Enough songs are in flight to keep every process of the pool busy.
+        semaphore = asyncio.Semaphore(self._verifier.workers * 2)
+
+        async def verify_song(entry: CatalogEntry) -> None:
+            async with semaphore:
+                try:
+                    file = self._parser.read_written_file(entry.path, entry.video_id)
+                except FileNotFoundError:
+                    logger.warning("Song %s is missing in %s", entry.name, entry.path)
+                    summary.skipped += 1
+                    return
+
+                verification = await self._verifier.verify(file, entry.path)
+
+            self._catalog.record_verification(verification)
+            if verification.ok:
+                summary.processed += 1
+                return
 
-        for idx, file in enumerate(files, 1):
-            self._console.print_song_start(idx=idx, total=len(files), name=file.name)
+            self._verifier.quarantine(verification)
+            self._job_queue.requeue(
+                file,
+                error="; ".join(verification.problems),
+                source=entry.source,
+            )
+            self._console.print_song_suspicious(file.name, verification.problems)
+            summary.failed += 1
 
+        async with asyncio.TaskGroup() as tg:
+            for entry in self._catalog.entries():
+                tg.create_task(verify_song(entry))
+
+        self._console.print_summary(
+            processed=summary.processed,
+            failed=summary.failed,
+            skipped=summary.skipped,
+        )
+
+    def replaygain(self) -> None:
+        if self._tagger is None:
+            self._console.print_failure("ffmpeg and numpy are required for ReplayGain")
+            return
+
+        logger.info("Measuring loudness of the song library")
+        summary = Summary()
+        replay_gains = self._tagger.sweep(
+            self._unmeasured_songs(summary, normalize=self._tagger.normalize),
+            lock_dir=self._output_dir / self.STATE_DIR_NAME / "locks",
+        )
+        # Every chunk is committed right away, so an interrupted sweep resumes
+        # with the songs that were not measured yet.
+        for chunk in replay_gains:
+            with self._catalog.transaction():
+                for replay_gain in chunk:
+                    if replay_gain.ok:
+                        self._catalog.record_loudness(replay_gain)
+                        summary.processed += 1
+                    elif replay_gain.locked:
+                        self._console.print_song_skipped(
+                            f"{replay_gain.name} is being downloaded"
+                        )
+                        summary.skipped += 1
+                    else:
+                        self._console.print_song_error(
+                            f"Cannot measure {replay_gain.name}: {replay_gain.error}"
+                        )
+                        summary.failed += 1
+
+        self._console.print_summary(
+            processed=summary.processed,
+            failed=summary.failed,
+            skipped=summary.skipped,
+        )
+
+    def migrate(self) -> None:
+        logger.info("Migrating output directory to %s layout", self._layout)
+        migrator = LayoutMigrator(self._output_dir, self._layout, self._catalog)
+        summary = Summary()
+
+        for move in migrator.plan():
+            if move.source == move.target:
+                summary.skipped += 1
+                continue
+            # Songs that are being downloaded right now are left in place.
+            if not self._locks.acquire(move.name):
+                self._console.print_song_skipped(f"{move.name} is being downloaded")
+                summary.skipped += 1
+                continue
             try:
-                video_id = file.video_id
-                output_path = self._output_dir / file.name / file.name
-
-                with self._console.print_song_step_spinner(
-                    f"Downloading audio and video (ID: {video_id})"
-                ):
-                    await asyncio.gather(
-                        self._youtube_downloader.download_audio(
-                            video_id=video_id,
-                            output_path=output_path,
-                        ),
-                        self._youtube_downloader.download_video(
-                            video_id=video_id,
-                            output_path=output_path,
-                        ),
+                if migrator.apply(move):
+                    self._console.print_song_moved(move.name, move.target)
+                    summary.processed += 1
+                else:
+                    self._console.print_song_error(
+                        f"Cannot move {move.name}, {move.target} already exists"
                     )
+                    summary.failed += 1
+            finally:
+                self._locks.release(move.name)
+
+        self._console.print_summary(
+            processed=summary.processed,
+            failed=summary.failed,
+            skipped=summary.skipped,
+        )
+
+    def rewrite(self, workers: int) -> None:
+        logger.info("Rewriting song files of the library")
+        summary = Summary()
+        self._rewrite_library(workers, summary)
+        self._console.print_summary(
+            processed=summary.processed,
+            failed=summary.failed,
+            skipped=summary.skipped,
+        )
+
+    def reconcile(self, workers: int, dry_run: bool = False) -> None:
+        logger.info("Reconciling the library with the input directory")
+        summary = Summary()
+        names = self._rewrite_library(workers, summary)
+        # An empty or unmounted input directory would orphan the whole library.
+        if not names:
+            self._console.print_failure(
+                f"No songs found in {self._input_dir}, kept the library as is"
+            )
+            return
 
-                self._console.print_song_step(
-                    f"Downloading audio and video (ID: {video_id})"
+        for song_dir in iter_song_dirs(self._output_dir):
+            name = song_dir.name
+            if name in names:
+                continue
+            entry = self._catalog.get(name)
+            if entry is not None and entry.source != SongSource.INPUT:
+                continue
+            if not self._locks.acquire(name):
+                self._console.print_song_skipped(f"{name} is being downloaded")
+                summary.skipped += 1
+                continue
+            try:
+                if not dry_run:
+                    shutil.rmtree(song_dir)
+                    remove_empty_parents(self._output_dir, song_dir.parent)
+                    self._catalog.remove(name)
+                    self._job_queue.remove(name)
+                logger.info("Removed orphaned song %s in %s", name, song_dir)
+                self._console.print_song_removed(name, song_dir, dry_run)
+                summary.processed += 1
+            finally:
+                self._locks.release(name)
+
+        self._console.print_summary(
+            processed=summary.processed,
+            failed=summary.failed,
+            skipped=summary.skipped,
+        )
+
+    def _rewrite_library(self, workers: int, summary: Summary) -> set[str]:
+        rewriter = LibraryRewriter(
+            input_dir=self._input_dir,
+            output_dir=self._output_dir,
+            lock_dir=self._output_dir / self.STATE_DIR_NAME / "locks",
+            layout=self._layout,
+            shard=self._shard,
+            workers=workers,
+        )
+        names: set[str] = set()
+
+        for rewrites in rewriter.run():
+            with self._catalog.transaction():
+                for rewrite in rewrites:
+                    names.add(rewrite.name)
+                    if rewrite.file is not None and rewrite.song_dir is not None:
+                        self._catalog.record(rewrite.file, rewrite.song_dir)
+                        if rewrite.state == RewriteState.REWRITTEN:
+                            summary.processed += 1
+                        else:
+                            summary.skipped += 1
+                    elif rewrite.state == RewriteState.INVALID:
+                        self._console.print_song_error(
+                            f"{rewrite.name} has no video ID"
+                        )
+                        summary.failed += 1
+                    elif rewrite.state == RewriteState.LOCKED:
+                        self._console.print_song_skipped(
+                            f"{rewrite.name} is being downloaded"
+                        )
+                        summary.skipped += 1
+                    else:
+                        summary.skipped += 1
+
+        return names
+
+    def _unmeasured_songs(
+        self, summary: Summary, normalize: bool
+    ) -> Iterator[TagRequest]:
+        for entry in self._catalog.entries():
+            audio = entry.path / f"{entry.name}.mp3"
+            try:
+                stat = audio.stat()
+            except FileNotFoundError:
+                logger.warning("Audio of song %s is missing in %s", entry.name, audio)
+                summary.skipped += 1
+                continue
+            if self._catalog.loudness_stamp(entry.name) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+                normalize,
+            ):
+                summary.skipped += 1
+                continue
+            yield TagRequest(name=entry.name, audio=audio)
+
+    def _skip_duplicates(
+        self, files: Iterable[File], seen: dict[str, str]
+    ) -> Iterator[File]:
+        # Songs already in the library, or seen earlier in this scan, under a
+        # different name are dropped before any download is scheduled.
+        for file in files:
+            song_key = Catalog.song_key(
+                file.headers.get("ARTIST", ""),
+                file.headers.get("TITLE", ""),
+            )
+            keys = [f"video:{file.video_id}"]
+            if song_key:
+                keys.append(f"song:{song_key}")
+
+            existing = next((seen[key] for key in keys if key in seen), None)
+            if existing is None and (entry := self._catalog.find_duplicate(file)):
+                existing = entry.name
+            if existing is not None and existing != file.name:
+                logger.info("Skipped song %s, duplicate of %s", file.name, existing)
+                self._console.print_duplicate(name=file.name, existing=existing)
+                self._report(file, JobState.SKIPPED, f"Duplicate of {existing}")
+                continue
+
+            seen.update(dict.fromkeys(keys, file.name))
+            yield file
+
+    async def _claim_each(
+        self, files: Iterable[File], summary: Summary
+    ) -> AsyncIterator[Job]:
+        for file in files:
+            job = self._job_queue.claim(file.name)
+            if job is None:
+                # The song is done already or processed by another worker.
+                summary.skipped += 1
+                self._report(file, JobState.SKIPPED, "Already processed")
+                continue
+            yield job
+
+    def _finish(
+        self,
+        job: Job,
+        state: JobState,
+        summary: Summary,
+        error: str | None = None,
+    ) -> None:
+        self._job_queue.set_state(job.id, state, error=error)
+        match state:
+            case JobState.DONE:
+                summary.processed += 1
+            case JobState.FAILED:
+                summary.failed += 1
+            case _:
+                summary.skipped += 1
+        self._report(job.file, state, error)
+
+    def _report(self, file: File, state: JobState, error: str | None) -> None:
+        if self._on_result is None:
+            return
+        self._on_result(
+            SongResult(
+                name=file.name,
+                video_id=file.video_id,
+                state=state,
+                song_dir=self._parser.song_dir(file),
+                error=error,
+            )
+        )
+
+    async def _process_audio(
+        self,
+        job: Job,
+        resolver: Resolver,
+        summary: Summary,
+    ) -> VideoInfo | None:
+        file = job.file
+
+        if not self._locks.acquire(file.name):
+            message = "Claimed by another node"
+            self._console.print_song_skipped(message)
+            self._finish(job, JobState.SKIPPED, summary, error=message)
+            return None
+
+        loop = asyncio.get_running_loop()
+
+        def on_postprocess() -> None:
+            loop.call_soon_threadsafe(
+                self._job_queue.set_state,
+                job.id,
+                JobState.TRANSCODING,
+            )
+
+        # The lock is handed over to the video lane once the audio has landed.
+        handed_over = False
+        try:
+            video_id = file.video_id
+
+            info = await resolver.resolve(video_id)
+            if not info.available:
+                self._console.print_song_error(f"Video is unavailable (ID: {video_id})")
+                self._finish(job, JobState.FAILED, summary, error=info.error)
+                return None
+
+            with self._console.print_song_step_spinner(
+                f"Downloading audio (ID: {video_id})"
+            ):
+                await self._youtube_downloader.download_audio(
+                    video_id=video_id,
+                    output_path=self._parser.song_dir(file) / file.name,
+                    format_id=info.audio_format,
+                    on_postprocess=on_postprocess,
                 )
-                self._parser.write_file(file)
-                self._console.print_song_step("Parsed song file")
-                self._search_cover(file.name)
 
-                self._console.print_song_success()
-                processed += 1
-            except YoutubeDownloaderException:
-                self._console.print_song_error("Failed to download audio and video")
-                failed += 1
+            self._console.print_song_step(f"Downloading audio (ID: {video_id})")
+            # The song file already points at the video, which UltraStar shows
+            # once it has been downloaded.
+            self._job_queue.set_state(job.id, JobState.WRITING)
+            self._parser.write_file(file)
+            self._console.print_song_step("Parsed song file")
+            self._search_cover(file.name)
 
-        self._console.print_summary(processed=processed, failed=failed)
-        logger.info("Finished application")
+            self._job_queue.set_state(job.id, JobState.DOWNLOADING_VIDEO)
+            self._console.print_song_success("Singable, video follows")
+            handed_over = True
+            return info
+        except YoutubeDownloaderException as e:
+            self._console.print_song_error("Failed to download audio")
+            self._finish(job, JobState.FAILED, summary, error=str(e))
+            return None
+        finally:
+            if not handed_over:
+                self._locks.release(file.name)
+
+    async def _process_video(
+        self,
+        job: Job,
+        info: VideoInfo,
+        summary: Summary,
+        video_lane: asyncio.Semaphore,
+    ) -> None:
+        file = job.file
+        song_dir = self._parser.song_dir(file)
+        # The audio is measured and analysed while the video downloads.
+        replay_gain = (
+            asyncio.create_task(
+                self._tagger.tag(
+                    file.name,
+                    song_dir / file.headers.get("MP3", f"{file.name}.mp3"),
+                )
+            )
+            if self._tagger is not None
+            else None
+        )
+        analysis = (
+            asyncio.create_task(self._analyzer.analyze(file, song_dir))
+            if self._analyzer is not None
+            else None
+        )
+
+        try:
+            async with video_lane:
+                await self._youtube_downloader.download_video(
+                    video_id=file.video_id,
+                    output_path=song_dir / file.name,
+                    format_id=info.video_format,
+                )
+
+            if replay_gain is not None:
+                # Tags are written before verification, which records the
+                # checksum of the tagged audio.
+                self._job_queue.set_state(job.id, JobState.ANALYZING)
+                await self._record_replay_gain(file, replay_gain)
+
+            if self._verifier.available:
+                self._job_queue.set_state(job.id, JobState.VERIFYING)
+                verification = await self._verifier.verify(file, song_dir)
+                if not verification.ok:
+                    self._verifier.quarantine(verification)
+                    self._console.print_video_error(
+                        file.name,
+                        f"Verification failed: {verification.problems[0]}",
+                    )
+                    self._finish(
+                        job,
+                        JobState.FAILED,
+                        summary,
+                        error="; ".join(verification.problems),
+                    )
+                    return
+                self._catalog.record_verification(verification)
+
+            if analysis is not None:
+                self._job_queue.set_state(job.id, JobState.ANALYZING)
+                file = await self._write_analysis(file, analysis)
+
+            # Records the size of the video, which was missing when the song
+            # file was written.
+            self._catalog.record(file, song_dir, source=job.source)
+            self._console.print_video_success(file.name)
+            self._finish(job, JobState.DONE, summary)
+        except Exception as e:
+            # Any error is kept to this song, so the other songs of the task
+            # group carry on. Its song file and audio are in place already.
+            if isinstance(e, YoutubeDownloaderException):
+                self._console.print_video_error(file.name, "Failed to download video")
+            else:
+                logger.exception("Failed to finish video of song %s", file.name)
+                self._console.print_video_error(file.name, "Failed to finish video")
+            self._finish(job, JobState.FAILED, summary, error=f"Video: {e}")
+        finally:
+            for task in (replay_gain, analysis):
+                if task is not None:
+                    task.cancel()
+            self._locks.release(file.name)
+
+    async def _record_replay_gain(
+        self,
+        file: File,
+        replay_gain: asyncio.Task[ReplayGain],
+    ) -> None:
+        # Songs without ReplayGain tags still play, just not at an even level.
+        try:
+            result = await replay_gain
+        except ReplayGainTaggerException as e:
+            logger.warning("Failed to measure loudness of song %s: %s", file.name, e)
+            return
+        if result.ok:
+            self._catalog.record_loudness(result)
+
+    async def _write_analysis(
+        self,
+        file: File,
+        analysis: asyncio.Task[PreviewAnalysis],
+    ) -> File:
+        # A failed analysis leaves the song singable, just without a preview.
+        try:
+            result = await analysis
+        except PreviewAnalyzerException as e:
+            logger.warning("Failed to analyze song %s: %s", file.name, e)
+            return file
+        if result.error is not None:
+            logger.warning("Failed to analyze song %s: %s", file.name, result.error)
+        if not result.headers:
+            return file
+
+        file = dataclasses.replace(file, headers={**file.headers, **result.headers})
+        self._parser.write_file(file)
+        return file
 
     def _search_cover(self, name: str) -> None:
         encoded_query = urllib.parse.quote(f"{name} Spotify Cover")
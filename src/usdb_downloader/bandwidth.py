@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import datetime
+import logging
+import re
+import threading
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+_RATE_PATTERN: Final[re.Pattern[str]] = re.compile(
+    r"(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?", re.IGNORECASE
+)
+_RATE_UNITS: Final[dict[str, int]] = {
+    "": 1,
+    "K": 1024,
+    "M": 1024**2,
+    "G": 1024**3,
+}
+
+
+class Priority(IntEnum):
+    AUDIO = 0
+    VIDEO = 1
+
+
+def parse_rate(value: str) -> float:
+    # Rates use the same notation as the --limit-rate option of yt-dlp.
+    match = _RATE_PATTERN.fullmatch(value.strip())
+    if match is None or float(match[1]) <= 0:
+        raise ValueError(
+            f"Rate must be a positive number of bytes like 2M, got {value!r}"
+        )
+    return float(match[1]) * _RATE_UNITS[match[2].upper()]
+
+
+@dataclass(frozen=True)
+class BandwidthWindow:
+    start: datetime.time
+    end: datetime.time
+    rate: float
+
+    @classmethod
+    def parse(cls, value: str) -> BandwidthWindow:
+        period, _, rate = value.partition("=")
+        start, _, end = period.partition("-")
+        try:
+            return cls(
+                start=datetime.time.fromisoformat(start.strip()),
+                end=datetime.time.fromisoformat(end.strip()),
+                rate=parse_rate(rate),
+            )
+        except ValueError as e:
+            raise ValueError(
+                f"Schedule must look like 09:00-18:00=2M, got {value!r}: {e}"
+            ) from e
+
+    def contains(self, moment: datetime.time) -> bool:
+        # Windows like 22:00-06:00 wrap around midnight.
+        if self.start <= self.end:
+            return self.start <= moment < self.end
+        return moment >= self.start or moment < self.end
+
+
+class BandwidthLimiter:
+    # The bucket holds one second of traffic, so short bursts stay smooth.
+    _BURST_SECONDS: Final[float] = 1.0
+    _MAX_WAIT: Final[float] = 1.0
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        schedule: Sequence[BandwidthWindow] = (),
+        clock: Callable[[], float] = time.monotonic,
+        now: Callable[[], datetime.datetime] = datetime.datetime.now,
+    ) -> None:
+        self._rate = rate
+        self._schedule = schedule
+        self._clock = clock
+        self._now = now
+        # Transfers run in the worker threads of yt-dlp, not on the event loop.
+        self._condition = threading.Condition()
+        self._tokens = 0.0
+        self._updated = clock()
+        self._waiting = dict.fromkeys(Priority, 0)
+        logger.info(
+            "Initialized bandwidth limiter with rate %s and %d schedule window(s)",
+            rate,
+            len(schedule),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate is not None or bool(self._schedule)
+
+    def rate(self) -> float | None:
+        moment = self._now().time()
+        for window in self._schedule:
+            if window.contains(moment):
+                return window.rate
+        return self._rate
+
+    def consume(self, amount: int, priority: Priority = Priority.VIDEO) -> None:
+        if amount <= 0:
+            return
+
+        with self._condition:
+            self._waiting[priority] += 1
+            try:
+                while (rate := self.rate()) is not None:
+                    self._refill(rate)
+                    needed = min(amount, rate * self._BURST_SECONDS)
+                    # Transfers of a higher priority get their share first.
+                    if self._tokens >= needed and not any(
+                        count
+                        for other, count in self._waiting.items()
+                        if other < priority
+                    ):
+                        self._tokens -= amount
+                        return
+                    wait = max(needed - self._tokens, 0) / rate
+                    self._condition.wait(min(max(wait, 0.01), self._MAX_WAIT))
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def _refill(self, rate: float) -> None:
+        now = self._clock()
+        self._tokens = min(
+            self._tokens + (now - self._updated) * rate,
+            rate * self._BURST_SECONDS,
+        )
+        self._updated = now
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+class BatchPoolException(Exception):
+    """Custom exception for BatchPool errors."""
+
+
+class BatchPool[T, R]:
+    # Items submitted within this delay are sent to the pool as one batch.
+    _DEFAULT_DELAY: Final[float] = 1.0
+
+    def __init__(
+        self,
+        function: Callable[[Sequence[T]], list[R]],
+        workers: int,
+        batch_size: int,
+        delay: float = _DEFAULT_DELAY,
+    ) -> None:
+        self._function = function
+        self._workers = workers
+        self._batch_size = batch_size
+        self._delay = delay
+        self._pool: ProcessPoolExecutor | None = None
+        self._pending: list[tuple[T, asyncio.Future[R]]] = []
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self._workers)
+        return self._pool
+
+    async def submit(self, item: T) -> R:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future[R] = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self._batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._delay, self._flush)
+        return await future
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # A batch per task keeps the pool busy without a round trip per item.
+        logger.debug("Submitting a batch of %d item(s)", len(batch))
+        results = asyncio.get_running_loop().run_in_executor(
+            self.pool,
+            self._function,
+            [item for item, _ in batch],
+        )
+        results.add_done_callback(
+            functools.partial(self._deliver, [future for _, future in batch])
+        )
+
+    @staticmethod
+    def _deliver(
+        futures: Sequence[asyncio.Future[R]],
+        results: asyncio.Future[list[R]],
+    ) -> None:
+        if results.cancelled():
+            error: BaseException | None = BatchPoolException("Batch was cancelled")
+        else:
+            error = results.exception()
+
+        for idx, future in enumerate(futures):
+            # Items whose caller was cancelled no longer wait for a result.
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(BatchPoolException(str(error)))
+            else:
+                future.set_result(results.result()[idx])
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.models import SongSource
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+
+    from usdb_downloader.models import File
+    from usdb_downloader.replaygain import ReplayGain
+    from usdb_downloader.verifier import Verification
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    name: str
+    artist: str
+    title: str
+    video_id: str
+    path: Path
+    txt_size: int | None
+    audio_size: int | None
+    video_size: int | None
+    source: SongSource = SongSource.INPUT
+
+
+class Catalog:
+    _SCHEMA: Final[str] = """
+        CREATE TABLE IF NOT EXISTS songs (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            artist TEXT NOT NULL,
+            title TEXT NOT NULL,
+            song_key TEXT NOT NULL,
+            video_id TEXT NOT NULL,
+            path TEXT NOT NULL,
+            txt_size INTEGER,
+            audio_size INTEGER,
+            video_size INTEGER,
+            headers TEXT NOT NULL,
+            source TEXT NOT NULL DEFAULT 'input',
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS songs_video_id ON songs (video_id);
+        CREATE INDEX IF NOT EXISTS songs_song_key ON songs (song_key);
+        CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5 (
+            name, artist, title, content='songs', content_rowid='id'
+        );
+        CREATE TRIGGER IF NOT EXISTS songs_ai AFTER INSERT ON songs BEGIN
+            INSERT INTO songs_fts (rowid, name, artist, title)
+            VALUES (new.id, new.name, new.artist, new.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS songs_ad AFTER DELETE ON songs BEGIN
+            INSERT INTO songs_fts (songs_fts, rowid, name, artist, title)
+            VALUES ('delete', old.id, old.name, old.artist, old.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS songs_au AFTER UPDATE ON songs BEGIN
+            INSERT INTO songs_fts (songs_fts, rowid, name, artist, title)
+            VALUES ('delete', old.id, old.name, old.artist, old.title);
+            INSERT INTO songs_fts (rowid, name, artist, title)
+            VALUES (new.id, new.name, new.artist, new.title);
+        END;
+        CREATE TABLE IF NOT EXISTS verifications (
+            name TEXT PRIMARY KEY,
+            ok INTEGER NOT NULL,
+            problems TEXT NOT NULL,
+            media TEXT NOT NULL,
+            verified_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS loudness (
+            name TEXT PRIMARY KEY,
+            loudness REAL NOT NULL,
+            peak REAL NOT NULL,
+            gain REAL NOT NULL,
+            applied REAL NOT NULL,
+            audio_size INTEGER NOT NULL,
+            audio_mtime INTEGER NOT NULL,
+            normalized INTEGER NOT NULL DEFAULT 0,
+            measured_at REAL NOT NULL
+        );
+    """
+    _COLUMNS: Final[str] = (
+        "name, artist, title, video_id, path, txt_size, audio_size, video_size, source"
+    )
+    _BUSY_TIMEOUT: Final[float] = 30.0
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # The output directory may live on a network filesystem, on which WAL
+        # does not work, so the catalog keeps SQLite's default rollback journal.
+        # Concurrent writers are only safe where the filesystem's locks are.
+        self._conn = sqlite3.connect(
+            path,
+            timeout=self._BUSY_TIMEOUT,
+            isolation_level=None,
+        )
+        self._conn.executescript(self._SCHEMA)
+        logger.info("Opened catalog %s", path)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @contextlib.contextmanager
+    def transaction(self) -> Generator[None]:
+        # Batches of writes share a single commit, and thus a single fsync.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def record(
+        self,
+        file: File,
+        song_dir: Path,
+        source: SongSource = SongSource.INPUT,
+    ) -> None:
+        artist = file.headers.get("ARTIST", "")
+        title = file.headers.get("TITLE", "")
+        self._conn.execute(
+            """
+            INSERT INTO songs (
+                name, artist, title, song_key, video_id, path,
+                txt_size, audio_size, video_size, headers, source, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                artist = excluded.artist,
+                title = excluded.title,
+                song_key = excluded.song_key,
+                video_id = excluded.video_id,
+                path = excluded.path,
+                txt_size = excluded.txt_size,
+                audio_size = excluded.audio_size,
+                video_size = excluded.video_size,
+                headers = excluded.headers,
+                source = excluded.source,
+                updated_at = excluded.updated_at
+            """,
+            (
+                file.name,
+                artist,
+                title,
+                self.song_key(artist, title),
+                file.video_id,
+                str(song_dir),
+                self._size(song_dir / f"{file.name}.txt"),
+                self._size(song_dir / file.headers.get("MP3", f"{file.name}.mp3")),
+                self._size(song_dir / file.headers.get("VIDEO", f"{file.name}.webm")),
+                json.dumps(file.headers),
+                source,
+                time.time(),
+            ),
+        )
+        logger.info("Recorded song %s in catalog", file.name)
+
+    def move(self, name: str, song_dir: Path) -> None:
+        self._conn.execute(
+            "UPDATE songs SET path = ?, updated_at = ? WHERE name = ?",
+            (str(song_dir), time.time(), name),
+        )
+
+    def remove(self, name: str) -> None:
+        self._conn.execute("DELETE FROM songs WHERE name = ?", (name,))
+
+    def get(self, name: str) -> CatalogEntry | None:
+        row = self._conn.execute(
+            f"SELECT {self._COLUMNS} FROM songs WHERE name = ?", (name,)
+        ).fetchone()
+        return self._entry(row) if row else None
+
+    def find_duplicate(self, file: File) -> CatalogEntry | None:
+        song_key = self.song_key(
+            file.headers.get("ARTIST", ""),
+            file.headers.get("TITLE", ""),
+        )
+        row = self._conn.execute(
+            f"""
+            SELECT {self._COLUMNS} FROM songs
+            WHERE name != ? AND (video_id = ? OR (song_key != '' AND song_key = ?))
+            LIMIT 1
+            """,
+            (file.name, file.video_id, song_key),
+        ).fetchone()
+        return self._entry(row) if row else None
+
+    def entries(self) -> Generator[CatalogEntry]:
+        rows = self._conn.execute(f"SELECT {self._COLUMNS} FROM songs ORDER BY name")
+        for row in rows.fetchall():
+            yield self._entry(row)
+
+    def record_verification(self, verification: Verification) -> None:
+        media = [
+            {
+                "file": probe.path.name,
+                "kind": probe.kind,
+                "size": probe.size,
+                "sha256": probe.sha256,
+                "duration": probe.duration,
+            }
+            for probe in verification.media
+        ]
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO verifications (
+                name, ok, problems, media, verified_at
+            )
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                verification.name,
+                verification.ok,
+                json.dumps(verification.problems),
+                json.dumps(media),
+                time.time(),
+            ),
+        )
+
+    def record_loudness(self, replay_gain: ReplayGain) -> None:
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO loudness (
+                name, loudness, peak, gain, applied, audio_size, audio_mtime,
+                normalized, measured_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                replay_gain.name,
+                replay_gain.loudness,
+                replay_gain.peak,
+                replay_gain.gain,
+                replay_gain.applied,
+                replay_gain.audio_size,
+                replay_gain.audio_mtime,
+                replay_gain.normalized,
+                time.time(),
+            ),
+        )
+        # Tagging rewrites the audio file.
+        self._conn.execute(
+            "UPDATE songs SET audio_size = ? WHERE name = ?",
+            (replay_gain.audio_size, replay_gain.name),
+        )
+
+    def loudness_stamp(self, name: str) -> tuple[int, int, bool] | None:
+        # Size and mtime of the audio when it was measured, and whether it was
+        # normalised, so a sweep only measures songs that changed since.
+        row = self._conn.execute(
+            "SELECT audio_size, audio_mtime, normalized FROM loudness WHERE name = ?",
+            (name,),
+        ).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else None
+
+    def checksums(self, name: str) -> dict[str, str]:
+        row = self._conn.execute(
+            "SELECT media FROM verifications WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return {}
+        return {media["file"]: media["sha256"] for media in json.loads(row[0])}
+
+    def search(self, query: str, limit: int = 50) -> list[CatalogEntry]:
+        # Every word is matched as a quoted prefix, so user input cannot break
+        # the FTS query syntax.
+        terms = " ".join(
+            '"{}"*'.format(word.replace('"', '""')) for word in query.split()
+        )
+        if not terms:
+            return []
+
+        rows = self._conn.execute(
+            f"""
+            SELECT {", ".join(f"songs.{c}" for c in self._COLUMNS.split(", "))}
+            FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid
+            WHERE songs_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+            """,
+            (terms, limit),
+        )
+        return [self._entry(row) for row in rows]
+
+    @staticmethod
+    def song_key(artist: str, title: str) -> str:
+        # Songs are matched case- and whitespace-insensitively by artist and title.
+        if not artist.strip() or not title.strip():
+            return ""
+        artist = " ".join(artist.casefold().split())
+        title = " ".join(title.casefold().split())
+        return f"{artist} - {title}"
+
+    @staticmethod
+    def _size(path: Path) -> int | None:
+        try:
+            return path.stat().st_size
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _entry(
+        row: tuple[str, str, str, str, str, int, int, int, str],
+    ) -> CatalogEntry:
+        (
+            name,
+            artist,
+            title,
+            video_id,
+            path,
+            txt_size,
+            audio_size,
+            video_size,
+            source,
+        ) = row
+        return CatalogEntry(
+            name=name,
+            artist=artist,
+            title=title,
+            video_id=video_id,
+            path=Path(path),
+            txt_size=txt_size,
+            audio_size=audio_size,
+            video_size=video_size,
+            source=SongSource(source),
+        )
@@ -1,29 +1,67 @@
 from __future__ import annotations
 
+import json
+import sys
+import time
 from contextlib import contextmanager
-from typing import TYPE_CHECKING, Any
+from enum import StrEnum
+from typing import TYPE_CHECKING, Any, TextIO
 
 from rich.console import Console as RichConsole
 from rich.live import Live
 from rich.spinner import Spinner
 
 if TYPE_CHECKING:
-    from collections.abc import Generator
+    from collections.abc import Generator, Mapping, Sequence
+
+    from usdb_downloader.catalog import CatalogEntry
+    from usdb_downloader.job_queue import JobFailure
+    from usdb_downloader.load_harness import LoadReport
+
+
+class OutputMode(StrEnum):
+    AUTO = "auto"
+    RICH = "rich"
+    JSON = "json"
+
+
+def create_console(
+    enabled: bool,
+    live: bool = True,
+    mode: OutputMode = OutputMode.AUTO,
+    stream: TextIO | None = None,
+) -> Console:
+    if not enabled:
+        return NullConsole()
+    stream = stream or sys.stdout
+    # Docker and cron runs have no terminal, Rich rendering would be wasted.
+    if mode == OutputMode.JSON or (mode == OutputMode.AUTO and not stream.isatty()):
+        return JsonConsole(stream)
+    return Console(enabled=True, live=live)
 
 
 class Console:
-    def __init__(self, enabled: bool) -> None:
-        self._console = RichConsole()
+    def __init__(self, enabled: bool, live: bool = True) -> None:
+        self._console = RichConsole() if enabled else None
         self._enabled = enabled
+        self._live = live
 
     def _print(self, *args: Any, **kwargs: Any) -> None:
-        if self._enabled:
+        if self._console is not None:
             self._console.print(*args, **kwargs)
 
-    def print_header(self, input_dir: Any, output_dir: Any, app_version: str) -> None:
+    def print_header(
+        self,
+        input_dir: Any,
+        output_dir: Any,
+        app_version: str,
+        shard: Any = None,
+    ) -> None:
         self._print("\n[bold cyan]🎵 USDB Downloader[/bold cyan]")
         self._print(f"[dim]Version: {app_version}[/dim]")
         self._print(f"[dim]Input directory: {input_dir}[/dim]")
+        if shard is not None:
+            self._print(f"[dim]Shard: {shard}[/dim]")
         self._print(f"[dim]Output directory: {output_dir}[/dim]\n")
 
     def print_song_count(self, count: int) -> None:
@@ -32,7 +70,19 @@ class Console:
         else:
             self._print("[yellow]⚠ No valid song files found to process[/yellow]")
 
-    def print_song_start(self, idx: int, total: int, name: str) -> None:
+    def print_duplicate(self, name: str, existing: str) -> None:
+        self._print(
+            f"[yellow]↷ Skipped duplicate[/yellow] [cyan]{name}[/cyan] "
+            f"[dim](already in library as {existing})[/dim]"
+        )
+
+    def print_song_start(
+        self,
+        idx: int,
+        total: int,
+        name: str,
+        video_id: str | None = None,
+    ) -> None:
         self._print(f"[bold]Processing {idx}/{total}:[/bold] [cyan]{name}[/cyan]")
 
     def print_song_step(self, message: str) -> None:
@@ -44,13 +94,47 @@ class Console:
     def print_song_error(self, message: str) -> None:
         self._print(f"  └─ [red]✗ {message}[/red]\n")
 
-    def print_summary(self, processed: int, failed: int) -> None:
+    def print_video_success(self, name: str) -> None:
+        self._print(f"[green]✓ Video ready:[/green] [cyan]{name}[/cyan]")
+
+    def print_video_error(self, name: str, message: str) -> None:
+        self._print(f"[red]✗ {message}:[/red] [cyan]{name}[/cyan]")
+
+    def print_song_skipped(self, message: str) -> None:
+        self._print(f"  └─ [yellow]↷ {message}[/yellow]\n")
+
+    def print_song_suspicious(self, name: str, problems: Sequence[str]) -> None:
+        self._print(
+            f"[red]✗[/red] [cyan]{name}[/cyan] [dim]queued for re-download[/dim]"
+        )
+        for problem in problems:
+            self._print(f"  ├─ [dim]{problem}[/dim]")
+
+    def print_song_removed(self, name: str, song_dir: Any, dry_run: bool) -> None:
+        action = "would remove" if dry_run else "removed"
+        self._print(
+            f"[yellow]✗[/yellow] [cyan]{name}[/cyan] [dim]{action} {song_dir}[/dim]"
+        )
+
+    def print_song_moved(self, name: str, target: Any) -> None:
+        self._print(f"[green]✓[/green] [cyan]{name}[/cyan] [dim]→ {target}[/dim]")
+
+    def print_summary(self, processed: int, failed: int, skipped: int = 0) -> None:
         self._print("[bold]Summary:[/bold]")
         self._print(f"  [green]✓ Successful: {processed}[/green]")
         if failed > 0:
             self._print(f"  [red]✗ Failed: {failed}[/red]")
+        if skipped > 0:
+            self._print(f"  [yellow]↷ Skipped: {skipped}[/yellow]")
         self._print()
 
+    def print_server_start(self, url: str) -> None:
+        self._print(f"[bold]Accepting song uploads on[/bold] [link={url}]{url}[/link]")
+        self._print("[dim]Press Ctrl+C to stop[/dim]\n")
+
+    def print_profile(self, profile_dir: Any) -> None:
+        self._print(f"[dim]Profile written to {profile_dir}[/dim]\n")
+
     def print_interrupt(self) -> None:
         self._print("\n[yellow]⚠ Interrupted by user[/yellow]")
 
@@ -59,7 +143,7 @@ class Console:
 
     @contextmanager
     def print_song_step_spinner(self, message: str) -> Generator[None]:
-        if self._enabled:
+        if self._console is not None and self._live:
             with Live(
                 Spinner("dots", text=f"├─ [dim]{message}[/dim]"),
                 console=self._console,
@@ -72,3 +156,309 @@ class Console:
     def print_search_cover(self, name: str, url: str) -> None:
         self._print(f"  ├─ [dim]Search for cover for {name}[/dim]")
         self._print(f"  │   └─ [link={url}]{url}[/link]")
+
+    def print_queue_status(
+        self,
+        counts: Mapping[str, int],
+        failures: Sequence[JobFailure],
+    ) -> None:
+        total = sum(counts.values())
+        self._print(f"[bold]Queue:[/bold] {total} song(s)")
+        for state, count in counts.items():
+            self._print(f"  ├─ [dim]{state}:[/dim] {count}")
+        self._print()
+        for failure in failures:
+            self._print(
+                f"  [red]✗ {failure.name}[/red] "
+                f"[dim](attempts: {failure.attempts})[/dim] {failure.error}"
+            )
+
+    def print_load_reports(self, reports: Sequence[LoadReport]) -> None:
+        self._print("[bold]Load test:[/bold]")
+        for report in reports:
+            self._print(
+                f"  ├─ [cyan]{report.workers} worker(s)[/cyan] "
+                f"{report.songs_per_minute:.0f} songs/min, "
+                f"p50 {report.latency_percentile(50):.2f}s, "
+                f"p95 {report.latency_percentile(95):.2f}s, "
+                f"p99 {report.latency_percentile(99):.2f}s, "
+                f"{report.peak_memory / 1024**2:.0f} MiB "
+                f"[dim](✓ {report.processed} ✗ {report.failed} "
+                f"↷ {report.skipped})[/dim]"
+            )
+            for problem in report.problems:
+                self._print(f"  │   └─ [red]✗ {problem}[/red]")
+        self._print()
+
+    def print_search_results(
+        self,
+        query: str,
+        entries: Sequence[CatalogEntry],
+    ) -> None:
+        self._print(f"[bold]Search:[/bold] {query} ({len(entries)} song(s))")
+        for entry in entries:
+            self._print(
+                f"  ├─ [cyan]{entry.name}[/cyan] "
+                f"[dim]{entry.artist} - {entry.title} (ID: {entry.video_id})[/dim]"
+            )
+            self._print(f"  │   └─ [dim]{entry.path}[/dim]")
+        self._print()
+
+
+class JsonConsole(Console):
+    # Every line is one JSON event, written and flushed as it happens, without
+    # any markup to render.
+    def __init__(self, stream: TextIO | None) -> None:
+        super().__init__(enabled=False, live=False)
+        self._stream = stream
+        # Songs are processed one after another, so step and result events
+        # belong to the song started last.
+        self._song: dict[str, Any] = {}
+
+    def _emit(self, event: str, **fields: Any) -> None:
+        # sys.stdout is None without a console, e.g. under pythonw.
+        if self._stream is None:
+            return
+        self._stream.write(
+            json.dumps(
+                {"event": event, "time": time.time(), **fields},
+                ensure_ascii=False,
+                default=str,
+            )
+            + "\n"
+        )
+        self._stream.flush()
+
+    def print_header(
+        self,
+        input_dir: Any,
+        output_dir: Any,
+        app_version: str,
+        shard: Any = None,
+    ) -> None:
+        self._emit(
+            "start",
+            version=app_version,
+            input_dir=input_dir,
+            output_dir=output_dir,
+            shard=shard,
+        )
+
+    def print_song_count(self, count: int) -> None:
+        self._emit("song_count", count=count)
+
+    def print_duplicate(self, name: str, existing: str) -> None:
+        self._emit("song_duplicate", name=name, existing=existing)
+
+    def print_song_start(
+        self,
+        idx: int,
+        total: int,
+        name: str,
+        video_id: str | None = None,
+    ) -> None:
+        self._song = {"name": name, "video_id": video_id}
+        self._emit("song_start", idx=idx, total=total, **self._song)
+
+    def print_song_step(self, message: str) -> None:
+        self._emit("song_step", **self._song, message=message)
+
+    def print_song_success(self, message: str = "Completed") -> None:
+        self._emit("song_success", **self._song, message=message)
+        self._song = {}
+
+    def print_song_error(self, message: str) -> None:
+        self._emit("song_failure", **self._song, message=message)
+        self._song = {}
+
+    def print_video_success(self, name: str) -> None:
+        self._emit("video_success", name=name)
+
+    def print_video_error(self, name: str, message: str) -> None:
+        self._emit("video_failure", name=name, message=message)
+
+    def print_song_skipped(self, message: str) -> None:
+        self._emit("song_skipped", **self._song, message=message)
+        self._song = {}
+
+    def print_song_suspicious(self, name: str, problems: Sequence[str]) -> None:
+        self._emit("song_suspicious", name=name, problems=list(problems))
+
+    def print_song_removed(self, name: str, song_dir: Any, dry_run: bool) -> None:
+        self._emit("song_removed", name=name, path=song_dir, dry_run=dry_run)
+
+    def print_song_moved(self, name: str, target: Any) -> None:
+        self._emit("song_moved", name=name, path=target)
+
+    def print_summary(self, processed: int, failed: int, skipped: int = 0) -> None:
+        self._emit("summary", processed=processed, failed=failed, skipped=skipped)
+
+    def print_server_start(self, url: str) -> None:
+        self._emit("server_start", url=url)
+
+    def print_profile(self, profile_dir: Any) -> None:
+        self._emit("profile", path=profile_dir)
+
+    def print_interrupt(self) -> None:
+        self._emit("interrupt")
+
+    def print_failure(self, message: str) -> None:
+        self._emit("failure", message=message)
+
+    @contextmanager
+    def print_song_step_spinner(self, message: str) -> Generator[None]:
+        # The step is reported by print_song_step once it has finished.
+        yield
+
+    def print_search_cover(self, name: str, url: str) -> None:
+        self._emit("song_cover_search", name=name, url=url)
+
+    def print_queue_status(
+        self,
+        counts: Mapping[str, int],
+        failures: Sequence[JobFailure],
+    ) -> None:
+        self._emit(
+            "queue_status",
+            counts=dict(counts),
+            failures=[
+                {
+                    "name": failure.name,
+                    "attempts": failure.attempts,
+                    "error": failure.error,
+                }
+                for failure in failures
+            ],
+        )
+
+    def print_load_reports(self, reports: Sequence[LoadReport]) -> None:
+        for report in reports:
+            self._emit(
+                "load_report",
+                workers=report.workers,
+                songs_per_minute=report.songs_per_minute,
+                latency_p50=report.latency_percentile(50),
+                latency_p95=report.latency_percentile(95),
+                latency_p99=report.latency_percentile(99),
+                peak_memory=report.peak_memory,
+                processed=report.processed,
+                failed=report.failed,
+                skipped=report.skipped,
+                problems=list(report.problems),
+            )
+
+    def print_search_results(
+        self,
+        query: str,
+        entries: Sequence[CatalogEntry],
+    ) -> None:
+        self._emit(
+            "search_results",
+            query=query,
+            songs=[
+                {
+                    "name": entry.name,
+                    "artist": entry.artist,
+                    "title": entry.title,
+                    "video_id": entry.video_id,
+                    "path": entry.path,
+                }
+                for entry in entries
+            ],
+        )
+
+
+class NullConsole(Console):
+    # Disabled output skips every output, so no markup is formatted either.
+    def __init__(self) -> None:
+        super().__init__(enabled=False, live=False)
+
+    def print_header(
+        self,
+        input_dir: Any,
+        output_dir: Any,
+        app_version: str,
+        shard: Any = None,
+    ) -> None:
+        pass
+
+    def print_song_count(self, count: int) -> None:
+        pass
+
+    def print_duplicate(self, name: str, existing: str) -> None:
+        pass
+
+    def print_song_start(
+        self,
+        idx: int,
+        total: int,
+        name: str,
+        video_id: str | None = None,
+    ) -> None:
+        pass
+
+    def print_song_step(self, message: str) -> None:
+        pass
+
+    def print_song_success(self, message: str = "Completed") -> None:
+        pass
+
+    def print_song_error(self, message: str) -> None:
+        pass
+
+    def print_video_success(self, name: str) -> None:
+        pass
+
+    def print_video_error(self, name: str, message: str) -> None:
+        pass
+
+    def print_song_skipped(self, message: str) -> None:
+        pass
+
+    def print_song_suspicious(self, name: str, problems: Sequence[str]) -> None:
+        pass
+
+    def print_song_removed(self, name: str, song_dir: Any, dry_run: bool) -> None:
+        pass
+
+    def print_song_moved(self, name: str, target: Any) -> None:
+        pass
+
+    def print_summary(self, processed: int, failed: int, skipped: int = 0) -> None:
+        pass
+
+    def print_server_start(self, url: str) -> None:
+        pass
+
+    def print_profile(self, profile_dir: Any) -> None:
+        pass
+
+    def print_interrupt(self) -> None:
+        pass
+
+    def print_failure(self, message: str) -> None:
+        pass
+
+    @contextmanager
+    def print_song_step_spinner(self, message: str) -> Generator[None]:
+        yield
+
+    def print_search_cover(self, name: str, url: str) -> None:
+        pass
+
+    def print_queue_status(
+        self,
+        counts: Mapping[str, int],
+        failures: Sequence[JobFailure],
+    ) -> None:
+        pass
+
+    def print_load_reports(self, reports: Sequence[LoadReport]) -> None:
+        pass
+
+    def print_search_results(
+        self,
+        query: str,
+        entries: Sequence[CatalogEntry],
+    ) -> None:
+        pass
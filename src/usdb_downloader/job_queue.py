@@ -0,0 +1,350 @@
+from __future__ import annotations
+
+import contextlib
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.models import File, SongSource
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterable
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class JobState(StrEnum):
+    PENDING = "pending"
+    DOWNLOADING = "downloading"
+    TRANSCODING = "transcoding"
+    VERIFYING = "verifying"
+    ANALYZING = "analyzing"
+    WRITING = "writing"
+    DOWNLOADING_VIDEO = "downloading_video"
+    DONE = "done"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+
+_ACTIVE_STATES: Final[tuple[JobState, ...]] = (
+    JobState.DOWNLOADING,
+    JobState.TRANSCODING,
+    JobState.VERIFYING,
+    JobState.ANALYZING,
+    JobState.WRITING,
+    JobState.DOWNLOADING_VIDEO,
+)
+
+
+@dataclass(frozen=True)
+class Job:
+    id: int
+    file: File
+    attempts: int
+    source: SongSource = SongSource.INPUT
+
+
+@dataclass(frozen=True)
+class JobFailure:
+    name: str
+    attempts: int
+    error: str
+
+
+@dataclass(frozen=True)
+class SongResult:
+    name: str
+    video_id: str | None
+    state: JobState
+    song_dir: Path | None = None
+    error: str | None = None
+
+
+class JobQueue:
+    _SCHEMA: Final[str] = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            video_id TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            worker TEXT,
+            source TEXT NOT NULL DEFAULT 'input',
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+        CREATE TABLE IF NOT EXISTS scans (
+            worker TEXT PRIMARY KEY,
+            started_at REAL NOT NULL
+        );
+    """
+    _BUSY_TIMEOUT: Final[float] = 30.0
+    # Every batch is its own short transaction, so workers claim jobs while a
+    # large input is still being enqueued.
+    _ENQUEUE_BATCH_SIZE: Final[int] = 256
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._path = path
+        self._host = socket.gethostname()
+        self._worker = f"{self._host}:{os.getpid()}"
+        # Autocommit mode: every statement below is its own atomic transaction.
+        self._conn = sqlite3.connect(
+            path,
+            timeout=self._BUSY_TIMEOUT,
+            isolation_level=None,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self._SCHEMA)
+        logger.info("Opened job queue %s", path)
+
+    @classmethod
+    def for_host(cls, state_dir: Path) -> JobQueue:
+        # SQLite locking is unreliable on network filesystems, so nodes sharing
+        # an output directory each keep their own queue.
+        return cls(state_dir / f"queue-{socket.gethostname()}.sqlite3")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def enqueue(
+        self,
+        files: Iterable[File],
+        source: SongSource = SongSource.INPUT,
+    ) -> int:
+        self.add(files, source)
+        self.requeue_interrupted()
+        pending = self.status().get(JobState.PENDING, 0)
+        logger.info("Enqueued jobs, %d pending", pending)
+        return pending
+
+    def add(self, files: Iterable[File], source: SongSource = SongSource.INPUT) -> int:
+        added = 0
+        for batch in itertools.batched(files, self._ENQUEUE_BATCH_SIZE, strict=False):
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.executemany(
+                    """
+                    INSERT INTO jobs (
+                        name, video_id, payload, state, source, updated_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (name) DO UPDATE SET
+                        video_id = excluded.video_id,
+                        payload = excluded.payload,
+                        state = excluded.state,
+                        error = NULL,
+                        worker = NULL,
+                        source = excluded.source,
+                        updated_at = excluded.updated_at
+                    WHERE jobs.state IN (?, ?) OR (
+                        jobs.state = ?
+                        AND (
+                            jobs.video_id != excluded.video_id
+                            OR jobs.payload != excluded.payload
+                        )
+                    )
+                    """,
+                    (
+                        (
+                            file.name,
+                            file.video_id,
+                            self._encode(file),
+                            JobState.PENDING,
+                            source,
+                            now,
+                            JobState.FAILED,
+                            JobState.SKIPPED,
+                            # Finished songs whose song file changed are done
+                            # again.
+                            JobState.DONE,
+                        )
+                        for file in batch
+                    ),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            added += cursor.rowcount
+        return added
+
+    @contextlib.contextmanager
+    def scanning(self) -> Generator[None]:
+        # Workers in other processes wait for more jobs while a scan runs.
+        self._conn.execute(
+            "INSERT OR REPLACE INTO scans (worker, started_at) VALUES (?, ?)",
+            (self._worker, time.time()),
+        )
+        try:
+            yield
+        finally:
+            self._conn.execute("DELETE FROM scans WHERE worker = ?", (self._worker,))
+
+    def is_scanning(self) -> bool:
+        # Only scans of other processes count, a worker knows its own.
+        rows = self._conn.execute(
+            "SELECT worker FROM scans WHERE worker != ?", (self._worker,)
+        ).fetchall()
+        for (worker,) in rows:
+            # Scans of a crashed process never finish, so they are ignored.
+            pid = worker.rpartition(":")[2]
+            if pid.isdigit() and self._is_alive(int(pid)):
+                return True
+        return False
+
+    def requeue(
+        self,
+        file: File,
+        error: str,
+        source: SongSource = SongSource.INPUT,
+    ) -> None:
+        # Finished songs go back to pending, e.g. when their media turned out
+        # to be broken. Songs that are being processed are left alone.
+        self._conn.execute(
+            f"""
+            INSERT INTO jobs (
+                name, video_id, payload, state, error, source, updated_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                video_id = excluded.video_id,
+                payload = excluded.payload,
+                state = excluded.state,
+                error = excluded.error,
+                worker = NULL,
+                updated_at = excluded.updated_at
+            WHERE jobs.state NOT IN ({", ".join("?" * len(_ACTIVE_STATES))})
+            """,
+            (
+                file.name,
+                file.video_id,
+                self._encode(file),
+                JobState.PENDING,
+                error,
+                source,
+                time.time(),
+                *_ACTIVE_STATES,
+            ),
+        )
+        logger.info("Requeued song %s: %s", file.name, error)
+
+    def remove(self, name: str) -> None:
+        self._conn.execute("DELETE FROM jobs WHERE name = ?", (name,))
+
+    def claim(self, name: str | None = None) -> Job | None:
+        row = self._conn.execute(
+            """
+            UPDATE jobs SET
+                state = ?,
+                attempts = attempts + 1,
+                error = NULL,
+                worker = ?,
+                updated_at = ?
+            WHERE id = (
+                SELECT id FROM jobs
+                WHERE state = ? AND (? IS NULL OR name = ?)
+                ORDER BY id LIMIT 1
+            )
+            RETURNING id, name, video_id, payload, attempts, source
+            """,
+            (
+                JobState.DOWNLOADING,
+                self._worker,
+                time.time(),
+                JobState.PENDING,
+                name,
+                name,
+            ),
+        ).fetchone()
+        if row is None:
+            return None
+
+        job_id, job_name, video_id, payload, attempts, source = row
+        logger.info("Claimed job %d for song %s", job_id, job_name)
+        return Job(
+            id=job_id,
+            file=self._decode(name=job_name, video_id=video_id, payload=payload),
+            attempts=attempts,
+            source=SongSource(source),
+        )
+
+    def set_state(self, job_id: int, state: JobState, error: str | None = None) -> None:
+        self._conn.execute(
+            "UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE id = ?",
+            (state, error, time.time(), job_id),
+        )
+        logger.info("Job %d is %s", job_id, state)
+
+    def pending_video_ids(self, limit: int) -> list[str]:
+        rows = self._conn.execute(
+            "SELECT video_id FROM jobs WHERE state = ? ORDER BY id LIMIT ?",
+            (JobState.PENDING, limit),
+        )
+        return [video_id for (video_id,) in rows]
+
+    def status(self) -> dict[JobState, int]:
+        rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state")
+        return {JobState(state): count for state, count in rows}
+
+    def failures(self) -> list[JobFailure]:
+        rows = self._conn.execute(
+            "SELECT name, attempts, error FROM jobs WHERE state = ? ORDER BY id",
+            (JobState.FAILED,),
+        )
+        return [
+            JobFailure(name=name, attempts=attempts, error=error or "")
+            for name, attempts, error in rows
+        ]
+
+    def requeue_interrupted(self) -> None:
+        # Jobs left active by a crashed worker on this host go back to pending.
+        rows = self._conn.execute(
+            f"""
+            SELECT id, worker FROM jobs
+            WHERE state IN ({", ".join("?" * len(_ACTIVE_STATES))})
+            """,
+            _ACTIVE_STATES,
+        ).fetchall()
+        for job_id, worker in rows:
+            host, _, pid = (worker or "").rpartition(":")
+            if host == self._host and pid.isdigit() and self._is_alive(int(pid)):
+                continue
+            logger.warning("Requeued interrupted job %d of worker %s", job_id, worker)
+            self.set_state(job_id, JobState.PENDING)
+
+    @staticmethod
+    def _is_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @staticmethod
+    def _encode(file: File) -> str:
+        return json.dumps({"headers": file.headers, "lyrics": file.lyrics})
+
+    @staticmethod
+    def _decode(name: str, video_id: str, payload: str) -> File:
+        data = json.loads(payload)
+        return File(
+            name=name,
+            video_id=video_id,
+            headers=data["headers"],
+            lyrics=data["lyrics"],
+        )
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from enum import StrEnum
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.models import parse_header
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Mapping
+
+    from usdb_downloader.catalog import Catalog
+
+logger = logging.getLogger(__name__)
+
+_INVALID_CHARS: Final[re.Pattern[str]] = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+
+class Layout(StrEnum):
+    FLAT = "flat"
+    INITIAL = "initial"
+    ARTIST = "artist"
+    HASH = "hash"
+
+    def song_dir(
+        self,
+        output_dir: Path,
+        name: str,
+        headers: Mapping[str, str],
+    ) -> Path:
+        artist = headers.get("ARTIST", "").strip() or name
+        match self:
+            case Layout.FLAT:
+                return output_dir / name
+            case Layout.INITIAL:
+                return output_dir / self._initial(artist) / name
+            case Layout.ARTIST:
+                return output_dir / self._folder_name(artist) / name
+            case Layout.HASH:
+                # 256 buckets, stable across machines, so rsync targets agree.
+                digest = hashlib.sha1(name.encode(), usedforsecurity=False)
+                return output_dir / digest.hexdigest()[:2] / name
+
+    @staticmethod
+    def _initial(artist: str) -> str:
+        letter = unicodedata.normalize("NFKD", artist)[:1].upper()
+        if "A" <= letter <= "Z":
+            return letter
+        if letter.isdigit():
+            return "0-9"
+        return "#"
+
+    @staticmethod
+    def _folder_name(artist: str) -> str:
+        folder = _INVALID_CHARS.sub("_", artist).rstrip(". ")
+        return folder or "_"
+
+
+def iter_song_dirs(output_dir: Path) -> Generator[Path]:
+    # A song folder contains a .txt file of the same name. Folders of the
+    # sharded layouts are only containers, so the walk descends into them.
+    stack = [output_dir]
+    song_dirs: list[Path] = []
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda e: e.name)
+        except FileNotFoundError:
+            continue
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_dir():
+                continue
+            path = Path(entry.path)
+            if (path / f"{entry.name}.txt").is_file():
+                song_dirs.append(path)
+            else:
+                stack.append(path)
+
+    # Song folders are listed up front, so that moved folders are not visited
+    # twice.
+    yield from sorted(song_dirs)
+
+
+def remove_empty_parents(output_dir: Path, directory: Path) -> None:
+    while directory != output_dir and directory.is_relative_to(output_dir):
+        try:
+            directory.rmdir()
+        except OSError:
+            return
+        directory = directory.parent
+
+
+@dataclass(frozen=True)
+class Move:
+    name: str
+    source: Path
+    target: Path
+
+
+class LayoutMigrator:
+    def __init__(
+        self,
+        output_dir: Path,
+        layout: Layout,
+        catalog: Catalog | None = None,
+    ) -> None:
+        self._output_dir = output_dir
+        self._layout = layout
+        self._catalog = catalog
+
+    def plan(self) -> Generator[Move]:
+        for song_dir in iter_song_dirs(self._output_dir):
+            name = song_dir.name
+            target = self._layout.song_dir(
+                self._output_dir,
+                name,
+                self._read_headers(song_dir / f"{name}.txt"),
+            )
+            yield Move(name=name, source=song_dir, target=target)
+
+    def apply(self, move: Move) -> bool:
+        if move.target.exists():
+            logger.warning(
+                "Cannot move song %s, %s already exists", move.name, move.target
+            )
+            return False
+
+        move.target.parent.mkdir(parents=True, exist_ok=True)
+        move.source.rename(move.target)
+        remove_empty_parents(self._output_dir, move.source.parent)
+        if self._catalog is not None:
+            self._catalog.move(move.name, move.target)
+        logger.info("Moved song %s to %s", move.name, move.target)
+        return True
+
+    @staticmethod
+    def _read_headers(path: Path) -> dict[str, str]:
+        headers: dict[str, str] = {}
+        with path.open(encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.startswith("#"):
+                    break
+                key, value = parse_header(line)
+                headers[key] = value
+        return headers
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.app import App
+from usdb_downloader.bandwidth import BandwidthLimiter, Priority
+from usdb_downloader.console import NullConsole
+from usdb_downloader.models import VideoInfo
+from usdb_downloader.verifier import MediaVerifier
+from usdb_downloader.youtube_downloader import (
+    YoutubeDownloader,
+    YoutubeDownloaderException,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Callable, Sequence
+
+    from usdb_downloader.job_queue import SongResult
+
+_THROTTLE_ERROR: Final[str] = (
+    "Failed to download {kind}: HTTP Error 429: Too Many Requests"
+)
+_FAILURE_ERROR: Final[str] = "Failed to download {kind}: Connection reset by peer"
+
+
+@dataclass(frozen=True)
+class LoadProfile:
+    # Latencies follow a log-normal distribution around their median.
+    resolve_latency: float = 0.05
+    download_latency: float = 0.2
+    latency_sigma: float = 0.5
+    bandwidth: float = 50 * 1024**2
+    audio_size: int = 5 * 1024**2
+    video_size: int = 30 * 1024**2
+    unavailable_rate: float = 0.0
+    throttle_rate: float = 0.0
+    failure_rate: float = 0.0
+
+
+@dataclass(frozen=True)
+class LoadReport:
+    workers: int
+    songs: int
+    duration: float
+    processed: int
+    failed: int
+    skipped: int
+    latencies: Sequence[float]
+    peak_memory: int
+    problems: Sequence[str] = field(default_factory=tuple[str, ...])
+
+    @property
+    def songs_per_minute(self) -> float:
+        return self.songs / self.duration * 60 if self.duration else 0.0
+
+    def latency_percentile(self, percentile: int) -> float:
+        if len(self.latencies) < 2:
+            return self.latencies[0] if self.latencies else 0.0
+        return statistics.quantiles(self.latencies, n=100)[percentile - 1]
+
+
+@dataclass(frozen=True)
+class _WorkerReport:
+    processed: int
+    failed: int
+    skipped: int
+    results: Sequence[tuple[str, float]]
+    peak_memory: int
+
+
+class FakeYoutubeDownloader(YoutubeDownloader):
+    def __init__(self, profile: LoadProfile, seed: int, workers: int = 1) -> None:
+        # Concurrent transfers share the bandwidth, every worker process gets
+        # an equal share of it, like with --bandwidth.
+        self._bandwidth = BandwidthLimiter(rate=profile.bandwidth / workers)
+        super().__init__(bandwidth_limiter=self._bandwidth)
+        self._profile = profile
+        self._random = random.Random(seed)
+        self.started: dict[str, float] = {}
+
+    async def resolve(self, video_id: str) -> VideoInfo:
+        self.started.setdefault(video_id, time.monotonic())
+        await asyncio.sleep(self._latency(self._profile.resolve_latency))
+        if self._random.random() < self._profile.unavailable_rate:
+            return VideoInfo(
+                video_id=video_id,
+                available=False,
+                error="Video unavailable",
+            )
+        return VideoInfo(video_id=video_id, available=True, duration=180)
+
+    async def download_video(
+        self,
+        video_id: str,
+        output_path: Path,
+        format_id: str | None = None,
+    ) -> None:
+        await self._transfer("video", self._profile.video_size, Priority.VIDEO)
+        self._write(Path(f"{output_path}.webm"))
+
+    async def download_audio(
+        self,
+        video_id: str,
+        output_path: Path,
+        format_id: str | None = None,
+        on_postprocess: Callable[[], None] | None = None,
+    ) -> None:
+        await self._transfer("audio", self._profile.audio_size, Priority.AUDIO)
+        if on_postprocess is not None:
+            on_postprocess()
+        self._write(Path(f"{output_path}.mp3"))
+
+    async def _transfer(self, kind: str, size: int, priority: Priority) -> None:
+        await asyncio.sleep(self._latency(self._profile.download_latency))
+        roll = self._random.random()
+        if roll < self._profile.throttle_rate:
+            raise YoutubeDownloaderException(_THROTTLE_ERROR.format(kind=kind))
+        if roll < self._profile.throttle_rate + self._profile.failure_rate:
+            raise YoutubeDownloaderException(_FAILURE_ERROR.format(kind=kind))
+        await asyncio.to_thread(self._bandwidth.consume, size, priority)
+
+    @staticmethod
+    def _write(path: Path) -> None:
+        # Like yt-dlp, the song folder is created by the first download.
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.touch()
+
+    def _latency(self, median: float) -> float:
+        if median <= 0:
+            return 0.0
+        return self._random.lognormvariate(0, self._profile.latency_sigma) * median
+
+
+class _DisabledVerifier(MediaVerifier):
+    @property
+    def available(self) -> bool:
+        return False
+
+
+class LoadHarness:
+    _DEFAULT_WORKER_COUNTS: Final[tuple[int, ...]] = (1, 2, 4, 8, 16)
+
+    def __init__(
+        self,
+        songs: int,
+        profile: LoadProfile,
+        worker_counts: Sequence[int] = _DEFAULT_WORKER_COUNTS,
+        seed: int = 0,
+    ) -> None:
+        self._songs = songs
+        self._profile = profile
+        self._worker_counts = worker_counts
+        self._seed = seed
+
+    def run(self) -> list[LoadReport]:
+        return [self.measure(workers) for workers in self._worker_counts]
+
+    def measure(self, workers: int) -> LoadReport:
+        with tempfile.TemporaryDirectory(prefix="usdb-load-") as tmp:
+            input_dir = Path(tmp) / "input"
+            output_dir = Path(tmp) / "output"
+            names = self._create_songs(input_dir)
+
+            app = App(
+                input_dir=input_dir,
+                output_dir=output_dir,
+                console=NullConsole(),
+                allow_duplicates=True,
+                verifier=_DisabledVerifier(),
+            )
+            try:
+                app.enqueue()
+            finally:
+                app.close()
+
+            started = time.monotonic()
+            with ProcessPoolExecutor(workers) as pool:
+                futures = [
+                    pool.submit(
+                        _run_worker,
+                        input_dir,
+                        output_dir,
+                        self._profile,
+                        self._seed + worker,
+                        workers,
+                    )
+                    for worker in range(workers)
+                ]
+                reports = [future.result() for future in futures]
+            duration = time.monotonic() - started
+
+        return LoadReport(
+            workers=workers,
+            songs=self._songs,
+            duration=duration,
+            processed=sum(report.processed for report in reports),
+            failed=sum(report.failed for report in reports),
+            skipped=sum(report.skipped for report in reports),
+            latencies=sorted(
+                latency for report in reports for _, latency in report.results
+            ),
+            peak_memory=max(report.peak_memory for report in reports),
+            problems=self._check(names, reports),
+        )
+
+    def _create_songs(self, input_dir: Path) -> list[str]:
+        input_dir.mkdir(parents=True)
+        names: list[str] = []
+        for idx in range(self._songs):
+            name = f"Artist {idx} - Song {idx}"
+            video_id = f"{idx:011d}"
+            (input_dir / f"{name}.txt").write_text(
+                f"#ARTIST:Artist {idx}\n#TITLE:Song {idx}\n#BPM:120\n"
+                f"#VIDEO:v={video_id}\n: 0 4 0 La\n",
+                encoding="utf-8",
+            )
+            names.append(name)
+        return names
+
+    @staticmethod
+    def _check(names: Sequence[str], reports: Sequence[_WorkerReport]) -> list[str]:
+        # Every song has to end up in exactly one summary and one result.
+        counts = Counter(name for report in reports for name, _ in report.results)
+        problems = [
+            f"{name} was reported {count} times"
+            for name, count in counts.items()
+            if count > 1
+        ]
+        problems.extend(f"{name} was lost" for name in names if name not in counts)
+        total = sum(
+            report.processed + report.failed + report.skipped for report in reports
+        )
+        if total != len(names):
+            problems.append(f"Summary counts {total} songs, expected {len(names)}")
+        return problems
+
+
+def _run_worker(
+    input_dir: Path,
+    output_dir: Path,
+    profile: LoadProfile,
+    seed: int,
+    workers: int,
+) -> _WorkerReport:
+    youtube_downloader = FakeYoutubeDownloader(profile, seed, workers)
+    results: list[tuple[str, float]] = []
+
+    def on_result(result: SongResult) -> None:
+        started = youtube_downloader.started.get(result.video_id or "")
+        latency = time.monotonic() - started if started is not None else 0.0
+        results.append((result.name, latency))
+
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=NullConsole(),
+        youtube_downloader=youtube_downloader,
+        allow_duplicates=True,
+        verifier=_DisabledVerifier(),
+        on_result=on_result,
+    )
+    try:
+        summary = asyncio.run(app.work())
+    finally:
+        app.close()
+
+    return _WorkerReport(
+        processed=summary.processed,
+        failed=summary.failed,
+        skipped=summary.skipped,
+        results=results,
+        peak_memory=_peak_memory(),
+    )
+
+
+def _peak_memory() -> int:
+    # The resource module is Unix-only.
+    if sys.platform == "win32":
+        return 0
+
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS, but in KiB on Linux.
+    return peak if sys.platform == "darwin" else peak * 1024
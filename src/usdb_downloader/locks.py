@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class SongLocks:
+    # Locks of long running downloads are refreshed, see refresh, so only
+    # locks left behind by a crashed node turn stale.
+    _DEFAULT_STALE_AFTER: Final[float] = 30 * 60
+
+    def __init__(
+        self,
+        lock_dir: Path,
+        stale_after: float = _DEFAULT_STALE_AFTER,
+    ) -> None:
+        self._lock_dir = lock_dir
+        self._stale_after = stale_after
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._held: dict[str, str] = {}
+
+    def acquire(self, name: str) -> bool:
+        self._lock_dir.mkdir(parents=True, exist_ok=True)
+        path = self._lock_path(name)
+        # Every claim has its own token, which tells it apart from a later
+        # claim of the same song.
+        token = f"{self._owner}:{uuid.uuid4().hex}\n"
+
+        if self._try_create(path, token) or (
+            self._break_stale(path) and self._try_create(path, token)
+        ):
+            self._held[name] = token
+            logger.info("Claimed song %s", name)
+            return True
+
+        logger.info("Song %s is claimed by another node", name)
+        return False
+
+    def release(self, name: str) -> None:
+        token = self._held.pop(name, None)
+        path = self._lock_path(name)
+        # A lock that was broken and claimed by another node is left alone.
+        if token is not None and self._read(path) == token:
+            path.unlink(missing_ok=True)
+        logger.info("Released song %s", name)
+
+    def refresh(self) -> None:
+        for name, token in self._held.items():
+            path = self._lock_path(name)
+            if self._read(path) != token:
+                logger.warning("Lock of song %s was broken by another node", name)
+                continue
+            try:
+                os.utime(path)
+            except OSError as e:
+                logger.warning("Failed to refresh lock %s: %s", path, e)
+
+    def _lock_path(self, name: str) -> Path:
+        return self._lock_dir / f"{name}.lock"
+
+    def _try_create(self, path: Path, token: str) -> bool:
+        try:
+            # O_EXCL makes the create atomic, also on shared network filesystems.
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(token)
+        return True
+
+    def _break_stale(self, path: Path) -> bool:
+        # The token is read before the age, so a fresh lock created in between
+        # is never taken for stale.
+        stale = self._read(path)
+        try:
+            if time.time() - path.stat().st_mtime <= self._stale_after:
+                return False
+        except FileNotFoundError:
+            return True
+
+        # Renaming is atomic, so only one of several nodes breaking the lock
+        # moves it away. Another node may have broken it and claimed the song
+        # in the meantime, which the token of the moved lock tells.
+        tombstone = path.with_name(f"{path.name}.{uuid.uuid4().hex}.stale")
+        try:
+            path.rename(tombstone)
+        except FileNotFoundError:
+            return True
+        try:
+            token = self._read(tombstone)
+            if token != stale and token is not None:
+                self._try_create(path, token)
+                return False
+        finally:
+            tombstone.unlink(missing_ok=True)
+
+        logger.warning("Broke stale lock %s", path)
+        return True
+
+    @staticmethod
+    def _read(path: Path) -> str | None:
+        try:
+            return path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
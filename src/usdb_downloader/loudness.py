@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import math
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Final
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "Loudness measurement requires numpy, install usdb-downloader[analysis]"
+    ) from e
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import numpy.typing as npt
+
+SAMPLE_RATE: Final[int] = 48000
+CHANNELS: Final[int] = 2
+# ReplayGain 2.0 aims at -18 LUFS.
+REFERENCE_LOUDNESS: Final[float] = -18.0
+
+# Biquads of the K-weighting filter of ITU-R BS.1770 at 48 kHz, a high shelf
+# followed by a high pass.
+_SHELF: Final[tuple[tuple[float, ...], tuple[float, ...]]] = (
+    (1.53512485958697, -2.69169618940638, 1.19839281085285),
+    (1.0, -1.69065929318241, 0.73248077421585),
+)
+_HIGH_PASS: Final[tuple[tuple[float, ...], tuple[float, ...]]] = (
+    (1.0, -2.0, 1.0),
+    (1.0, -1.99004745483398, 0.99007225036621),
+)
+_SUB_BLOCK: Final[int] = SAMPLE_RATE // 10
+_SUB_BLOCKS_PER_BLOCK: Final[int] = 4
+_ABSOLUTE_GATE: Final[float] = -70.0
+_RELATIVE_GATE: Final[float] = -10.0
+_CHUNK_SECONDS: Final[int] = 10
+_DECODE_TIMEOUT: Final[float] = 300.0
+
+
+@dataclass(frozen=True)
+class Loudness:
+    integrated: float
+    peak: float
+
+    @property
+    def gain(self) -> float:
+        return REFERENCE_LOUDNESS - self.integrated
+
+
+class LoudnessMeter:
+    def __init__(self) -> None:
+        self._powers: list[npt.NDArray[np.float64]] = []
+        self._peak = 0.0
+        self._weights: dict[int, npt.NDArray[np.float64]] = {}
+
+    def add(self, samples: npt.NDArray[np.float32]) -> None:
+        # Samples are interleaved frames, the tail of a partial 100 ms sub-block
+        # is dropped.
+        frames = samples.reshape(-1, CHANNELS)
+        frames = frames[: len(frames) - len(frames) % _SUB_BLOCK]
+        if not len(frames):
+            return
+
+        self._peak = max(self._peak, float(np.abs(frames).max()))
+        # The filter is applied as its magnitude response on the spectrum of
+        # the chunk, which gives the same energy as filtering sample by sample.
+        spectrum = np.fft.rfft(frames.astype(np.float64), axis=0)
+        spectrum *= self._weight(len(frames))[:, None]
+        weighted = np.fft.irfft(spectrum, n=len(frames), axis=0)
+        # Left and right have a channel weight of 1.
+        powers = (weighted**2).reshape(-1, _SUB_BLOCK, CHANNELS).mean(axis=1)
+        self._powers.append(powers.sum(axis=1))
+
+    def result(self) -> Loudness | None:
+        if not self._powers:
+            return None
+        powers = np.concatenate(self._powers)
+        if len(powers) < _SUB_BLOCKS_PER_BLOCK:
+            return None
+
+        # Gating blocks are 400 ms long and overlap by 75%.
+        blocks = np.convolve(
+            powers,
+            np.full(_SUB_BLOCKS_PER_BLOCK, 1 / _SUB_BLOCKS_PER_BLOCK),
+            mode="valid",
+        )
+        gated = blocks[_loudness(blocks) > _ABSOLUTE_GATE]
+        if not len(gated):
+            return None
+        relative_gate = _loudness(gated.mean()) + _RELATIVE_GATE
+        gated = gated[_loudness(gated) > relative_gate]
+        return Loudness(integrated=float(_loudness(gated.mean())), peak=self._peak)
+
+    def _weight(self, frames: int) -> npt.NDArray[np.float64]:
+        if frames not in self._weights:
+            frequencies = np.fft.rfftfreq(frames, 1 / SAMPLE_RATE)
+            z = np.exp(-2j * np.pi * frequencies / SAMPLE_RATE)
+            response = np.ones_like(z)
+            for b, a in (_SHELF, _HIGH_PASS):
+                response *= np.polyval(b[::-1], z) / np.polyval(a[::-1], z)
+            self._weights[frames] = np.abs(response)
+        return self._weights[frames]
+
+
+def measure_loudness(ffmpeg: str, path: Path) -> Loudness | None:
+    # The audio is streamed from ffmpeg in chunks, so memory stays flat for
+    # long songs.
+    chunk_size = _CHUNK_SECONDS * SAMPLE_RATE * CHANNELS * 4
+    meter = LoudnessMeter()
+    # Stderr goes to a file, a pipe that is not read while stdout is would
+    # block ffmpeg once it is full.
+    with (
+        tempfile.TemporaryFile() as stderr,
+        subprocess.Popen(
+            [
+                ffmpeg,
+                "-nostats",
+                "-v",
+                "error",
+                "-i",
+                str(path),
+                "-ac",
+                str(CHANNELS),
+                "-ar",
+                str(SAMPLE_RATE),
+                "-f",
+                "f32le",
+                "-",
+            ],
+            stdout=subprocess.PIPE,
+            stderr=stderr,
+        ) as process,
+    ):
+        assert process.stdout is not None
+        # The timeout covers the whole decode, a stalled ffmpeg is killed so
+        # the read below returns.
+        timed_out = threading.Event()
+
+        def kill() -> None:
+            timed_out.set()
+            process.kill()
+
+        watchdog = threading.Timer(_DECODE_TIMEOUT, kill)
+        watchdog.start()
+        try:
+            while data := process.stdout.read(chunk_size):
+                meter.add(np.frombuffer(data, dtype=np.float32))
+            process.wait()
+        finally:
+            watchdog.cancel()
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(process.args, _DECODE_TIMEOUT)
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise subprocess.CalledProcessError(
+                process.returncode,
+                process.args,
+                stderr=stderr.read(),
+            )
+    return meter.result()
+
+
+def apply_gain(
+    ffmpeg: str,
+    path: Path,
+    loudness: Loudness,
+    normalize: bool = False,
+) -> Loudness:
+    applied = 0.0
+    if normalize and loudness.peak > 0:
+        # Normalising never pushes the peak above full scale, which is why the
+        # gain is rounded down.
+        headroom = -20 * math.log10(loudness.peak)
+        applied = math.floor(min(loudness.gain, headroom) * 100) / 100
+    if abs(applied) < 0.1:
+        applied = 0.0
+
+    result = Loudness(
+        integrated=loudness.integrated + applied,
+        peak=loudness.peak * 10 ** (applied / 20),
+    )
+    audio_options = (
+        ["-af", f"volume={applied:.2f}dB", "-c:a", "libmp3lame", "-b:a", "192k"]
+        if applied
+        else []
+    )
+    temp_path = path.with_name(f"{path.stem}.replaygain{path.suffix}")
+    try:
+        subprocess.run(
+            [
+                ffmpeg,
+                "-v",
+                "error",
+                "-y",
+                "-i",
+                str(path),
+                "-map",
+                "0",
+                "-c",
+                "copy",
+                *audio_options,
+                "-id3v2_version",
+                "3",
+                "-metadata",
+                f"REPLAYGAIN_TRACK_GAIN={result.gain:+.2f} dB",
+                "-metadata",
+                f"REPLAYGAIN_TRACK_PEAK={result.peak:.6f}",
+                str(temp_path),
+            ],
+            capture_output=True,
+            check=True,
+            timeout=_DECODE_TIMEOUT,
+        )
+        temp_path.replace(path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+    return result
+
+
+def _loudness(
+    power: npt.NDArray[np.float64] | np.float64,
+) -> npt.NDArray[np.float64]:
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(power)
@@ -1,20 +1,42 @@
+from __future__ import annotations
+
 import argparse
 import asyncio
+import dataclasses
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from importlib.metadata import version
 from pathlib import Path
-from typing import Final
+from typing import TYPE_CHECKING, Any, Final
 
 from rich.logging import RichHandler
 
+from usdb_downloader.analyzer import PreviewAnalyzer
+from usdb_downloader.api import Downloader
 from usdb_downloader.app import App
-from usdb_downloader.console import Console
+from usdb_downloader.bandwidth import BandwidthLimiter, BandwidthWindow, parse_rate
+from usdb_downloader.console import Console, OutputMode, create_console
+from usdb_downloader.layout import Layout
+from usdb_downloader.load_harness import LoadHarness, LoadProfile
+from usdb_downloader.profiler import Profiler
+from usdb_downloader.proxy_pool import Proxy, ProxyPool
+from usdb_downloader.replaygain import ReplayGainTagger
+from usdb_downloader.server import JobServer
+from usdb_downloader.shard import Shard
+from usdb_downloader.youtube_downloader import YoutubeDownloader
+
+if TYPE_CHECKING:
+    from collections.abc import Coroutine
+
+    from usdb_downloader.models import Summary
 
 logger = logging.getLogger(__name__)
 
 _INPUT_DIR: Final[Path] = Path(os.getenv("INPUT_DIR", "./songs/input"))
 _OUTPUT_DIR: Final[Path] = Path(os.getenv("OUTPUT_DIR", "./songs/output"))
+_OUTPUT_LAYOUT: Final[str] = os.getenv("OUTPUT_LAYOUT", Layout.FLAT)
+_PROXIES: Final[list[str]] = os.getenv("PROXIES", "").split()
 _app_version: Final[str] = version("usdb-downloader")
 
 
@@ -30,6 +52,75 @@ def _setup_logging(verbose: bool) -> None:
         logging.disable(logging.CRITICAL)
 
 
+def _parse_shard(value: str) -> Shard:
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def _parse_count(value: str) -> int:
+    count = int(value)
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"Count must be positive, got {count}")
+    return count
+
+
+def _parse_seconds(value: str) -> float:
+    seconds = float(value)
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError(f"Seconds must be positive, got {value}")
+    return seconds
+
+
+def _parse_proxy(value: str) -> str:
+    try:
+        Proxy.parse(value, concurrency=1)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+    return value
+
+
+def _parse_rate(value: str) -> float:
+    try:
+        return parse_rate(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def _parse_window(value: str) -> BandwidthWindow:
+    try:
+        return BandwidthWindow.parse(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+
+
+def _parse_counts(value: str) -> list[int]:
+    try:
+        return [_parse_count(count) for count in value.split(",")]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            f"Counts must be comma-separated numbers like 1,2,4, got {value!r}"
+        ) from e
+
+
+def _parse_rate_fraction(value: str) -> float:
+    rate = float(value)
+    if not 0 <= rate <= 1:
+        raise argparse.ArgumentTypeError(f"Rate must be between 0 and 1, got {value}")
+    return rate
+
+
+def _parse_layout(value: str) -> Layout:
+    try:
+        return Layout(value)
+    except ValueError as e:
+        choices = ", ".join(Layout)
+        raise argparse.ArgumentTypeError(
+            f"Layout must be one of {choices}, got {value!r}"
+        ) from e
+
+
 def _parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="USDB Downloader CLI")
     parser.add_argument(
@@ -38,6 +129,118 @@ def _parse_args() -> argparse.Namespace:
         action="store_true",
         help="Enable verbose logging",
     )
+    parser.add_argument(
+        "--shard",
+        type=_parse_shard,
+        metavar="i/N",
+        help="Only process songs in shard i of N, partitioned by video id",
+    )
+    parser.add_argument(
+        "--workers",
+        type=_parse_count,
+        default=1,
+        help="Number of worker processes pulling songs from the job queue",
+    )
+    parser.add_argument(
+        "--video-concurrency",
+        type=_parse_count,
+        default=2,
+        metavar="N",
+        help="Number of videos downloaded in the background of each worker",
+    )
+    parser.add_argument(
+        "--download-timeout",
+        type=_parse_seconds,
+        metavar="SECONDS",
+        help="Abort an audio or video download that takes longer than this",
+    )
+    parser.add_argument(
+        "--stall-timeout",
+        type=_parse_seconds,
+        default=120.0,
+        metavar="SECONDS",
+        help="Abort an audio or video download without progress for this long",
+    )
+    parser.add_argument(
+        "--proxy",
+        dest="proxies",
+        action="append",
+        type=_parse_proxy,
+        metavar="URL[#N]",
+        help="Egress proxy for downloads, at most N downloads at once, repeatable",
+    )
+    parser.add_argument(
+        "--proxy-concurrency",
+        type=_parse_count,
+        default=2,
+        metavar="N",
+        help="Number of downloads at once through a proxy without its own limit",
+    )
+    parser.add_argument(
+        "--proxy-cooldown",
+        type=_parse_seconds,
+        default=300.0,
+        metavar="SECONDS",
+        help="Time a failing or slow proxy is taken out of rotation",
+    )
+    parser.add_argument(
+        "--bandwidth",
+        type=_parse_rate,
+        metavar="RATE",
+        help="Total download bandwidth in bytes per second, e.g. 2M",
+    )
+    parser.add_argument(
+        "--bandwidth-schedule",
+        dest="bandwidth_schedule",
+        action="append",
+        type=_parse_window,
+        default=[],
+        metavar="HH:MM-HH:MM=RATE",
+        help="Total download bandwidth during a time of day, repeatable",
+    )
+    parser.add_argument(
+        "--detect-previews",
+        action="store_true",
+        help="Detect #PREVIEWSTART from the chorus of the downloaded audio",
+    )
+    parser.add_argument(
+        "--detect-medleys",
+        action="store_true",
+        help="Also detect #MEDLEYSTARTBEAT and #MEDLEYENDBEAT, implies previews",
+    )
+    parser.add_argument(
+        "--replaygain",
+        action="store_true",
+        help="Measure the loudness of downloaded audio and write ReplayGain tags",
+    )
+    parser.add_argument(
+        "--normalize-loudness",
+        action="store_true",
+        help="Also re-encode the audio at -18 LUFS, implies --replaygain",
+    )
+    parser.add_argument(
+        "--layout",
+        type=_parse_layout,
+        default=_OUTPUT_LAYOUT,
+        help=f"Layout of the song folders in the output directory: {', '.join(Layout)}",
+    )
+    parser.add_argument(
+        "--allow-duplicates",
+        action="store_true",
+        help="Download songs even if the library already has them under another name",
+    )
+    parser.add_argument(
+        "--output",
+        type=OutputMode,
+        choices=list(OutputMode),
+        default=OutputMode.AUTO,
+        help="Console output, auto picks json when stdout is not a terminal",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Profile all threads and the event loop lag into the output directory",
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -45,27 +248,343 @@ def _parse_args() -> argparse.Namespace:
         help="Show version information",
     )
 
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("status", help="Show the progress of the job queue")
+    search_parser = subparsers.add_parser(
+        "search",
+        help="Search the song library by name, artist or title",
+    )
+    search_parser.add_argument("query", help="Words to search for")
+    subparsers.add_parser(
+        "verify",
+        help="Verify the media of the song library and requeue broken songs",
+    )
+    subparsers.add_parser(
+        "migrate",
+        help="Move the songs of the output directory into the configured layout",
+    )
+    rewrite_parser = subparsers.add_parser(
+        "rewrite",
+        help="Rewrite the song files of the library without touching any media",
+    )
+    rewrite_parser.add_argument(
+        "--processes",
+        type=_parse_count,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="Number of processes parsing and writing song files",
+    )
+    reconcile_parser = subparsers.add_parser(
+        "reconcile",
+        help="Rewrite changed song files and remove songs missing from the input",
+    )
+    reconcile_parser.add_argument(
+        "--processes",
+        type=_parse_count,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="Number of processes parsing and writing song files",
+    )
+    reconcile_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="List orphaned song folders instead of removing them",
+    )
+    replaygain_parser = subparsers.add_parser(
+        "replaygain",
+        help="Measure the loudness of the library and write ReplayGain tags",
+    )
+    replaygain_parser.add_argument(
+        "--processes",
+        type=_parse_count,
+        default=os.cpu_count() or 1,
+        metavar="N",
+        help="Number of processes measuring loudness",
+    )
+    load_parser = subparsers.add_parser(
+        "loadtest",
+        help="Measure how the pipeline scales with a simulated YouTube",
+    )
+    load_parser.add_argument(
+        "--songs",
+        type=_parse_count,
+        default=200,
+        help="Number of synthetic songs downloaded per worker count",
+    )
+    load_parser.add_argument(
+        "--worker-counts",
+        type=_parse_counts,
+        default=[1, 2, 4, 8, 16],
+        metavar="N,N,...",
+        help="Worker counts to measure",
+    )
+    load_parser.add_argument(
+        "--latency",
+        type=_parse_seconds,
+        default=0.2,
+        metavar="SECONDS",
+        help="Median latency of a simulated download",
+    )
+    load_parser.add_argument(
+        "--throttle-rate",
+        type=_parse_rate_fraction,
+        default=0.0,
+        metavar="RATE",
+        help="Share of simulated downloads rejected with HTTP 429",
+    )
+    load_parser.add_argument(
+        "--failure-rate",
+        type=_parse_rate_fraction,
+        default=0.0,
+        metavar="RATE",
+        help="Share of simulated downloads failing with a connection error",
+    )
+    load_parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the simulated latencies and failures",
+    )
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Accept song uploads over a local HTTP API",
+    )
+    serve_parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Address the HTTP API listens on",
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        default=8080,
+        help="Port the HTTP API listens on",
+    )
+    serve_parser.add_argument(
+        "--queue-size",
+        type=_parse_count,
+        default=64,
+        metavar="N",
+        help="Number of uploads waiting for download before new ones are rejected",
+    )
+
     return parser.parse_args()
 
 
+def _create_proxy_pool(args: argparse.Namespace) -> ProxyPool | None:
+    proxies = args.proxies or [_parse_proxy(proxy) for proxy in _PROXIES]
+    if not proxies:
+        return None
+    return ProxyPool(
+        proxies,
+        concurrency=args.proxy_concurrency,
+        cooldown=args.proxy_cooldown,
+    )
+
+
+def _create_bandwidth_limiter(args: argparse.Namespace) -> BandwidthLimiter:
+    # Every worker process gets an equal share of the total bandwidth.
+    return BandwidthLimiter(
+        rate=args.bandwidth / args.workers if args.bandwidth else None,
+        schedule=[
+            dataclasses.replace(window, rate=window.rate / args.workers)
+            for window in args.bandwidth_schedule
+        ],
+    )
+
+
+def _create_analyzer(args: argparse.Namespace) -> PreviewAnalyzer | None:
+    if not (args.detect_previews or args.detect_medleys):
+        return None
+    return PreviewAnalyzer(medley=args.detect_medleys)
+
+
+def _create_tagger(args: argparse.Namespace) -> ReplayGainTagger | None:
+    if args.command == "replaygain":
+        return ReplayGainTagger(
+            workers=args.processes,
+            normalize=args.normalize_loudness,
+        )
+    if not (args.replaygain or args.normalize_loudness):
+        return None
+    return ReplayGainTagger(normalize=args.normalize_loudness)
+
+
+def _create_app(
+    input_dir: Path,
+    output_dir: Path,
+    console: Console,
+    args: argparse.Namespace,
+) -> App:
+    return App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=console,
+        shard=args.shard,
+        youtube_downloader=YoutubeDownloader(
+            deadline=args.download_timeout,
+            stall_timeout=args.stall_timeout,
+            proxy_pool=_create_proxy_pool(args),
+            bandwidth_limiter=_create_bandwidth_limiter(args),
+        ),
+        allow_duplicates=args.allow_duplicates,
+        layout=args.layout,
+        analyzer=_create_analyzer(args),
+        tagger=_create_tagger(args),
+        video_concurrency=args.video_concurrency,
+    )
+
+
+def _work(input_dir: Path, output_dir: Path, args: argparse.Namespace) -> Summary:
+    _setup_logging(args.verbose)
+    app = _create_app(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=create_console(not args.verbose, live=False, mode=args.output),
+        args=args,
+    )
+    try:
+        return _run_async(app.work(), args, name=f"worker-{os.getpid()}")
+    finally:
+        app.close()
+
+
+def _run_async[T](
+    coroutine: Coroutine[Any, Any, T],
+    args: argparse.Namespace,
+    name: str,
+) -> T:
+    if args.profile_dir is None:
+        return asyncio.run(coroutine)
+    return asyncio.run(Profiler(args.profile_dir, name).run(coroutine))
+
+
+async def _serve(console: Console, args: argparse.Namespace) -> None:
+    async with Downloader(
+        input_dir=_INPUT_DIR,
+        output_dir=_OUTPUT_DIR,
+        layout=args.layout,
+        allow_duplicates=args.allow_duplicates,
+        video_concurrency=args.video_concurrency,
+        download_timeout=args.download_timeout,
+        stall_timeout=args.stall_timeout,
+        proxy_pool=_create_proxy_pool(args),
+        bandwidth_limiter=_create_bandwidth_limiter(args),
+        analyzer=_create_analyzer(args),
+        tagger=_create_tagger(args),
+    ) as downloader:
+        server = JobServer(
+            downloader=downloader,
+            spool_dir=_OUTPUT_DIR / App.STATE_DIR_NAME / "uploads",
+            host=args.host,
+            port=args.port,
+            queue_size=args.queue_size,
+        )
+        await server.start()
+        console.print_server_start(server.url)
+        await server.serve_forever()
+
+
+def _load_test(console: Console, args: argparse.Namespace) -> None:
+    harness = LoadHarness(
+        songs=args.songs,
+        profile=LoadProfile(
+            download_latency=args.latency,
+            throttle_rate=args.throttle_rate,
+            failure_rate=args.failure_rate,
+        ),
+        worker_counts=args.worker_counts,
+        seed=args.seed,
+    )
+    reports = harness.run()
+    console.print_load_reports(reports)
+    if any(report.problems for report in reports):
+        console.print_failure("Songs were lost or counted twice")
+        raise SystemExit(1)
+
+
+def _run(app: App, console: Console, args: argparse.Namespace) -> None:
+    if args.workers == 1:
+        _run_async(app.run(), args, name="main")
+        return
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        # Workers start right away and download songs while the input is
+        # still being enqueued.
+        with app.scanning():
+            futures = [
+                pool.submit(_work, _INPUT_DIR, _OUTPUT_DIR, args)
+                for _ in range(args.workers)
+            ]
+            pending = app.enqueue()
+        summaries = [future.result() for future in futures]
+
+    if not pending:
+        return
+
+    console.print_summary(
+        processed=sum(summary.processed for summary in summaries),
+        failed=sum(summary.failed for summary in summaries),
+        skipped=sum(summary.skipped for summary in summaries),
+    )
+
+
+def _run_command(console: Console, args: argparse.Namespace) -> None:
+    app = _create_app(
+        input_dir=_INPUT_DIR,
+        output_dir=_OUTPUT_DIR,
+        console=console,
+        args=args,
+    )
+    try:
+        match args.command:
+            case "status":
+                app.status()
+            case "search":
+                app.search(args.query)
+            case "verify":
+                _run_async(app.verify(), args, name="verify")
+            case "migrate":
+                app.migrate()
+            case "rewrite":
+                app.rewrite(args.processes)
+            case "reconcile":
+                app.reconcile(args.processes, dry_run=args.dry_run)
+            case "replaygain":
+                app.replaygain()
+            case _:
+                _run(app, console, args)
+                if args.profile_dir is not None:
+                    console.print_profile(args.profile_dir)
+    finally:
+        app.close()
+
+
 def main() -> None:
     args = _parse_args()
+    args.profile_dir = (
+        Profiler.create_run_dir(_OUTPUT_DIR / App.STATE_DIR_NAME / "profiles")
+        if args.profile
+        else None
+    )
     _setup_logging(args.verbose)
-    console = Console(not args.verbose)
+    console = create_console(not args.verbose, mode=args.output)
 
     try:
         console.print_header(
             input_dir=_INPUT_DIR,
             output_dir=_OUTPUT_DIR,
             app_version=_app_version,
+            shard=args.shard,
         )
-        asyncio.run(
-            App(
-                input_dir=_INPUT_DIR,
-                output_dir=_OUTPUT_DIR,
-                console=console,
-            ).run()
-        )
+        match args.command:
+            case "loadtest":
+                _load_test(console, args)
+            case "serve":
+                # The downloader of the server holds the only app.
+                _run_async(_serve(console, args), args, name="serve")
+            case _:
+                _run_command(console, args)
     except KeyboardInterrupt:
         console.print_interrupt()
         logger.info("Interrupted by user")
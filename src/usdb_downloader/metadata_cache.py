@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Final
+
+from usdb_downloader.models import VideoInfo
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class MetadataCache:
+    _DEFAULT_TTL: Final[float] = 24 * 60 * 60
+    # Videos can come back, e.g. when made public again, so unavailability
+    # expires sooner.
+    _DEFAULT_UNAVAILABLE_TTL: Final[float] = 60 * 60
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        ttl: float = _DEFAULT_TTL,
+        unavailable_ttl: float = _DEFAULT_UNAVAILABLE_TTL,
+    ) -> None:
+        self._cache_dir = cache_dir
+        self._ttl = ttl
+        self._unavailable_ttl = unavailable_ttl
+
+    def get(self, video_id: str) -> VideoInfo | None:
+        path = self._cache_path(video_id)
+        try:
+            data: dict[str, Any] = json.loads(path.read_text(encoding="utf-8"))
+            resolved_at = float(data.pop("resolved_at"))
+            info = VideoInfo(**data)
+        except FileNotFoundError:
+            return None
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Ignoring corrupt metadata cache entry %s: %s", path, e)
+            return None
+
+        ttl = self._ttl if info.available else self._unavailable_ttl
+        if time.time() - resolved_at > ttl:
+            logger.info("Metadata cache entry for %s expired", video_id)
+            return None
+
+        logger.info("Metadata cache hit for %s", video_id)
+        return info
+
+    def put(self, info: VideoInfo) -> None:
+        self._cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._cache_path(info.video_id)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        data = {**dataclasses.asdict(info), "resolved_at": time.time()}
+        tmp_path.write_text(json.dumps(data), encoding="utf-8")
+        # Atomic, so concurrent workers never read a partially written entry.
+        tmp_path.replace(path)
+
+    def _cache_path(self, video_id: str) -> Path:
+        return self._cache_dir / f"{video_id}.json"
@@ -1,4 +1,63 @@
-from dataclasses import dataclass, field
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field, replace
+from enum import StrEnum
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Mapping
+
+    from usdb_downloader.notes import Notes
+
+logger = logging.getLogger(__name__)
+
+
+def parse_header(line: str) -> tuple[str, str]:
+    # Header names are case-insensitive, so they are stored upper case, the way
+    # they are looked up everywhere else.
+    key, _, value = line.removeprefix("#").partition(":")
+    return key.strip().upper(), value.strip()
+
+
+class SongSource(StrEnum):
+    # Songs of the API and of server uploads have no song file in the input
+    # directory, so reconciling with it must not remove them.
+    INPUT = "input"
+    API = "api"
+
+
+@dataclass(frozen=True)
+class Timing:
+    bpm: float
+    gap: float = 0.0
+    relative: bool = False
+
+    @classmethod
+    def from_headers(cls, headers: Mapping[str, str]) -> Timing | None:
+        if "BPM" not in headers:
+            return None
+        try:
+            bpm = float(headers["BPM"].replace(",", "."))
+            gap = float(headers.get("GAP", "0").replace(",", ".") or 0)
+        except ValueError as e:
+            logger.warning("Invalid #BPM or #GAP header: %s", e)
+            return None
+        if bpm <= 0:
+            return None
+        return cls(
+            bpm=bpm,
+            gap=gap,
+            relative=headers.get("RELATIVE", "").strip().lower() == "yes",
+        )
+
+    def seconds(self, beat: float) -> float:
+        # UltraStar beats are quarter beats of the #BPM header, #GAP is in ms.
+        return self.gap / 1000 + beat * 60 / (self.bpm * 4)
+
+    def beat(self, seconds: float) -> float:
+        return (seconds - self.gap / 1000) * self.bpm * 4 / 60
 
 
 @dataclass(frozen=True)
@@ -7,3 +66,33 @@ class File:
     video_id: str
     headers: dict[str, str] = field(default_factory=dict[str, str])
     lyrics: list[str] = field(default_factory=list[str])
+
+    @cached_property
+    def notes(self) -> Notes:
+        from usdb_downloader.notes import Notes
+
+        return Notes.from_lines(self.lyrics)
+
+    @cached_property
+    def timing(self) -> Timing | None:
+        return Timing.from_headers(self.headers)
+
+    def with_notes(self, notes: Notes) -> File:
+        return replace(self, lyrics=notes.to_lines())
+
+
+@dataclass
+class Summary:
+    processed: int = 0
+    failed: int = 0
+    skipped: int = 0
+
+
+@dataclass(frozen=True)
+class VideoInfo:
+    video_id: str
+    available: bool
+    duration: float | None = None
+    audio_format: str | None = None
+    video_format: str | None = None
+    error: str | None = None
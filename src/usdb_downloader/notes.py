@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import TYPE_CHECKING, Final
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "The note model requires numpy, install usdb-downloader[analysis]"
+    ) from e
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    import numpy.typing as npt
+
+    from usdb_downloader.models import Timing
+
+
+class NoteType(IntEnum):
+    RAW = 0
+    NORMAL = ord(":")
+    GOLDEN = ord("*")
+    FREESTYLE = ord("F")
+    RAP = ord("R")
+    RAP_GOLDEN = ord("G")
+    LINE_BREAK = ord("-")
+    PLAYER = ord("P")
+    END = ord("E")
+
+
+_NOTE_TYPES: Final[tuple[NoteType, ...]] = (
+    NoteType.NORMAL,
+    NoteType.GOLDEN,
+    NoteType.FREESTYLE,
+    NoteType.RAP,
+    NoteType.RAP_GOLDEN,
+)
+_PLAYER_PATTERN: Final[re.Pattern[str]] = re.compile(r"P\s*(\d+)\s*")
+_NO_BEAT: Final[int] = -1
+
+
+# Every body line is one event. Lines that cannot be reproduced exactly from
+# their columns are kept verbatim as RAW events, which keeps to_lines lossless.
+@dataclass(frozen=True, eq=False)
+class Notes:
+    types: npt.NDArray[np.uint8]
+    starts: npt.NDArray[np.int32]
+    lengths: npt.NDArray[np.int32]
+    pitches: npt.NDArray[np.int32]
+    players: npt.NDArray[np.uint8]
+    texts: tuple[str, ...]
+
+    @classmethod
+    def from_lines(cls, lines: Iterable[str]) -> Notes:
+        types: list[int] = []
+        starts: list[int] = []
+        lengths: list[int] = []
+        pitches: list[int] = []
+        players: list[int] = []
+        texts: list[str] = []
+        player = 0
+
+        for line in lines:
+            note_type, start, length, pitch, text = cls._parse_line(line)
+            if note_type == NoteType.PLAYER:
+                player = start
+            types.append(note_type)
+            starts.append(start)
+            lengths.append(length)
+            pitches.append(pitch)
+            players.append(player)
+            texts.append(text)
+
+        return cls(
+            types=np.array(types, dtype=np.uint8),
+            starts=np.array(starts, dtype=np.int32),
+            lengths=np.array(lengths, dtype=np.int32),
+            pitches=np.array(pitches, dtype=np.int32),
+            players=np.array(players, dtype=np.uint8),
+            texts=tuple(texts),
+        )
+
+    def to_lines(self) -> list[str]:
+        lines: list[str] = []
+        for note_type, start, length, pitch, text in zip(
+            self.types.tolist(),
+            self.starts.tolist(),
+            self.lengths.tolist(),
+            self.pitches.tolist(),
+            self.texts,
+            strict=True,
+        ):
+            match note_type:
+                case NoteType.LINE_BREAK if length == _NO_BEAT:
+                    lines.append(f"- {start}")
+                case NoteType.LINE_BREAK:
+                    lines.append(f"- {start} {length}")
+                case NoteType.END:
+                    lines.append("E")
+                case NoteType.RAW | NoteType.PLAYER:
+                    lines.append(text)
+                case _:
+                    lines.append(f"{chr(note_type)} {start} {length} {pitch} {text}")
+
+        return lines
+
+    @property
+    def note_mask(self) -> npt.NDArray[np.bool_]:
+        return np.isin(self.types, _NOTE_TYPES)
+
+    @property
+    def last_beat(self) -> int:
+        mask = self.note_mask
+        if not mask.any():
+            return 0
+        return int((self.starts[mask] + self.lengths[mask]).max())
+
+    @property
+    def pitch_range(self) -> tuple[int, int] | None:
+        pitches = self.pitches[self.note_mask]
+        if pitches.size == 0:
+            return None
+        return int(pitches.min()), int(pitches.max())
+
+    def duration(self, timing: Timing) -> float:
+        notes = self.absolute() if timing.relative else self
+        return timing.seconds(notes.last_beat)
+
+    def absolute(self) -> Notes:
+        # Beats of #RELATIVE songs restart at every line break, at its second
+        # beat or, without one, at its only beat.
+        breaks = self.types == NoteType.LINE_BREAK
+        restarts = np.where(
+            breaks,
+            np.where(self.lengths != _NO_BEAT, self.lengths, self.starts),
+            0,
+        )
+        return self.shifted((np.cumsum(restarts) - restarts).astype(np.int32))
+
+    def shifted(self, beats: int | npt.NDArray[np.int32]) -> Notes:
+        timed = self.note_mask | (self.types == NoteType.LINE_BREAK)
+        starts = np.where(timed, self.starts + beats, self.starts)
+        has_end = (self.types == NoteType.LINE_BREAK) & (self.lengths != _NO_BEAT)
+        lengths = np.where(has_end, self.lengths + beats, self.lengths)
+        return self._replace(starts=starts, lengths=lengths)
+
+    def scaled(self, factor: float) -> Notes:
+        notes = self.note_mask
+        breaks = self.types == NoteType.LINE_BREAK
+        timed = notes | breaks
+        starts = np.where(timed, np.rint(self.starts * factor), self.starts)
+        scaled_lengths = np.where(
+            notes,
+            np.maximum(np.rint(self.lengths * factor), 1),
+            np.rint(self.lengths * factor),
+        )
+        has_length = notes | (breaks & (self.lengths != _NO_BEAT))
+        lengths = np.where(has_length, scaled_lengths, self.lengths)
+        return self._replace(
+            starts=starts.astype(np.int32),
+            lengths=lengths.astype(np.int32),
+        )
+
+    def validate(self) -> list[str]:
+        errors: list[tuple[int, str]] = []
+        mask = self.note_mask
+        indices = np.flatnonzero(mask)
+
+        errors.extend(
+            (idx, "note has non-positive length")
+            for idx in indices[self.lengths[mask] <= 0].tolist()
+        )
+        errors.extend(
+            (idx, "note starts before beat 0")
+            for idx in indices[self.starts[mask] < 0].tolist()
+        )
+
+        for player in np.unique(self.players[mask]).tolist():
+            player_indices = indices[self.players[indices] == player]
+            ends = self.starts[player_indices] + self.lengths[player_indices]
+            overlaps = self.starts[player_indices[1:]] < ends[:-1]
+            errors.extend(
+                (idx, "note overlaps the previous note")
+                for idx in player_indices[1:][overlaps].tolist()
+            )
+
+        return [f"Line {idx + 1}: {message}" for idx, message in sorted(errors)]
+
+    def _replace(
+        self,
+        starts: npt.NDArray[np.int32],
+        lengths: npt.NDArray[np.int32],
+    ) -> Notes:
+        return Notes(
+            types=self.types,
+            starts=starts,
+            lengths=lengths,
+            pitches=self.pitches,
+            players=self.players,
+            texts=self.texts,
+        )
+
+    @staticmethod
+    def _parse_line(line: str) -> tuple[int, int, int, int, str]:
+        raw = (NoteType.RAW, 0, 0, 0, line)
+        if not line:
+            return raw
+
+        try:
+            match line[0]:
+                case "E" if line == "E":
+                    return NoteType.END, 0, 0, 0, ""
+                case "P":
+                    match = _PLAYER_PATTERN.fullmatch(line)
+                    if match is None:
+                        return raw
+                    return NoteType.PLAYER, int(match.group(1)), 0, 0, line
+                case "-":
+                    _, *beats = line.split(" ")
+                    if len(beats) == 1 and line == f"- {int(beats[0])}":
+                        return NoteType.LINE_BREAK, int(beats[0]), _NO_BEAT, 0, ""
+                    if len(beats) == 2 and line == f"- {int(beats[0])} {int(beats[1])}":
+                        return NoteType.LINE_BREAK, int(beats[0]), int(beats[1]), 0, ""
+                    return raw
+                case char if ord(char) in _NOTE_TYPES:
+                    parts = line.split(" ", 4)
+                    if len(parts) != 5:
+                        return raw
+                    _, start, length, pitch, text = parts
+                    parsed = (ord(char), int(start), int(length), int(pitch), text)
+                    if line != f"{char} {parsed[1]} {parsed[2]} {parsed[3]} {text}":
+                        return raw
+                    return parsed
+                case _:
+                    return raw
+        except ValueError:
+            return raw
@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import codecs
 import logging
+import os
+import queue
 import re
+import threading
+import zipfile
+from dataclasses import replace
+from pathlib import Path, PurePosixPath
 from typing import TYPE_CHECKING, Final
 
-from usdb_downloader.models import File
+from usdb_downloader.layout import Layout
+from usdb_downloader.models import File, parse_header
 
 if TYPE_CHECKING:
     from collections.abc import Generator
-    from pathlib import Path
+
+    from usdb_downloader.catalog import Catalog
+    from usdb_downloader.shard import Shard
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
@@ -16,10 +26,42 @@ logger.addHandler(logging.NullHandler())
 
 class Parser:
     _ID_PATTERN: Final[re.Pattern[str]] = re.compile(r"(?:a=|v=)([A-Za-z0-9_-]{11})")
+    _ENCODING_PATTERN: Final[re.Pattern[bytes]] = re.compile(
+        rb"^[ \t]*#ENCODING[ \t]*:[ \t]*([A-Za-z0-9_-]+)",
+        re.MULTILINE | re.IGNORECASE,
+    )
+    _BOMS: Final[tuple[tuple[bytes, str], ...]] = (
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF32_LE, "utf-32"),
+        (codecs.BOM_UTF32_BE, "utf-32"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    )
+    _FALLBACK_ENCODING: Final[str] = "cp1252"
+    # Headers that are rewritten to point at the downloaded assets.
+    _REPLACED_HEADERS: Final[tuple[str, ...]] = ("MP3", "COVER", "VIDEO", "ENCODING")
+    # Headers detected from the downloaded audio, which the input files lack.
+    _DETECTED_HEADERS: Final[tuple[str, ...]] = (
+        "PREVIEWSTART",
+        "MEDLEYSTARTBEAT",
+        "MEDLEYENDBEAT",
+    )
+    _SCAN_BUFFER_SIZE: Final[int] = 256
+    _SCAN_POLL_INTERVAL: Final[float] = 0.1
 
-    def __init__(self, input_dir: Path, output_dir: Path) -> None:
+    def __init__(
+        self,
+        input_dir: Path,
+        output_dir: Path,
+        shard: Shard | None = None,
+        catalog: Catalog | None = None,
+        layout: Layout = Layout.FLAT,
+    ) -> None:
         self._input_dir = input_dir
         self._output_dir = output_dir
+        self._shard = shard
+        self._catalog = catalog
+        self._layout = layout
         logger.info(
             "Initialized parser with input directory %s and output directory %s",
             self._input_dir,
@@ -33,52 +75,234 @@ class Parser:
 
         logger.info("Start scanning input directory %s", self._input_dir)
 
+        # Scanning and parsing run in a background thread, so that songs are
+        # yielded while the rest of a large tree is still being walked.
+        buffer: queue.Queue[File | Exception | None] = queue.Queue(
+            maxsize=self._SCAN_BUFFER_SIZE
+        )
+        stop = threading.Event()
+        scanner = threading.Thread(
+            target=self._scan_into,
+            args=(buffer, stop),
+            name="usdb-scanner",
+            daemon=True,
+        )
+        scanner.start()
+
         count = 0
-        for path in self._input_dir.glob("*.txt"):
-            song = self._parse_file(path)
-            if song:
-                yield song
+        try:
+            while (item := buffer.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
                 count += 1
+        finally:
+            stop.set()
+            scanner.join()
 
         logger.info("Scanned %d file(s)", count)
 
-    def write_file(self, file: File) -> None:
-        output_file = self._output_dir / file.name / f"{file.name}.txt"
-        output_file.parent.mkdir(parents=True, exist_ok=True)
-        with output_file.open("w", encoding="utf-8") as f:
-            for key, value in file.headers.items():
-                f.write(f"#{key}:{value}\n")
-            f.writelines(f"{line}\n" for line in file.lyrics)
+    def iter_paths(self) -> Generator[Path]:
+        if not self._input_dir.exists():
+            logger.warning("Input directory %s is missing", self._input_dir)
+            return
+
+        yield from self._scan(self._input_dir)
 
-        logger.info(
-            "Wrote file %s to file %s",
-            file.name,
-            output_file,
-        )
+    def parse_path(self, path: Path) -> Generator[File | None]:
+        if path.suffix.lower() == ".zip":
+            yield from self._parse_archive(path)
+        else:
+            yield self._parse_file(path)
+
+    def song_dir(self, file: File) -> Path:
+        return self._layout.song_dir(self._output_dir, file.name, file.headers)
+
+    def write_file(self, file: File) -> bool:
+        output_file = self.song_dir(file) / f"{file.name}.txt"
+        file = self._keep_detected_headers(file, output_file)
+        content = self.render(file).encode("utf-8")
+
+        # Unchanged files keep their mtime, so that syncs and rescans of the
+        # library only pick up songs that actually changed.
+        written = not self._has_content(output_file, content)
+        if written:
+            output_file.parent.mkdir(parents=True, exist_ok=True)
+            output_file.write_bytes(content)
+            logger.info("Wrote file %s to file %s", file.name, output_file)
+        else:
+            logger.info("File %s is unchanged in file %s", file.name, output_file)
+
+        if self._catalog is not None:
+            self._catalog.record(file, output_file.parent)
+        return written
+
+    @staticmethod
+    def render(file: File) -> str:
+        headers = "".join(f"#{key}:{value}\n" for key, value in file.headers.items())
+        return headers + "".join(f"{line}\n" for line in file.lyrics)
+
+    def read_written_file(self, song_dir: Path, video_id: str) -> File:
+        name = song_dir.name
+        headers: dict[str, str] = {}
+        lyrics: list[str] = []
+        text = (song_dir / f"{name}.txt").read_text(encoding="utf-8")
+        for line in text.splitlines():
+            if line.startswith("#"):
+                key, value = parse_header(line)
+                headers[key] = value
+            elif line:
+                lyrics.append(line)
+
+        return File(name=name, video_id=video_id, headers=headers, lyrics=lyrics)
+
+    def _keep_detected_headers(self, file: File, path: Path) -> File:
+        missing = [key for key in self._DETECTED_HEADERS if key not in file.headers]
+        if not missing:
+            return file
+
+        detected: dict[str, str] = {}
+        try:
+            with path.open(encoding="utf-8") as f:
+                # Only the header block at the top of the file is read.
+                for line in f:
+                    if not line.startswith("#"):
+                        break
+                    key, value = parse_header(line.rstrip("\n"))
+                    if key in missing:
+                        detected[key] = value
+        except FileNotFoundError:
+            return file
+
+        if not detected:
+            return file
+        return replace(file, headers={**file.headers, **detected})
+
+    @staticmethod
+    def _has_content(path: Path, content: bytes) -> bool:
+        try:
+            # Comparing the size first avoids reading files that differ anyway.
+            return path.stat().st_size == len(content) and path.read_bytes() == content
+        except FileNotFoundError:
+            return False
+
+    def _scan_into(
+        self,
+        buffer: queue.Queue[File | Exception | None],
+        stop: threading.Event,
+    ) -> None:
+        try:
+            for song in self._iter_songs():
+                if not self._put(buffer, song, stop):
+                    return
+        except Exception as e:
+            self._put(buffer, e, stop)
+            return
+
+        self._put(buffer, None, stop)
+
+    def _put(
+        self,
+        buffer: queue.Queue[File | Exception | None],
+        item: File | Exception | None,
+        stop: threading.Event,
+    ) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=self._SCAN_POLL_INTERVAL)
+            except queue.Full:
+                continue
+            return True
+
+        return False
+
+    def _iter_songs(self) -> Generator[File]:
+        for path in self._scan(self._input_dir):
+            for song in self.parse_path(path):
+                if song is None:
+                    continue
+                if self._shard is not None and not self._shard.contains(song.video_id):
+                    logger.info(
+                        "Skipped file %s outside shard %s", song.name, self._shard
+                    )
+                    continue
+
+                yield song
+
+    @staticmethod
+    def _scan(directory: Path) -> Generator[Path]:
+        pending = [directory]
+        while pending:
+            current = pending.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.warning("Failed to scan directory %s: %s", current, e)
+                continue
+
+            subdirectories: list[Path] = []
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir():
+                    subdirectories.append(Path(entry.path))
+                elif entry.is_file() and entry.name.lower().endswith((".txt", ".zip")):
+                    yield Path(entry.path)
+
+            pending.extend(reversed(subdirectories))
+
+    def _parse_archive(self, path: Path) -> Generator[File | None]:
+        logger.info("Start reading archive %s", path)
+        try:
+            archive = zipfile.ZipFile(path)
+        except (zipfile.BadZipFile, OSError) as e:
+            logger.warning("Failed to read archive %s: %s", path, e)
+            return
+
+        with archive:
+            for info in archive.infolist():
+                if info.is_dir() or not info.filename.lower().endswith(".txt"):
+                    continue
+                # Encrypted members and unsupported compression methods only
+                # skip the member, not the archive or the whole scan.
+                try:
+                    data = archive.read(info)
+                except (
+                    zipfile.BadZipFile,
+                    RuntimeError,
+                    NotImplementedError,
+                    OSError,
+                ) as e:
+                    logger.warning(
+                        "Failed to read %s from archive %s: %s", info.filename, path, e
+                    )
+                    continue
+                yield self._parse_bytes(PurePosixPath(info.filename).stem, data)
 
     def _parse_file(self, path: Path) -> File | None:
-        name = path.stem
+        return self._parse_bytes(path.stem, path.read_bytes())
+
+    def _parse_bytes(self, name: str, data: bytes) -> File | None:
         video_id: str | None = None
         headers: dict[str, str] = {}
         lyrics: list[str] = []
 
         logger.info("Start parsing file %s", name)
 
-        with path.open("r", encoding="utf-8") as src:
-            for raw_line in src:
-                line = raw_line.rstrip("\n").lstrip()
+        for raw_line in self._decode(name, data).splitlines():
+            line = raw_line.lstrip()
+            if not line:
+                continue
+            if line[0] != "#":
+                lyrics.append(line)
+                continue
 
-                if not line or line.startswith(("#MP3", "#COVER")):
-                    continue
-
-                match line:
-                    case l if l.startswith("#VIDEO"):
-                        video_id = self._extract_video_id(l)
-                    case s if s.startswith("#"):
-                        key, _, value = s[1:].partition(":")
-                        headers[key.strip()] = value.strip()
-                    case _:
-                        lyrics.append(line)
+            key, value = parse_header(line)
+            if key == "VIDEO":
+                video_id = self._extract_video_id(value)
+            elif not key.startswith(self._REPLACED_HEADERS):
+                headers[key] = value
 
         if video_id is None:
             logger.warning("File %s is missing video id", name)
@@ -97,6 +321,31 @@ class Parser:
             lyrics=lyrics,
         )
 
+    @classmethod
+    def _decode(cls, name: str, data: bytes) -> str:
+        for bom, encoding in cls._BOMS:
+            if data.startswith(bom):
+                return data.decode(encoding)
+
+        # UTF-16 without a BOM still has a NUL byte next to every ASCII character.
+        if len(data) >= 2 and b"\x00" in data[:2]:
+            return data.decode("utf-16-le" if data[1] == 0 else "utf-16-be")
+
+        if match := cls._ENCODING_PATTERN.search(data):
+            encoding = match.group(1).decode("ascii")
+            try:
+                return data.decode(encoding)
+            except (LookupError, UnicodeDecodeError) as e:
+                logger.warning("File %s has invalid encoding %s: %s", name, encoding, e)
+
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            logger.info(
+                "File %s is not UTF-8, falling back to %s", name, cls._FALLBACK_ENCODING
+            )
+            return data.decode(cls._FALLBACK_ENCODING, errors="replace")
+
     @staticmethod
     def _extract_video_id(line: str) -> str | None:
         match = Parser._ID_PATTERN.search(line)
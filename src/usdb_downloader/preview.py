@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import subprocess
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Final, cast
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "Preview detection requires numpy, install usdb-downloader[analysis]"
+    ) from e
+
+from usdb_downloader.notes import NoteType
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    import numpy.typing as npt
+
+    from usdb_downloader.models import Timing
+    from usdb_downloader.notes import Notes
+
+SAMPLE_RATE: Final[int] = 11025
+_HOP_SECONDS: Final[float] = 0.5
+_BANDS: Final[int] = 24
+_MIN_FREQUENCY: Final[float] = 60.0
+# Quieter parts of a song, like intros and breaks, are never previewed.
+_MIN_ENERGY: Final[float] = 0.2
+# Only the start of long mixes is analysed, which bounds the similarity matrix.
+_MAX_SECONDS: Final[float] = 600.0
+_DECODE_TIMEOUT: Final[float] = 120.0
+
+
+@dataclass(frozen=True)
+class Preview:
+    start: float
+    end: float
+    repetition: float
+
+
+def decode_audio(ffmpeg: str, path: Path) -> npt.NDArray[np.float32]:
+    # The audio is decoded once, to mono at a low sample rate, which is plenty
+    # for energy and spectral envelopes.
+    result = subprocess.run(
+        [
+            ffmpeg,
+            "-v",
+            "error",
+            "-i",
+            str(path),
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-f",
+            "f32le",
+            "-",
+        ],
+        capture_output=True,
+        check=True,
+        timeout=_DECODE_TIMEOUT,
+    )
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+def detect_preview(
+    samples: npt.NDArray[np.float32],
+    rate: int = SAMPLE_RATE,
+    length: float = 15.0,
+) -> Preview | None:
+    samples = samples[: int(_MAX_SECONDS * rate)]
+    hop = int(rate * _HOP_SECONDS)
+    frames = len(samples) // hop
+    window = max(int(length / _HOP_SECONDS), 1)
+    if frames < window:
+        return None
+
+    framed = samples[: frames * hop].reshape(frames, hop).astype(np.float64)
+    energy = _moving_mean(np.sqrt(np.mean(framed**2, axis=1)), window)
+    if energy.max() <= 0:
+        return None
+    energy /= energy.max()
+
+    repetition = _repetition(_band_envelopes(framed, rate), window)
+    score = np.where(energy >= _MIN_ENERGY, repetition * energy, 0)
+    if score.max() <= 0:
+        # Without any repeated part, the loudest part is the best guess.
+        score = energy
+
+    start = int(np.argmax(score))
+    return Preview(
+        start=start * _HOP_SECONDS,
+        end=(start + window) * _HOP_SECONDS,
+        repetition=float(repetition[start]),
+    )
+
+
+def medley_beats(
+    notes: Notes,
+    timing: Timing,
+    start: float,
+    end: float,
+) -> tuple[int, int] | None:
+    mask = notes.note_mask
+    if not mask.any():
+        return None
+
+    # Medleys have to start and end on whole lines of the lyrics.
+    note_indices = np.flatnonzero(mask)
+    breaks = np.flatnonzero(notes.types == NoteType.LINE_BREAK)
+    firsts = np.searchsorted(note_indices, np.concatenate(([0], breaks)))
+    lasts = np.searchsorted(note_indices, np.concatenate((breaks, [len(notes.types)])))
+    lines = firsts < lasts
+    line_starts = notes.starts[note_indices[firsts[lines]]]
+    last_notes = note_indices[lasts[lines] - 1]
+    line_ends = notes.starts[last_notes] + notes.lengths[last_notes]
+
+    start_beat = timing.beat(start)
+    end_beat = timing.beat(end)
+    first = int(np.argmin(np.abs(line_starts - start_beat)))
+    last = first + int(np.argmin(np.abs(line_ends[first:] - end_beat)))
+    return int(line_starts[first]), int(line_ends[last])
+
+
+def _band_envelopes(
+    framed: npt.NDArray[np.float64],
+    rate: int,
+) -> npt.NDArray[np.float64]:
+    hop = framed.shape[1]
+    spectrum = np.abs(np.fft.rfft(framed * np.hanning(hop), axis=1))
+    frequencies = np.fft.rfftfreq(hop, 1 / rate)
+    edges = np.geomspace(_MIN_FREQUENCY, rate / 2, _BANDS + 1)
+    bands = np.digitize(frequencies, edges) - 1
+    # Summing the FFT bins into log-spaced bands is a single matrix product.
+    weights = (bands[:, None] == np.arange(_BANDS)[None, :]).astype(np.float64)
+    envelopes = np.log1p(spectrum @ weights)
+
+    envelopes -= envelopes.mean(axis=1, keepdims=True)
+    norms = cast(
+        "npt.NDArray[np.float64]",
+        np.linalg.norm(envelopes, axis=1, keepdims=True),
+    )
+    return envelopes / np.where(norms > 0, norms, 1)
+
+
+def _repetition(
+    envelopes: npt.NDArray[np.float64],
+    window: int,
+) -> npt.NDArray[np.float64]:
+    frames = len(envelopes)
+    similarity = envelopes @ envelopes.T
+
+    # lagged[k, t] is the similarity of frame t and frame t + k, so a chorus
+    # repeated k frames later is a run of high values in row k.
+    lags = np.arange(frames)[:, None]
+    times = np.arange(frames)[None, :]
+    later = lags + times
+    lagged = np.where(
+        later < frames,
+        similarity[times, np.minimum(later, frames - 1)],
+        np.nan,
+    )
+    # Only lags of at least one window count, a segment does not repeat itself.
+    runs = np.nan_to_num(_moving_mean(lagged[window:], window), nan=-np.inf)
+    if runs.size == 0:
+        return np.zeros(frames - window + 1)
+
+    # A segment repeats either later in the song, or earlier at t - k.
+    starts = cast("npt.NDArray[np.intp]", np.arange(runs.shape[1])[None, :])
+    earlier = starts - np.arange(window, frames)[:, None]
+    repeated_earlier = np.where(
+        earlier >= 0,
+        runs[np.arange(len(runs))[:, None], np.maximum(earlier, 0)],
+        -np.inf,
+    )
+    scores = np.maximum(runs.max(axis=0), repeated_earlier.max(axis=0))
+    return np.maximum(scores, 0.0)
+
+
+def _moving_mean(
+    values: npt.NDArray[np.float64],
+    window: int,
+) -> npt.NDArray[np.float64]:
+    # Means run along the last axis, NaN marks frames past the end of the song.
+    sums = np.cumsum(values, axis=-1)
+    sums = np.concatenate((np.zeros((*sums.shape[:-1], 1)), sums), axis=-1)
+    return (sums[..., window:] - sums[..., :-window]) / window
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Awaitable
+    from types import FrameType
+
+logger = logging.getLogger(__name__)
+
+
+class Profiler:
+    _DEFAULT_SAMPLE_INTERVAL: Final[float] = 0.01
+    _DEFAULT_LAG_INTERVAL: Final[float] = 0.05
+
+    def __init__(
+        self,
+        profile_dir: Path,
+        name: str,
+        sample_interval: float = _DEFAULT_SAMPLE_INTERVAL,
+        lag_interval: float = _DEFAULT_LAG_INTERVAL,
+    ) -> None:
+        self._profile_dir = profile_dir
+        self._name = name
+        self._sample_interval = sample_interval
+        self._lag_interval = lag_interval
+        self._stacks: Counter[str] = Counter()
+        self._lags: list[float] = []
+        self._stop = threading.Event()
+
+    @staticmethod
+    def create_run_dir(base_dir: Path) -> Path:
+        return base_dir / time.strftime("%Y%m%d-%H%M%S")
+
+    @property
+    def stacks_path(self) -> Path:
+        return self._profile_dir / f"{self._name}.collapsed"
+
+    @property
+    def lag_path(self) -> Path:
+        return self._profile_dir / f"{self._name}.loop-lag.txt"
+
+    async def run[T](self, awaitable: Awaitable[T]) -> T:
+        sampler = threading.Thread(
+            target=self._sample,
+            name="usdb-profiler",
+            daemon=True,
+        )
+        sampler.start()
+        lag_monitor = asyncio.create_task(self._monitor_loop_lag())
+        logger.info("Started profiling into %s", self._profile_dir)
+
+        try:
+            return await awaitable
+        finally:
+            lag_monitor.cancel()
+            self._stop.set()
+            sampler.join()
+            self._write()
+
+    def _sample(self) -> None:
+        # Wall-clock sampling of every thread, including the asyncio.to_thread
+        # workers that run yt-dlp and FFmpeg, which cProfile does not see.
+        own_ident = threading.get_ident()
+        while not self._stop.wait(self._sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own_ident:
+                    continue
+                thread_name = names.get(ident, f"thread-{ident}")
+                self._stacks[self._collapse(thread_name, frame)] += 1
+
+    async def _monitor_loop_lag(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self._lag_interval
+            await asyncio.sleep(self._lag_interval)
+            self._lags.append(max(loop.time() - expected, 0.0))
+
+    def _write(self) -> None:
+        self._profile_dir.mkdir(parents=True, exist_ok=True)
+        with self.stacks_path.open("w", encoding="utf-8") as f:
+            f.writelines(
+                f"{stack} {count}\n" for stack, count in self._stacks.most_common()
+            )
+
+        self.lag_path.write_text(self._summarize_lags(), encoding="utf-8")
+        logger.info("Wrote profile to %s", self._profile_dir)
+
+    def _summarize_lags(self) -> str:
+        if not self._lags:
+            return "samples: 0\n"
+
+        lags_ms = sorted(lag * 1000 for lag in self._lags)
+
+        def percentile(p: float) -> float:
+            return lags_ms[min(len(lags_ms) - 1, int(p * len(lags_ms)))]
+
+        return (
+            f"samples: {len(lags_ms)}\n"
+            f"interval_ms: {self._lag_interval * 1000:g}\n"
+            f"mean_ms: {statistics.fmean(lags_ms):.3f}\n"
+            f"p50_ms: {percentile(0.50):.3f}\n"
+            f"p95_ms: {percentile(0.95):.3f}\n"
+            f"p99_ms: {percentile(0.99):.3f}\n"
+            f"max_ms: {lags_ms[-1]:.3f}\n"
+        )
+
+    @staticmethod
+    def _collapse(thread_name: str, frame: FrameType | None) -> str:
+        frames: list[str] = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append(
+                f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+            )
+            frame = frame.f_back
+
+        frames.append(thread_name)
+        # The collapsed format separates frames with ';'.
+        return ";".join(part.replace(";", ":") for part in reversed(frames))
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Final
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator, Callable, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Proxy:
+    url: str
+    concurrency: int
+    active: int = 0
+    failures: int = 0
+    latency: float | None = None
+    cooldown_until: float = 0.0
+
+    @classmethod
+    def parse(cls, value: str, concurrency: int) -> Proxy:
+        # The concurrency of a single proxy can be set with a fragment, e.g.
+        # http://proxy:3128#4, as fragments have no meaning for proxy URLs.
+        url, _, fragment = value.strip().partition("#")
+        parts = urlsplit(url)
+        if not parts.scheme or not parts.hostname:
+            raise ValueError(
+                f"Proxy must be a URL like http://host:port, got {value!r}"
+            )
+        if fragment:
+            if not fragment.isdigit() or int(fragment) < 1:
+                raise ValueError(f"Proxy concurrency must be positive, got {value!r}")
+            concurrency = int(fragment)
+        return cls(url=url, concurrency=concurrency)
+
+    def available(self, now: float) -> bool:
+        return now >= self.cooldown_until and self.active < self.concurrency
+
+
+class ProxyLease:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.latency: float | None = None
+        self.error: str | None = None
+
+    def fail(self, error: str) -> None:
+        self.error = error
+
+
+class ProxyPool:
+    _DEFAULT_CONCURRENCY: Final[int] = 2
+    _DEFAULT_FAILURE_THRESHOLD: Final[int] = 3
+    _DEFAULT_COOLDOWN: Final[float] = 300.0
+    _DEFAULT_MAX_LATENCY: Final[float] = 15.0
+    # Weight of the latest sample in the moving average of the latency.
+    _LATENCY_WEIGHT: Final[float] = 0.3
+
+    def __init__(
+        self,
+        proxies: Sequence[str],
+        concurrency: int = _DEFAULT_CONCURRENCY,
+        failure_threshold: int = _DEFAULT_FAILURE_THRESHOLD,
+        cooldown: float = _DEFAULT_COOLDOWN,
+        max_latency: float = _DEFAULT_MAX_LATENCY,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not proxies:
+            raise ValueError("Proxy pool needs at least one proxy")
+        self._proxies = [Proxy.parse(proxy, concurrency) for proxy in proxies]
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._max_latency = max_latency
+        self._clock = clock
+        self._changed = asyncio.Condition()
+        logger.info("Initialized proxy pool with %d proxies", len(self._proxies))
+
+    @property
+    def proxies(self) -> Sequence[Proxy]:
+        return self._proxies
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[ProxyLease]:
+        proxy = await self._take()
+        lease = ProxyLease(proxy.url)
+        started = self._clock()
+        try:
+            yield lease
+        except BaseException:
+            # Cancelled or otherwise failed operations tell nothing about the
+            # latency of the proxy.
+            if lease.error is not None:
+                self._record_failure(proxy, lease.error)
+            raise
+        else:
+            if lease.error is not None:
+                self._record_failure(proxy, lease.error)
+            else:
+                self._record_latency(
+                    proxy,
+                    lease.latency
+                    if lease.latency is not None
+                    else self._clock() - started,
+                )
+        finally:
+            proxy.active -= 1
+            async with self._changed:
+                self._changed.notify_all()
+
+    async def _take(self) -> Proxy:
+        async with self._changed:
+            while True:
+                now = self._clock()
+                candidates = [proxy for proxy in self._proxies if proxy.available(now)]
+                if candidates:
+                    # The least loaded proxy wins, ties go to the fastest one.
+                    proxy = min(
+                        candidates,
+                        key=lambda proxy: (
+                            proxy.active / proxy.concurrency,
+                            proxy.latency or 0.0,
+                        ),
+                    )
+                    proxy.active += 1
+                    return proxy
+
+                cooling = [
+                    proxy.cooldown_until
+                    for proxy in self._proxies
+                    if proxy.cooldown_until > now
+                ]
+                timeout = min(cooling) - now if cooling else None
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._changed.wait(), timeout)
+
+    def _record_latency(self, proxy: Proxy, latency: float) -> None:
+        proxy.failures = 0
+        proxy.latency = (
+            latency
+            if proxy.latency is None
+            else self._LATENCY_WEIGHT * latency
+            + (1 - self._LATENCY_WEIGHT) * proxy.latency
+        )
+        if proxy.latency > self._max_latency:
+            self._cool_down(proxy, f"latency of {proxy.latency:.1f}s")
+
+    def _record_failure(self, proxy: Proxy, error: str) -> None:
+        proxy.failures += 1
+        logger.warning(
+            "Proxy %s failed (%d/%d): %s",
+            proxy.url,
+            proxy.failures,
+            self._failure_threshold,
+            error,
+        )
+        if proxy.failures >= self._failure_threshold:
+            self._cool_down(proxy, f"{proxy.failures} failures")
+
+    def _cool_down(self, proxy: Proxy, reason: str) -> None:
+        proxy.cooldown_until = self._clock() + self._cooldown
+        # After its cool-down, a single failure or slow response takes the
+        # proxy out of rotation again.
+        proxy.failures = self._failure_threshold - 1
+        proxy.latency = None
+        logger.warning(
+            "Took proxy %s out of rotation for %gs after %s",
+            proxy.url,
+            self._cooldown,
+            reason,
+        )
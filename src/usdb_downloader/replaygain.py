@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import functools
+import importlib.util
+import itertools
+import logging
+import os
+import shutil
+import subprocess
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.batch_pool import BatchPool, BatchPoolException
+from usdb_downloader.locks import SongLocks
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator, Sequence
+    from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayGainTaggerException(Exception):
+    """Custom exception for ReplayGainTagger errors."""
+
+
+@dataclass(frozen=True)
+class ReplayGain:
+    name: str
+    loudness: float | None = None
+    peak: float | None = None
+    gain: float | None = None
+    # Gain applied to the audio itself by normalisation.
+    applied: float = 0.0
+    audio_size: int | None = None
+    audio_mtime: int | None = None
+    # Whether the tagger normalised, a sweep re-measures when this changes.
+    normalized: bool = False
+    error: str | None = None
+    locked: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.locked
+
+
+@dataclass(frozen=True)
+class TagRequest:
+    name: str
+    audio: Path
+
+
+class ReplayGainTagger:
+    _DEFAULT_WORKERS: Final[int] = min(4, os.cpu_count() or 1)
+    _DEFAULT_BATCH_SIZE: Final[int] = 4
+    # Songs of a library sweep are sent to the workers in chunks, and recorded
+    # chunk by chunk, so an interrupted sweep resumes where it stopped.
+    _SWEEP_CHUNK_SIZE: Final[int] = 16
+
+    def __init__(
+        self,
+        workers: int = _DEFAULT_WORKERS,
+        batch_size: int = _DEFAULT_BATCH_SIZE,
+        normalize: bool = False,
+        ffmpeg: str | None = None,
+    ) -> None:
+        self._workers = workers
+        self._normalize = normalize
+        self._ffmpeg = ffmpeg or shutil.which("ffmpeg")
+        self._batches: BatchPool[TagRequest, ReplayGain] = BatchPool(
+            functools.partial(_tag_batch, self._ffmpeg, normalize, None),
+            workers=workers,
+            batch_size=batch_size,
+        )
+
+    @property
+    def normalize(self) -> bool:
+        return self._normalize
+
+    @property
+    def available(self) -> bool:
+        return (
+            self._ffmpeg is not None and importlib.util.find_spec("numpy") is not None
+        )
+
+    async def tag(self, name: str, audio: Path) -> ReplayGain:
+        if self._ffmpeg is None:
+            raise ReplayGainTaggerException("ffmpeg is not installed")
+
+        try:
+            replay_gain = await self._batches.submit(TagRequest(name=name, audio=audio))
+        except BatchPoolException as e:
+            raise ReplayGainTaggerException(str(e)) from e
+        self._log(replay_gain)
+        return replay_gain
+
+    def sweep(
+        self,
+        requests: Iterable[TagRequest],
+        lock_dir: Path,
+    ) -> Iterator[list[ReplayGain]]:
+        if self._ffmpeg is None:
+            raise ReplayGainTaggerException("ffmpeg is not installed")
+
+        # Unlike new downloads, songs of the library are locked by the workers,
+        # so a sweep never touches a song that is being downloaded.
+        tag_chunk = functools.partial(
+            _tag_batch,
+            self._ffmpeg,
+            self._normalize,
+            lock_dir,
+        )
+        chunks = itertools.batched(requests, self._SWEEP_CHUNK_SIZE, strict=False)
+        logger.info("Measuring loudness with %d worker(s)", self._workers)
+        for replay_gains in self._batches.pool.map(tag_chunk, chunks):
+            for replay_gain in replay_gains:
+                self._log(replay_gain)
+            yield replay_gains
+
+    def close(self) -> None:
+        self._batches.close()
+
+    @staticmethod
+    def _log(replay_gain: ReplayGain) -> None:
+        if replay_gain.error is not None:
+            logger.warning(
+                "Failed to measure loudness of song %s: %s",
+                replay_gain.name,
+                replay_gain.error,
+            )
+        else:
+            logger.info(
+                "Measured song %s at %s LUFS, gain %s dB, applied %s dB",
+                replay_gain.name,
+                replay_gain.loudness,
+                replay_gain.gain,
+                replay_gain.applied,
+            )
+
+
+def _tag_batch(
+    ffmpeg: str | None,
+    normalize: bool,
+    lock_dir: Path | None,
+    requests: Sequence[TagRequest],
+) -> list[ReplayGain]:
+    if ffmpeg is None:
+        raise ReplayGainTaggerException("ffmpeg is not installed")
+
+    locks = SongLocks(lock_dir) if lock_dir is not None else None
+    replay_gains: list[ReplayGain] = []
+    for request in requests:
+        if locks is None:
+            replay_gains.append(_tag_song(ffmpeg, normalize, request))
+            continue
+        if not locks.acquire(request.name):
+            replay_gains.append(ReplayGain(name=request.name, locked=True))
+            continue
+        try:
+            replay_gains.append(_tag_song(ffmpeg, normalize, request))
+        finally:
+            locks.release(request.name)
+    return replay_gains
+
+
+def _tag_song(ffmpeg: str, normalize: bool, request: TagRequest) -> ReplayGain:
+    # The workers import NumPy, so the parent process does not need it.
+    from usdb_downloader import loudness
+
+    try:
+        measured = loudness.measure_loudness(ffmpeg, request.audio)
+        if measured is None:
+            return ReplayGain(name=request.name, error="Audio is silent")
+        tagged = loudness.apply_gain(ffmpeg, request.audio, measured, normalize)
+        stat = request.audio.stat()
+    except subprocess.CalledProcessError as e:
+        stderr = e.stderr.decode(errors="replace").strip() if e.stderr else ""
+        return ReplayGain(name=request.name, error=stderr or str(e))
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return ReplayGain(name=request.name, error=str(e))
+
+    return ReplayGain(
+        name=request.name,
+        loudness=round(measured.integrated, 2),
+        peak=round(measured.peak, 6),
+        gain=round(tagged.gain, 2),
+        applied=round(tagged.integrated - measured.integrated, 2),
+        audio_size=stat.st_size,
+        audio_mtime=stat.st_mtime_ns,
+        normalized=normalize,
+    )
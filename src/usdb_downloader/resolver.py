@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.models import VideoInfo
+from usdb_downloader.youtube_downloader import YoutubeDownloaderException
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from usdb_downloader.metadata_cache import MetadataCache
+    from usdb_downloader.youtube_downloader import YoutubeDownloader
+
+logger = logging.getLogger(__name__)
+
+
+class Resolver:
+    _DEFAULT_CONCURRENCY: Final[int] = 8
+    # Songs that were prefetched but claimed by another worker are never
+    # resolved here, so finished prefetches beyond this many are dropped. Their
+    # metadata stays in the cache.
+    _MAX_PREFETCHED: Final[int] = 256
+
+    def __init__(
+        self,
+        youtube_downloader: YoutubeDownloader,
+        cache: MetadataCache,
+        concurrency: int = _DEFAULT_CONCURRENCY,
+    ) -> None:
+        self._youtube_downloader = youtube_downloader
+        self._cache = cache
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks: OrderedDict[str, asyncio.Task[VideoInfo]] = OrderedDict()
+
+    def prefetch(self, video_ids: Iterable[str]) -> None:
+        for video_id in video_ids:
+            if video_id in self._tasks:
+                self._tasks.move_to_end(video_id)
+                continue
+            self._tasks[video_id] = asyncio.create_task(
+                self._resolve(video_id),
+                name=f"resolve-{video_id}",
+            )
+
+        finished = [video_id for video_id, task in self._tasks.items() if task.done()]
+        for video_id in finished[: max(len(self._tasks) - self._MAX_PREFETCHED, 0)]:
+            del self._tasks[video_id]
+
+    async def resolve(self, video_id: str) -> VideoInfo:
+        self.prefetch([video_id])
+        try:
+            return await self._tasks[video_id]
+        finally:
+            self._tasks.pop(video_id, None)
+
+    async def aclose(self) -> None:
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _resolve(self, video_id: str) -> VideoInfo:
+        if (info := self._cache.get(video_id)) is not None:
+            return info
+
+        async with self._semaphore:
+            try:
+                info = await self._youtube_downloader.resolve(video_id)
+            except YoutubeDownloaderException as e:
+                # Transient errors, like rate limits, are not cached. The download
+                # runs with the default formats and fails or retries on its own.
+                logger.warning("Metadata of video %s is unknown: %s", video_id, e)
+                return VideoInfo(video_id=video_id, available=True)
+
+        self._cache.put(info)
+        return info
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import functools
+import itertools
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from enum import StrEnum
+from typing import TYPE_CHECKING, Final
+
+from usdb_downloader.locks import SongLocks
+from usdb_downloader.parser import Parser
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator, Sequence
+    from pathlib import Path
+
+    from usdb_downloader.layout import Layout
+    from usdb_downloader.models import File
+    from usdb_downloader.shard import Shard
+
+logger = logging.getLogger(__name__)
+
+
+class RewriteState(StrEnum):
+    REWRITTEN = "rewritten"
+    UNCHANGED = "unchanged"
+    OTHER_SHARD = "other_shard"
+    NOT_DOWNLOADED = "not_downloaded"
+    LOCKED = "locked"
+    INVALID = "invalid"
+
+
+@dataclass(frozen=True)
+class Rewrite:
+    name: str
+    state: RewriteState
+    file: File | None = None
+    song_dir: Path | None = None
+
+
+class LibraryRewriter:
+    _DEFAULT_WORKERS: Final[int] = os.cpu_count() or 1
+    # Paths are sent to the workers in chunks, so that the pool is not flooded
+    # with one task per song.
+    _CHUNK_SIZE: Final[int] = 64
+
+    def __init__(
+        self,
+        input_dir: Path,
+        output_dir: Path,
+        lock_dir: Path,
+        layout: Layout,
+        shard: Shard | None = None,
+        workers: int = _DEFAULT_WORKERS,
+    ) -> None:
+        self._input_dir = input_dir
+        self._output_dir = output_dir
+        self._lock_dir = lock_dir
+        self._layout = layout
+        self._shard = shard
+        self._workers = workers
+
+    def run(self) -> Iterator[list[Rewrite]]:
+        parser = Parser(input_dir=self._input_dir, output_dir=self._output_dir)
+        chunks = itertools.batched(parser.iter_paths(), self._CHUNK_SIZE, strict=False)
+        rewrite_chunk = functools.partial(
+            _rewrite_chunk,
+            self._input_dir,
+            self._output_dir,
+            self._lock_dir,
+            self._layout,
+            self._shard,
+        )
+        logger.info("Rewriting song files with %d worker(s)", self._workers)
+
+        with ProcessPoolExecutor(self._workers) as pool:
+            yield from pool.map(rewrite_chunk, chunks)
+
+
+def _rewrite_chunk(
+    input_dir: Path,
+    output_dir: Path,
+    lock_dir: Path,
+    layout: Layout,
+    shard: Shard | None,
+    paths: Sequence[Path],
+) -> list[Rewrite]:
+    # The catalog is updated by the parent process, so the workers only
+    # contend for the disk.
+    parser = Parser(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        shard=shard,
+        layout=layout,
+    )
+    locks = SongLocks(lock_dir)
+    rewrites: list[Rewrite] = []
+
+    for path in paths:
+        for file in parser.parse_path(path):
+            if file is None:
+                rewrites.append(Rewrite(name=path.stem, state=RewriteState.INVALID))
+                continue
+            if shard is not None and not shard.contains(file.video_id):
+                rewrites.append(Rewrite(name=file.name, state=RewriteState.OTHER_SHARD))
+                continue
+
+            song_dir = parser.song_dir(file)
+            # Songs that were never downloaded are written by their download.
+            if not (song_dir / f"{file.name}.txt").is_file():
+                rewrites.append(
+                    Rewrite(name=file.name, state=RewriteState.NOT_DOWNLOADED)
+                )
+                continue
+            if not locks.acquire(file.name):
+                rewrites.append(Rewrite(name=file.name, state=RewriteState.LOCKED))
+                continue
+            try:
+                written = parser.write_file(file)
+            finally:
+                locks.release(file.name)
+            rewrites.append(
+                Rewrite(
+                    name=file.name,
+                    state=RewriteState.REWRITTEN if written else RewriteState.UNCHANGED,
+                    file=file,
+                    song_dir=song_dir,
+                )
+            )
+
+    return rewrites
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import logging
+import shutil
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import TYPE_CHECKING, Any, Final
+from urllib.parse import parse_qs, urlsplit
+
+from usdb_downloader.job_queue import JobState, SongResult
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+    from usdb_downloader.api import Downloader
+
+logger = logging.getLogger(__name__)
+
+
+class _HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass(frozen=True)
+class _Request:
+    method: str
+    path: str
+    query: dict[str, str]
+    headers: dict[str, str]
+    body: bytes
+
+
+@dataclass
+class ServerJob:
+    id: str
+    name: str
+    path: Path
+    state: str = "queued"
+    result: SongResult | None = None
+    listeners: list[asyncio.Queue[dict[str, Any] | None]] = field(
+        default_factory=list[asyncio.Queue[dict[str, Any] | None]]
+    )
+
+    def snapshot(self) -> dict[str, Any]:
+        snapshot: dict[str, Any] = {
+            "id": self.id,
+            "name": self.name,
+            "state": self.state,
+        }
+        if self.result is not None:
+            snapshot["video_id"] = self.result.video_id
+            snapshot["song_dir"] = (
+                str(self.result.song_dir) if self.result.song_dir else None
+            )
+            snapshot["error"] = self.result.error
+        return snapshot
+
+
+class JobServer:
+    _DEFAULT_HOST: Final[str] = "127.0.0.1"
+    _DEFAULT_PORT: Final[int] = 8080
+    _DEFAULT_QUEUE_SIZE: Final[int] = 64
+    _MAX_UPLOAD_SIZE: Final[int] = 1024 * 1024
+    _MAX_BATCH_SIZE: Final[int] = 16
+    _MAX_FINISHED_JOBS: Final[int] = 1000
+    _READ_TIMEOUT: Final[float] = 30.0
+
+    def __init__(
+        self,
+        downloader: Downloader,
+        spool_dir: Path,
+        host: str = _DEFAULT_HOST,
+        port: int = _DEFAULT_PORT,
+        queue_size: int = _DEFAULT_QUEUE_SIZE,
+    ) -> None:
+        self._downloader = downloader
+        self._spool_dir = spool_dir
+        self._host = host
+        self._port = port
+        # Uploads beyond the queue size are rejected instead of piling up.
+        self._queue: asyncio.Queue[ServerJob] = asyncio.Queue(queue_size)
+        self._jobs: OrderedDict[str, ServerJob] = OrderedDict()
+        self._server: asyncio.Server | None = None
+        self._worker: asyncio.Task[None] | None = None
+
+    @property
+    def url(self) -> str:
+        if self._server is None:
+            return f"http://{self._host}:{self._port}"
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self._host, self._port)
+        self._worker = asyncio.create_task(self._work(), name="job-server-worker")
+        logger.info("Job server listening on %s", self.url)
+
+    async def serve_forever(self) -> None:
+        if self._server is None:
+            await self.start()
+        assert self._server is not None
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._worker is not None:
+            self._worker.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._worker
+            self._worker = None
+
+    async def _work(self) -> None:
+        while True:
+            # Uploads that queued up meanwhile are processed as one batch, so
+            # their audio and video downloads overlap.
+            batch = [await self._queue.get()]
+            while len(batch) < self._MAX_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            jobs = {job.name: job for job in batch}
+            for job in batch:
+                self._publish(job, "running")
+            try:
+                async for result in self._downloader.download_batch(
+                    [job.path for job in batch]
+                ):
+                    if (job := jobs.get(result.name)) is not None:
+                        self._finish(job, result)
+            except Exception as e:
+                logger.exception("Failed to process uploaded songs")
+                error = str(e)
+            else:
+                error = "Song was not processed"
+            finally:
+                for job in batch:
+                    shutil.rmtree(job.path.parent, ignore_errors=True)
+
+            for job in batch:
+                if job.result is None:
+                    self._finish(
+                        job,
+                        SongResult(
+                            name=job.name,
+                            video_id=None,
+                            state=JobState.FAILED,
+                            error=error,
+                        ),
+                    )
+
+    def _submit(self, name: str, body: bytes) -> ServerJob:
+        if any(job.name == name and job.result is None for job in self._jobs.values()):
+            raise _HttpError(HTTPStatus.CONFLICT, f"Song {name} is already queued")
+
+        if self._queue.full():
+            raise _HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Job queue is full")
+
+        job_id = uuid.uuid4().hex
+        path = self._spool_dir / job_id / f"{name}.txt"
+        # The upload is stored before it is queued, so the worker never gets a
+        # job without its song file.
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(body)
+        except OSError as e:
+            logger.error("Failed to store uploaded song %s: %s", name, e)
+            shutil.rmtree(path.parent, ignore_errors=True)
+            raise _HttpError(
+                HTTPStatus.INTERNAL_SERVER_ERROR, "Failed to store upload"
+            ) from e
+
+        job = ServerJob(id=job_id, name=name, path=path)
+        self._queue.put_nowait(job)
+        self._jobs[job_id] = job
+        logger.info("Queued uploaded song %s as job %s", name, job_id)
+        return job
+
+    def _publish(self, job: ServerJob, state: str) -> None:
+        job.state = state
+        for listener in job.listeners:
+            listener.put_nowait(job.snapshot())
+
+    def _finish(self, job: ServerJob, result: SongResult) -> None:
+        job.result = result
+        self._publish(job, result.state)
+        for listener in job.listeners:
+            listener.put_nowait(None)
+        logger.info("Finished job %s of song %s: %s", job.id, job.name, result.state)
+
+        finished = [job_id for job_id, job in self._jobs.items() if job.result]
+        for job_id in finished[: max(len(finished) - self._MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+    async def _handle(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        try:
+            request = await asyncio.wait_for(
+                self._read_request(reader), self._READ_TIMEOUT
+            )
+            await self._route(request, writer)
+        except _HttpError as e:
+            await self._send_json(writer, e.status, {"error": e.message})
+        except (TimeoutError, asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.info("Dropped connection: %r", e)
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def _route(self, request: _Request, writer: asyncio.StreamWriter) -> None:
+        match request.method, request.path.strip("/").split("/"):
+            case "GET", ["health"]:
+                await self._send_json(
+                    writer,
+                    HTTPStatus.OK,
+                    {"status": "ok", "queued": self._queue.qsize()},
+                )
+            case "POST", ["jobs"]:
+                job = self._submit(self._song_name(request), request.body)
+                if request.query.get("stream", "1") == "0":
+                    await self._send_json(writer, HTTPStatus.ACCEPTED, job.snapshot())
+                else:
+                    await self._stream(writer, job)
+            case "GET", ["jobs", job_id]:
+                await self._send_json(
+                    writer, HTTPStatus.OK, self._job(job_id).snapshot()
+                )
+            case "GET", ["jobs", job_id, "events"]:
+                await self._stream(writer, self._job(job_id))
+            case _:
+                raise _HttpError(HTTPStatus.NOT_FOUND, f"No route for {request.path}")
+
+    def _job(self, job_id: str) -> ServerJob:
+        if (job := self._jobs.get(job_id)) is None:
+            raise _HttpError(HTTPStatus.NOT_FOUND, f"Unknown job {job_id}")
+        return job
+
+    @staticmethod
+    def _song_name(request: _Request) -> str:
+        name = request.query.get("name", "").strip()
+        if not name or name.startswith(".") or any(c in name for c in "/\\\0"):
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "A valid song name is required")
+        return name.removesuffix(".txt")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> _Request:
+        request_line = await self._read_line(
+            reader, HTTPStatus.BAD_REQUEST, "Request line is too long"
+        )
+        try:
+            method, target, _ = request_line.split(" ", 2)
+        except ValueError as e:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line") from e
+
+        headers: dict[str, str] = {}
+        while (
+            line := await self._read_line(
+                reader,
+                HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                "Header line is too long",
+            )
+        ) != "":
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        content_length = headers.get("content-length", "0") or "0"
+        if not content_length.isascii() or not content_length.isdigit():
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+        length = int(content_length)
+        if length > self._MAX_UPLOAD_SIZE:
+            raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Upload is too large")
+
+        url = urlsplit(target)
+        return _Request(
+            method=method.upper(),
+            path=url.path,
+            query={key: values[-1] for key, values in parse_qs(url.query).items()},
+            headers=headers,
+            body=await reader.readexactly(length) if length else b"",
+        )
+
+    @staticmethod
+    async def _read_line(
+        reader: asyncio.StreamReader,
+        status: HTTPStatus,
+        message: str,
+    ) -> str:
+        # Lines beyond the limit of the stream reader raise ValueError.
+        try:
+            line = await reader.readline()
+        except ValueError as e:
+            raise _HttpError(status, message) from e
+        return line.decode("latin-1").strip()
+
+    async def _stream(self, writer: asyncio.StreamWriter, job: ServerJob) -> None:
+        listener: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        job.listeners.append(listener)
+        try:
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: application/x-ndjson\r\n"
+                b"Transfer-Encoding: chunked\r\n"
+                b"Connection: close\r\n\r\n"
+            )
+            await self._send_chunk(writer, job.snapshot())
+            if job.result is None:
+                while (event := await listener.get()) is not None:
+                    await self._send_chunk(writer, event)
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            job.listeners.remove(listener)
+
+    @staticmethod
+    async def _send_chunk(writer: asyncio.StreamWriter, event: dict[str, Any]) -> None:
+        data = json.dumps(event).encode() + b"\n"
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    @staticmethod
+    async def _send_json(
+        writer: asyncio.StreamWriter,
+        status: HTTPStatus,
+        payload: dict[str, Any],
+    ) -> None:
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + data
+        )
+        await writer.drain()
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import zlib
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class Shard:
+    index: int
+    count: int
+
+    def __post_init__(self) -> None:
+        if self.count < 1:
+            raise ValueError(f"Shard count must be positive, got {self.count}")
+        if not 1 <= self.index <= self.count:
+            raise ValueError(
+                f"Shard index must be between 1 and {self.count}, got {self.index}"
+            )
+
+    @classmethod
+    def parse(cls, value: str) -> Shard:
+        index, sep, count = value.partition("/")
+        if not sep:
+            raise ValueError(f"Shard must be given as i/N, got {value!r}")
+        try:
+            return cls(index=int(index), count=int(count))
+        except ValueError as e:
+            raise ValueError(f"Invalid shard {value!r}: {e}") from e
+
+    def contains(self, video_id: str) -> bool:
+        # crc32 is stable across processes and machines, unlike hash().
+        return zlib.crc32(video_id.encode("ascii")) % self.count == self.index - 1
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
@@ -0,0 +1,258 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Final
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+    from pathlib import Path
+
+    from usdb_downloader.models import File
+
+logger = logging.getLogger(__name__)
+
+_PROBE_TIMEOUT: Final[float] = 60.0
+
+
+class MediaVerifierException(Exception):
+    """Custom exception for MediaVerifier errors."""
+
+
+@dataclass(frozen=True)
+class MediaProbe:
+    path: Path
+    kind: str
+    size: int
+    sha256: str
+    duration: float | None
+    problems: tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Verification:
+    name: str
+    expected_duration: float | None
+    media: tuple[MediaProbe, ...]
+    problems: tuple[str, ...]
+
+    @property
+    def ok(self) -> bool:
+        return not self.problems
+
+
+class MediaVerifier:
+    _DEFAULT_WORKERS: Final[int] = min(4, os.cpu_count() or 1)
+    # Media may end a little before the last note, e.g. on a fade out.
+    _DEFAULT_TOLERANCE: Final[float] = 1.0
+    _DEFAULT_SYNC_TOLERANCE: Final[float] = 2.0
+    _QUARANTINE_SUFFIX: Final[str] = ".suspect"
+
+    def __init__(
+        self,
+        workers: int = _DEFAULT_WORKERS,
+        tolerance: float = _DEFAULT_TOLERANCE,
+        sync_tolerance: float = _DEFAULT_SYNC_TOLERANCE,
+        ffprobe: str | None = None,
+    ) -> None:
+        self._workers = workers
+        self._tolerance = tolerance
+        self._sync_tolerance = sync_tolerance
+        self._ffprobe = ffprobe or shutil.which("ffprobe")
+        self._pool: ProcessPoolExecutor | None = None
+
+    @property
+    def available(self) -> bool:
+        return self._ffprobe is not None
+
+    @property
+    def workers(self) -> int:
+        return self._workers
+
+    async def verify(self, file: File, song_dir: Path) -> Verification:
+        if self._ffprobe is None:
+            raise MediaVerifierException("ffprobe is not installed")
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self._workers)
+
+        name = file.name
+        # Probing and hashing run in a process pool, so large video files do
+        # not hold the GIL of the download event loop.
+        loop = asyncio.get_running_loop()
+        verification = await loop.run_in_executor(
+            self._pool,
+            functools.partial(
+                _verify_song,
+                ffprobe=self._ffprobe,
+                name=name,
+                media=(
+                    (song_dir / file.headers.get("MP3", f"{name}.mp3"), "audio"),
+                    (song_dir / file.headers.get("VIDEO", f"{name}.webm"), "video"),
+                ),
+                expected_duration=self.expected_duration(file),
+                tolerance=self._tolerance,
+                sync_tolerance=self._sync_tolerance,
+            ),
+        )
+        logger.info(
+            "Verified song %s: %s",
+            file.name,
+            "; ".join(verification.problems) or "ok",
+        )
+        return verification
+
+    def quarantine(self, verification: Verification) -> None:
+        # Suspicious media is kept for inspection, but renamed so that yt-dlp
+        # does not consider it as already downloaded. Media that passed stays,
+        # unless only audio and video disagree, where either may be wrong.
+        suspects = [probe for probe in verification.media if probe.problems]
+        for probe in suspects or verification.media:
+            if probe.path.exists():
+                target = probe.path.with_name(probe.path.name + self._QUARANTINE_SUFFIX)
+                probe.path.replace(target)
+                logger.warning("Quarantined %s as %s", probe.path, target)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @staticmethod
+    def expected_duration(file: File) -> float | None:
+        if file.timing is None:
+            return None
+        try:
+            notes = file.notes
+        except ImportError as e:
+            logger.warning("Duration of song %s is not verified: %s", file.name, e)
+            return None
+
+        if notes.last_beat == 0:
+            return None
+        return notes.duration(file.timing)
+
+
+def _verify_song(
+    ffprobe: str,
+    name: str,
+    media: Sequence[tuple[Path, str]],
+    expected_duration: float | None,
+    tolerance: float,
+    sync_tolerance: float,
+) -> Verification:
+    probes = tuple(
+        _probe_media(ffprobe, path, kind, expected_duration, tolerance)
+        for path, kind in media
+    )
+    problems = [problem for probe in probes for problem in probe.problems]
+
+    durations = [probe.duration for probe in probes if probe.duration is not None]
+    if len(durations) > 1 and max(durations) - min(durations) > sync_tolerance:
+        problems.append(
+            f"Audio and video lengths differ by {max(durations) - min(durations):.1f}s"
+        )
+
+    return Verification(
+        name=name,
+        expected_duration=expected_duration,
+        media=probes,
+        problems=tuple(problems),
+    )
+
+
+def _probe_media(
+    ffprobe: str,
+    path: Path,
+    kind: str,
+    expected_duration: float | None,
+    tolerance: float,
+) -> MediaProbe:
+    if not path.is_file():
+        return MediaProbe(
+            path=path,
+            kind=kind,
+            size=0,
+            sha256="",
+            duration=None,
+            problems=(f"{path.name} is missing",),
+        )
+
+    with path.open("rb") as f:
+        sha256 = hashlib.file_digest(f, "sha256").hexdigest()
+
+    problems: list[str] = []
+    duration: float | None = None
+    try:
+        info = _run_ffprobe(ffprobe, path)
+    except MediaVerifierException as e:
+        problems.append(f"{path.name} cannot be read: {e}")
+    else:
+        streams = info.get("streams", [])
+        if not any(stream.get("codec_type") == kind for stream in streams):
+            problems.append(f"{path.name} has no {kind} stream")
+        duration = _parse_duration(info.get("format", {}).get("duration"))
+        if duration is None:
+            problems.append(f"{path.name} has no duration")
+
+    if (
+        duration is not None
+        and expected_duration is not None
+        and duration < expected_duration - tolerance
+    ):
+        problems.append(
+            f"{path.name} is {duration:.1f}s long, "
+            f"but the notes end at {expected_duration:.1f}s"
+        )
+
+    return MediaProbe(
+        path=path,
+        kind=kind,
+        size=path.stat().st_size,
+        sha256=sha256,
+        duration=duration,
+        problems=tuple(problems),
+    )
+
+
+def _parse_duration(value: object) -> float | None:
+    if not isinstance(value, str | int | float):
+        return None
+    try:
+        return float(value)
+    except ValueError as e:
+        logger.warning("Invalid duration %r: %s", value, e)
+        return None
+
+
+def _run_ffprobe(ffprobe: str, path: Path) -> dict[str, Any]:
+    try:
+        result = subprocess.run(
+            [
+                ffprobe,
+                "-v",
+                "error",
+                "-print_format",
+                "json",
+                "-show_format",
+                "-show_streams",
+                str(path),
+            ],
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=_PROBE_TIMEOUT,
+        )
+        return json.loads(result.stdout)
+    except subprocess.CalledProcessError as e:
+        raise MediaVerifierException(e.stderr.strip() or str(e)) from e
+    except (subprocess.TimeoutExpired, json.JSONDecodeError) as e:
+        raise MediaVerifierException(str(e)) from e
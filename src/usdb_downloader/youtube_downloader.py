@@ -1,18 +1,29 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import functools
 import logging
+import re
+import threading
+import time
 from typing import TYPE_CHECKING, Any, Final, cast
 
 from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError
+from yt_dlp.utils import DownloadCancelled, DownloadError
 
+from usdb_downloader.bandwidth import Priority
+from usdb_downloader.models import VideoInfo
 from usdb_downloader.silent_logger import SilentLogger
 
 if TYPE_CHECKING:
-    from collections.abc import Mapping
+    from collections.abc import Callable, Coroutine, Iterable, Mapping
+    from contextlib import AbstractAsyncContextManager
     from pathlib import Path
 
+    from usdb_downloader.bandwidth import BandwidthLimiter
+    from usdb_downloader.proxy_pool import ProxyLease, ProxyPool
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,23 +31,113 @@ class YoutubeDownloaderException(Exception):
     """Custom exception for YoutubeDownloader errors."""
 
 
+class _DownloadMonitor:
+    def __init__(
+        self,
+        on_postprocess: Callable[[], None] | None = None,
+        throttle: Callable[[int], None] | None = None,
+    ) -> None:
+        self._on_postprocess = on_postprocess
+        self._throttle = throttle
+        self._downloaded: dict[str, int] = {}
+        self._cancelled = threading.Event()
+        self._started = time.monotonic()
+        self._last_progress = self._started
+        self._first_progress: float | None = None
+        self._postprocessing = False
+        self._throttling = False
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+        self._last_progress = self._started
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    def stalled_for(self) -> float:
+        # FFmpeg reports no progress, so postprocessing is bound by the deadline.
+        # Waiting for bandwidth is no stall of the connection either.
+        if self._postprocessing or self._throttling:
+            return 0.0
+        return time.monotonic() - self._last_progress
+
+    def latency(self) -> float | None:
+        if self._first_progress is None:
+            return None
+        return self._first_progress - self._started
+
+    def progress_hook(self, info: Mapping[str, Any]) -> None:
+        self._check_cancelled()
+        self._last_progress = time.monotonic()
+        if self._first_progress is None:
+            self._first_progress = self._last_progress
+
+        if self._throttle is not None:
+            # Sleeping in the hook holds back the next read of the transfer.
+            self._throttling = True
+            try:
+                self._throttle(self._new_bytes(info))
+            finally:
+                self._last_progress = time.monotonic()
+                self._throttling = False
+            self._check_cancelled()
+
+    def postprocessor_hook(self, info: Mapping[str, Any]) -> None:
+        self._check_cancelled()
+        if info.get("status") == "started":
+            self._postprocessing = True
+            if self._on_postprocess is not None:
+                self._on_postprocess()
+
+    def _new_bytes(self, info: Mapping[str, Any]) -> int:
+        # Video and audio streams of a download report their bytes separately.
+        filename = str(info.get("filename", ""))
+        downloaded = int(info.get("downloaded_bytes") or 0)
+        previous = self._downloaded.get(filename, 0)
+        self._downloaded[filename] = downloaded
+        return max(downloaded - previous, 0)
+
+    def _check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise DownloadCancelled("Download was cancelled")
+
+
 class YoutubeDownloader:
+    _DEFAULT_STALL_TIMEOUT: Final[float] = 120.0
+    _STALL_CHECK_INTERVAL: Final[float] = 1.0
+    # Errors caused by the connection or by throttling of its IP address.
+    _PROXY_ERROR_PATTERN: Final[re.Pattern[str]] = re.compile(
+        r"proxy|tunnel|timed out|connection (?:refused|reset|aborted)"
+        r"|HTTP Error 429|Too Many Requests|confirm you.re not a bot|stalled"
+        r"|try again later",
+        re.IGNORECASE,
+    )
+    # Errors of videos that no download can fetch, whatever the connection.
+    _UNAVAILABLE_PATTERN: Final[re.Pattern[str]] = re.compile(
+        r"video unavailable|private video|has been removed|no longer available"
+        r"|not available in your country|confirm your age|age.restricted"
+        r"|members.only|account .* terminated|copyright",
+        re.IGNORECASE,
+    )
     _DEFAULT_COMMON_OPTS: Final[Mapping[str, Any]] = {
         "quiet": True,
         "no_warnings": True,
         "noprogress": True,
         "no_color": True,
         "concurrent_fragment_downloads": 5,
+        "socket_timeout": 30,
         "logger": SilentLogger(),
     }
+    _VIDEO_FORMAT: Final[str] = "bestvideo[ext=webm]/bestvideo"
+    _AUDIO_FORMAT: Final[str] = "bestaudio[ext=m4a]/bestaudio"
     _DEFAULT_VIDEO_OPTS: Final[Mapping[str, Any]] = {
         **_DEFAULT_COMMON_OPTS,
-        "format": "bestvideo[ext=webm]/bestvideo",
+        "format": _VIDEO_FORMAT,
         "merge_output_format": "webm",
     }
     _DEFAULT_AUDIO_OPTS: Final[Mapping[str, Any]] = {
         **_DEFAULT_COMMON_OPTS,
-        "format": "bestaudio[ext=m4a]/bestaudio",
+        "format": _AUDIO_FORMAT,
         "postprocessors": [
             {
                 "key": "FFmpegExtractAudio",
@@ -46,55 +147,242 @@ class YoutubeDownloader:
         ],
     }
 
-    async def download_video(self, video_id: str, output_path: Path) -> None:
-        try:
-            logger.info("Starting download video with id %s", video_id)
-            await asyncio.to_thread(
-                self._download,
-                video_id,
-                output_path,
-                self._DEFAULT_VIDEO_OPTS,
-            )
-            logger.info("Successfully downloaded video with id %s", video_id)
-        except DownloadError as e:
-            error_msg = str(e)
-            logger.error("Failed to download video with id %s: %s", video_id, error_msg)
-            raise YoutubeDownloaderException(
-                f"Failed to download video: {error_msg}"
-            ) from e
-
-    async def download_audio(self, video_id: str, output_path: Path) -> None:
+    def __init__(
+        self,
+        deadline: float | None = None,
+        stall_timeout: float = _DEFAULT_STALL_TIMEOUT,
+        proxy_pool: ProxyPool | None = None,
+        bandwidth_limiter: BandwidthLimiter | None = None,
+    ) -> None:
+        self._deadline = deadline
+        self._stall_timeout = stall_timeout
+        self._proxy_pool = proxy_pool
+        self._bandwidth_limiter = bandwidth_limiter
+
+    async def resolve(self, video_id: str) -> VideoInfo:
+        async with self._lease() as lease:
+            try:
+                logger.info("Starting resolve metadata with id %s", video_id)
+                info = await asyncio.to_thread(
+                    self._resolve,
+                    video_id,
+                    lease.url if lease else None,
+                )
+                logger.info("Successfully resolved metadata with id %s", video_id)
+            except DownloadError as e:
+                error_msg = str(e)
+                self._report_proxy_error(lease, error_msg)
+                if not self._is_unavailable(error_msg):
+                    logger.warning(
+                        "Failed to resolve metadata with id %s: %s", video_id, error_msg
+                    )
+                    raise YoutubeDownloaderException(
+                        f"Failed to resolve metadata: {error_msg}"
+                    ) from e
+                logger.error("Video with id %s is unavailable: %s", video_id, error_msg)
+                return VideoInfo(video_id=video_id, available=False, error=error_msg)
+
+        return info
+
+    async def download_video(
+        self,
+        video_id: str,
+        output_path: Path,
+        format_id: str | None = None,
+    ) -> None:
+        await self._run_download(
+            kind="video",
+            video_id=video_id,
+            output_path=output_path,
+            opts=self._with_format(self._DEFAULT_VIDEO_OPTS, format_id),
+            monitor=_DownloadMonitor(throttle=self._throttle(Priority.VIDEO)),
+        )
+
+    async def download_audio(
+        self,
+        video_id: str,
+        output_path: Path,
+        format_id: str | None = None,
+        on_postprocess: Callable[[], None] | None = None,
+    ) -> None:
+        await self._run_download(
+            kind="audio",
+            video_id=video_id,
+            output_path=output_path,
+            opts=self._with_format(self._DEFAULT_AUDIO_OPTS, format_id),
+            monitor=_DownloadMonitor(
+                on_postprocess,
+                throttle=self._throttle(Priority.AUDIO),
+            ),
+        )
+
+    async def _run_download(
+        self,
+        kind: str,
+        video_id: str,
+        output_path: Path,
+        opts: Mapping[str, Any],
+        monitor: _DownloadMonitor,
+    ) -> None:
+        async with self._lease() as lease:
+            if lease is not None:
+                opts = {**opts, "proxy": lease.url}
+            try:
+                logger.info("Starting download %s with id %s", kind, video_id)
+                # Waiting for a free proxy counts neither as stall nor latency.
+                monitor.start()
+                async with asyncio.timeout(self._deadline):
+                    await self._watch(
+                        asyncio.to_thread(
+                            self._download,
+                            video_id,
+                            output_path,
+                            opts,
+                            monitor,
+                        ),
+                        monitor,
+                    )
+                logger.info("Successfully downloaded %s with id %s", kind, video_id)
+            except DownloadError as e:
+                error_msg = str(e)
+                self._report_proxy_error(lease, error_msg)
+                logger.error(
+                    "Failed to download %s with id %s: %s", kind, video_id, error_msg
+                )
+                raise YoutubeDownloaderException(
+                    f"Failed to download {kind}: {error_msg}"
+                ) from e
+            except TimeoutError as e:
+                error_msg = f"deadline of {self._deadline:g}s exceeded"
+                # A large download that is making progress is no fault of its
+                # proxy, one that never started may be.
+                if monitor.latency() is None:
+                    self._report_proxy_error(lease, f"Download timed out: {error_msg}")
+                logger.error("Download %s with id %s timed out", kind, video_id)
+                raise YoutubeDownloaderException(
+                    f"Failed to download {kind}: {error_msg}"
+                ) from e
+
+            if lease is not None:
+                # The time to the first progress update does not depend on the
+                # size of the download, unlike the total duration.
+                lease.latency = monitor.latency()
+
+    def _throttle(self, priority: Priority) -> Callable[[int], None] | None:
+        if self._bandwidth_limiter is None or not self._bandwidth_limiter.enabled:
+            return None
+        return functools.partial(self._bandwidth_limiter.consume, priority=priority)
+
+    def _lease(self) -> AbstractAsyncContextManager[ProxyLease | None]:
+        if self._proxy_pool is None:
+            return contextlib.nullcontext()
+        return self._proxy_pool.acquire()
+
+    def _is_unavailable(self, error: str) -> bool:
+        # YouTube answers rate limited requests with "Video unavailable" too.
+        return (
+            self._UNAVAILABLE_PATTERN.search(error) is not None
+            and self._PROXY_ERROR_PATTERN.search(error) is None
+        )
+
+    def _report_proxy_error(self, lease: ProxyLease | None, error: str) -> None:
+        # Unavailable or private videos fail on every proxy alike.
+        if lease is not None and self._PROXY_ERROR_PATTERN.search(error):
+            lease.fail(error)
+
+    async def _watch(
+        self,
+        download: Coroutine[Any, Any, None],
+        monitor: _DownloadMonitor,
+    ) -> None:
+        task = asyncio.ensure_future(download)
         try:
-            logger.info("Starting download audio with id %s", video_id)
-            await asyncio.to_thread(
-                self._download,
-                video_id,
-                output_path,
-                self._DEFAULT_AUDIO_OPTS,
-            )
-            logger.info("Successfully downloaded audio with id %s", video_id)
-        except DownloadError as e:
-            error_msg = str(e)
-            logger.error("Failed to download audio with id %s: %s", video_id, error_msg)
-            raise YoutubeDownloaderException(
-                f"Failed to download audio: {error_msg}"
-            ) from e
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self._STALL_CHECK_INTERVAL)
+                if done:
+                    return task.result()
+                if monitor.stalled_for() > self._stall_timeout:
+                    raise DownloadError(
+                        f"download stalled for more than {self._stall_timeout:g}s"
+                    )
+        finally:
+            if not task.done():
+                # The worker thread cannot be interrupted, so it is stopped at its
+                # next progress update once cancelled, timed out or stalled.
+                monitor.cancel()
+                task.cancel()
 
     @classmethod
     def _build_download_url(cls, video_id: str) -> str:
         return f"https://www.youtube.com/watch?v={video_id}"
 
+    @staticmethod
+    def _with_format(
+        base_opts: Mapping[str, Any],
+        format_id: str | None,
+    ) -> Mapping[str, Any]:
+        if format_id is None:
+            return base_opts
+        # The resolved format may be gone by the time of the download, the
+        # original selector stays as fallback.
+        return {**base_opts, "format": f"{format_id}/{base_opts['format']}"}
+
+    @classmethod
+    def _resolve(cls, video_id: str, proxy: str | None = None) -> VideoInfo:
+        url = cls._build_download_url(video_id)
+        opts: dict[str, Any] = {**cls._DEFAULT_COMMON_OPTS, "format": cls._VIDEO_FORMAT}
+        if proxy is not None:
+            opts["proxy"] = proxy
+
+        with YoutubeDL(cast("Any", opts)) as ydl:
+            # Processing the info selects the video format.
+            info = cast("dict[str, Any]", ydl.extract_info(url, download=False))
+            select_audio = cast(
+                "Callable[[Mapping[str, Any]], Iterable[Mapping[str, Any]]]",
+                ydl.build_format_selector(cls._AUDIO_FORMAT),
+            )
+            formats = cast("list[Mapping[str, Any]]", info.get("formats") or [])
+            # The same context yt-dlp selects the formats of a download with.
+            audio_formats = list(
+                select_audio(
+                    {
+                        "formats": formats,
+                        "has_merged_format": any(
+                            "none" not in (f.get("acodec"), f.get("vcodec"))
+                            for f in formats
+                        ),
+                        "incomplete_formats": (
+                            all(f.get("vcodec") == "none" for f in formats)
+                            or all(f.get("acodec") == "none" for f in formats)
+                        ),
+                    }
+                )
+            )
+
+        return VideoInfo(
+            video_id=video_id,
+            available=True,
+            duration=info.get("duration"),
+            audio_format=(
+                str(audio_formats[-1]["format_id"]) if audio_formats else None
+            ),
+            video_format=info.get("format_id"),
+        )
+
     @classmethod
     def _download(
         cls,
         video_id: str,
         output_path: Path,
         base_opts: Mapping[str, Any],
+        monitor: _DownloadMonitor,
     ) -> None:
         url = cls._build_download_url(video_id)
         opts = {
             **base_opts,
             "outtmpl": f"{output_path}.%(ext)s",
+            "progress_hooks": [monitor.progress_hook],
+            "postprocessor_hooks": [monitor.postprocessor_hook],
         }
 
         with YoutubeDL(cast("Any", opts)) as ydl:
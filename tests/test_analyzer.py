@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import numpy as np
+
+from usdb_downloader.analyzer import PreviewAnalyzer, PreviewAnalyzerException
+from usdb_downloader.models import File
+from usdb_downloader.preview import SAMPLE_RATE
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.fixture
+def ffmpeg(tmp_path: Path) -> str:
+    # Stand-in for ffmpeg that streams the raw samples stored in the input file.
+    script = tmp_path / "ffmpeg"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "data = open(sys.argv[sys.argv.index('-i') + 1], 'rb').read()\n"
+        "if not data:\n"
+        "    sys.exit('Invalid data found when processing input')\n"
+        "sys.stdout.buffer.write(data)\n",
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return str(script)
+
+
+def _write_song(song_dir: Path, name: str) -> File:
+    # Verse and chorus twice, the chorus is louder and starts at 20s.
+    times = np.arange(20 * SAMPLE_RATE) / SAMPLE_RATE
+    verse = 0.3 * np.sin(2 * np.pi * 220 * times)
+    chorus = 0.8 * np.sin(2 * np.pi * 660 * times[: 15 * SAMPLE_RATE])
+    samples = np.concatenate([verse, chorus, verse, chorus]).astype(np.float32)
+
+    song_dir.mkdir(parents=True, exist_ok=True)
+    (song_dir / f"{name}.mp3").write_bytes(samples.tobytes())
+    return File(
+        name=name,
+        video_id="dQw4w9WgXcQ",
+        headers={"BPM": "120", "GAP": "0", "MP3": f"{name}.mp3"},
+        lyrics=[": 0 4 0 a", "- 100", ": 164 20 0 b", "- 200", ": 280 4 0 c", "E"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_analyze_detects_preview(tmp_path: Path, ffmpeg: str) -> None:
+    file = _write_song(tmp_path, "Test - My Song")
+    analyzer = PreviewAnalyzer(workers=1, ffmpeg=ffmpeg)
+    try:
+        analysis = await analyzer.analyze(file, tmp_path)
+    finally:
+        analyzer.close()
+
+    assert analysis.error is None
+    assert float(analysis.headers["PREVIEWSTART"]) == pytest.approx(20, abs=1)
+    assert "MEDLEYSTARTBEAT" not in analysis.headers
+
+
+@pytest.mark.asyncio
+async def test_analyze_detects_medley(tmp_path: Path, ffmpeg: str) -> None:
+    file = _write_song(tmp_path, "Test - My Song")
+    analyzer = PreviewAnalyzer(workers=1, medley=True, ffmpeg=ffmpeg)
+    try:
+        analysis = await analyzer.analyze(file, tmp_path)
+    finally:
+        analyzer.close()
+
+    # The chorus from 20s to 35s covers beats 160 to 280 at 120 BPM.
+    assert analysis.headers["MEDLEYSTARTBEAT"] == "164"
+    assert analysis.headers["MEDLEYENDBEAT"] == "284"
+
+
+@pytest.mark.asyncio
+async def test_analyze_keeps_existing_headers(tmp_path: Path, ffmpeg: str) -> None:
+    file = _write_song(tmp_path, "Test - My Song")
+    file.headers["PREVIEWSTART"] = "12.5"
+    analyzer = PreviewAnalyzer(workers=1, ffmpeg=ffmpeg)
+    try:
+        analysis = await analyzer.analyze(file, tmp_path)
+    finally:
+        analyzer.close()
+
+    assert analysis.headers == {}
+
+
+@pytest.mark.asyncio
+async def test_analyze_batches_songs(tmp_path: Path, ffmpeg: str) -> None:
+    files = [_write_song(tmp_path / str(idx), f"Song {idx}") for idx in range(3)]
+    (tmp_path / "2" / "Song 2.mp3").write_bytes(b"")
+    analyzer = PreviewAnalyzer(workers=2, batch_size=3, ffmpeg=ffmpeg)
+    try:
+        analyses = await asyncio.gather(
+            *(
+                analyzer.analyze(file, tmp_path / str(idx))
+                for idx, file in enumerate(files)
+            )
+        )
+    finally:
+        analyzer.close()
+
+    assert [analysis.name for analysis in analyses] == ["Song 0", "Song 1", "Song 2"]
+    assert "PREVIEWSTART" in analyses[0].headers
+    assert "PREVIEWSTART" in analyses[1].headers
+    assert analyses[2].headers == {}
+    assert analyses[2].error == "Invalid data found when processing input"
+
+
+@pytest.mark.asyncio
+async def test_analyze_without_ffmpeg(tmp_path: Path) -> None:
+    analyzer = PreviewAnalyzer(ffmpeg=None)
+    analyzer._ffmpeg = None
+
+    assert not analyzer.available
+    with pytest.raises(PreviewAnalyzerException, match="ffmpeg is not installed"):
+        await analyzer.analyze(_write_song(tmp_path, "Test - My Song"), tmp_path)
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from usdb_downloader.api import Downloader, JobState, SongResult
+from usdb_downloader.models import VideoInfo
+from usdb_downloader.youtube_downloader import YoutubeDownloaderException
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+
+def _create_song(path: Path, artist: str, video_id: str) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        f"#ARTIST:{artist}\n#TITLE:My Song\n#VIDEO:v={video_id}\n: 0 1 2 My\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+@pytest.fixture
+def downloader(tmp_path: Path) -> Generator[Downloader]:
+    downloader = Downloader(
+        input_dir=tmp_path / "input",
+        output_dir=tmp_path / "output",
+    )
+
+    def resolve(video_id: str) -> VideoInfo:
+        return VideoInfo(video_id=video_id, available=True)
+
+    youtube_downloader = downloader._app._youtube_downloader
+    youtube_downloader.resolve = AsyncMock(side_effect=resolve)
+    youtube_downloader.download_audio = AsyncMock()
+    youtube_downloader.download_video = AsyncMock()
+    downloader._app._verifier = MagicMock(available=False)
+    yield downloader
+    downloader.close()
+
+
+@pytest.mark.asyncio
+async def test_download_song(tmp_path: Path, downloader: Downloader) -> None:
+    path = _create_song(
+        tmp_path / "input" / "Test - My Song.txt", "Test", "dQw4w9WgXcQ"
+    )
+
+    result = await downloader.download_song(path)
+
+    song_dir = tmp_path / "output" / "Test - My Song"
+    assert result == SongResult(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        state=JobState.DONE,
+        song_dir=song_dir,
+    )
+    assert (song_dir / "Test - My Song.txt").is_file()
+
+
+@pytest.mark.asyncio
+async def test_download_song_twice_skips_finished_song(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    path = _create_song(
+        tmp_path / "input" / "Test - My Song.txt", "Test", "dQw4w9WgXcQ"
+    )
+    download_audio = AsyncMock()
+    downloader._app._youtube_downloader.download_audio = download_audio
+    await downloader.download_song(path)
+
+    result = await downloader.download_song(path)
+
+    assert result.state == JobState.SKIPPED
+    assert result.error == "Already processed"
+    download_audio.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_download_batch_streams_results(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    input_dir = tmp_path / "input"
+    _create_song(input_dir / "a" / "Test - My Song.txt", "Test", "dQw4w9WgXcQ")
+    _create_song(input_dir / "b" / "Band - Anthem.txt", "Band", "eQw4w9WgXcQ")
+    _create_song(input_dir / "b" / "Test - Copy.txt", "Other", "dQw4w9WgXcQ")
+    broken = input_dir / "Broken.txt"
+    broken.write_text("#ARTIST:Nobody\n", encoding="utf-8")
+    downloader._app._youtube_downloader.download_video = AsyncMock(
+        side_effect=[YoutubeDownloaderException("Download failed"), None]
+    )
+
+    results = {
+        result.name: result
+        async for result in downloader.download_batch(
+            [input_dir / "a", input_dir / "b", broken]
+        )
+    }
+
+    assert {name: result.state for name, result in results.items()} == {
+        "Broken": JobState.FAILED,
+        "Test - My Song": JobState.FAILED,
+        "Band - Anthem": JobState.DONE,
+        "Test - Copy": JobState.SKIPPED,
+    }
+    assert results["Broken"].error == "Song file has no video ID"
+    assert results["Test - My Song"].error == "Video: Download failed"
+    assert results["Test - Copy"].error == "Duplicate of Test - My Song"
+
+
+@pytest.mark.asyncio
+async def test_reconcile_keeps_downloaded_song(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    # The uploaded song file is gone, as with songs submitted to the server.
+    upload = _create_song(
+        tmp_path / "upload" / "Band - Anthem.txt", "Band", "eQw4w9WgXcQ"
+    )
+    await downloader.download_song(upload)
+    upload.unlink()
+    _create_song(tmp_path / "input" / "Test - My Song.txt", "Test", "dQw4w9WgXcQ")
+    orphan = tmp_path / "output" / "Gone - Song"
+    orphan.mkdir(parents=True)
+    (orphan / "Gone - Song.txt").touch()
+
+    downloader._app.reconcile(workers=1)
+
+    assert (tmp_path / "output" / "Band - Anthem" / "Band - Anthem.txt").is_file()
+    assert not orphan.exists()
@@ -1,16 +1,26 @@
 from __future__ import annotations
 
+import asyncio
+import threading
 from contextlib import contextmanager
+from dataclasses import replace
 from typing import TYPE_CHECKING
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import ANY, AsyncMock, MagicMock
 
 import pytest
 
+from usdb_downloader.analyzer import PreviewAnalysis
 from usdb_downloader.app import App
+from usdb_downloader.job_queue import JobState
+from usdb_downloader.layout import Layout
+from usdb_downloader.models import VideoInfo
 from usdb_downloader.parser import File
+from usdb_downloader.replaygain import ReplayGain, TagRequest
+from usdb_downloader.verifier import MediaProbe, Verification
 from usdb_downloader.youtube_downloader import YoutubeDownloaderException
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
     from pathlib import Path
 
 
@@ -37,13 +47,45 @@ def mock_console() -> MagicMock:
     return console
 
 
+@pytest.fixture
+def mock_verifier() -> MagicMock:
+    def verify(file: File, song_dir: Path) -> Verification:
+        return Verification(
+            name=file.name,
+            expected_duration=None,
+            media=(),
+            problems=(),
+        )
+
+    verifier = MagicMock(available=True, workers=2)
+    verifier.verify = AsyncMock(side_effect=verify)
+    return verifier
+
+
 @pytest.fixture
 def app(
     input_dir: Path,
     output_dir: Path,
     mock_console: MagicMock,
+    mock_verifier: MagicMock,
 ) -> App:
-    return App(input_dir=input_dir, output_dir=output_dir, console=mock_console)
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        verifier=mock_verifier,
+    )
+    app._youtube_downloader.resolve = AsyncMock(side_effect=_video_info)
+    return app
+
+
+def _video_info(video_id: str) -> VideoInfo:
+    return VideoInfo(
+        video_id=video_id,
+        available=True,
+        audio_format="140",
+        video_format="248",
+    )
 
 
 @pytest.fixture
@@ -97,6 +139,7 @@ async def test_run_with_single_file_success(
         idx=1,
         total=1,
         name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
     )
     app._parser.write_file.assert_called_once_with(sample_file)
     mock_console.print_song_step.assert_any_call("Parsed song file")
@@ -105,20 +148,22 @@ async def test_run_with_single_file_success(
     app._youtube_downloader.download_audio.assert_called_once_with(
         video_id="dQw4w9WgXcQ",
         output_path=expected_output_path,
+        format_id="140",
+        on_postprocess=ANY,
     )
     app._youtube_downloader.download_video.assert_called_once_with(
         video_id="dQw4w9WgXcQ",
         output_path=expected_output_path,
+        format_id="248",
     )
 
     mock_console.print_song_step_spinner.assert_called_once_with(
-        "Downloading audio and video (ID: dQw4w9WgXcQ)"
-    )
-    mock_console.print_song_step.assert_any_call(
-        "Downloading audio and video (ID: dQw4w9WgXcQ)"
+        "Downloading audio (ID: dQw4w9WgXcQ)"
     )
+    mock_console.print_song_step.assert_any_call("Downloading audio (ID: dQw4w9WgXcQ)")
 
-    mock_console.print_song_success.assert_called_once()
+    mock_console.print_song_success.assert_called_once_with("Singable, video follows")
+    mock_console.print_video_success.assert_called_once_with("Test - My Song")
     mock_console.print_search_cover.assert_called_once_with(
         name="Test - My Song",
         url="https://www.google.com/search?tbm=isch&q=Test%20-%20My%20Song%20Spotify%20Cover",
@@ -126,6 +171,7 @@ async def test_run_with_single_file_success(
     mock_console.print_summary.assert_called_once_with(
         processed=1,
         failed=0,
+        skipped=0,
     )
 
 
@@ -145,14 +191,14 @@ async def test_run_with_youtube_downloader_exception(
     await app.run()
 
     mock_console.print_song_count.assert_called_once_with(1)
-    mock_console.print_song_error.assert_called_once_with(
-        "Failed to download audio and video"
-    )
+    mock_console.print_song_error.assert_called_once_with("Failed to download audio")
+    app._youtube_downloader.download_video.assert_not_called()
     mock_console.print_song_success.assert_not_called()
     mock_console.print_search_cover.assert_not_called()
     mock_console.print_summary.assert_called_once_with(
         processed=0,
         failed=1,
+        skipped=0,
     )
 
 
@@ -219,16 +265,19 @@ async def test_run_with_multiple_files_mixed_results(
         idx=1,
         total=3,
         name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
     )
     mock_console.print_song_start.assert_any_call(
         idx=2,
         total=3,
         name="Test - Your Song",
+        video_id="eQw4w9WgXcQ",
     )
     mock_console.print_song_start.assert_any_call(
         idx=3,
         total=3,
         name="Test - Our Song",
+        video_id="fQw4w9WgXcQ",
     )
 
     assert mock_console.print_song_success.call_count == 2
@@ -237,4 +286,829 @@ async def test_run_with_multiple_files_mixed_results(
     mock_console.print_summary.assert_called_once_with(
         processed=2,
         failed=1,
+        skipped=0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_downloads_while_scanning(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    downloaded = threading.Event()
+
+    def iter_files() -> Iterator[File]:
+        yield sample_file
+        # The second song is only found once the first one is downloading.
+        assert downloaded.wait(timeout=5)
+        yield replace(
+            sample_file,
+            name="Test - Your Song",
+            video_id="abcdefghijk",
+            headers={**sample_file.headers, "TITLE": "Your Song"},
+        )
+
+    async def download_audio(**_: object) -> None:
+        downloaded.set()
+
+    app._parser.iter_files = MagicMock(return_value=iter_files())
+    app._parser.write_file = MagicMock()
+    download_audio_mock = AsyncMock(side_effect=download_audio)
+    app._youtube_downloader.download_audio = download_audio_mock
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    assert download_audio_mock.await_count == 2
+    mock_console.print_song_count.assert_called_once_with(2)
+    mock_console.print_summary.assert_called_once_with(
+        processed=2,
+        failed=0,
+        skipped=0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_skips_song_claimed_by_another_node(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+    output_dir: Path,
+) -> None:
+    lock_dir = output_dir / App.STATE_DIR_NAME / "locks"
+    lock_dir.mkdir(parents=True)
+    (lock_dir / "Test - My Song.lock").write_text("other-node:1\n", encoding="utf-8")
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    app._youtube_downloader.download_audio.assert_not_called()
+    app._youtube_downloader.download_video.assert_not_called()
+    app._parser.write_file.assert_not_called()
+    mock_console.print_song_skipped.assert_called_once_with("Claimed by another node")
+    mock_console.print_summary.assert_called_once_with(
+        processed=0,
+        failed=0,
+        skipped=1,
+    )
+    assert (lock_dir / "Test - My Song.lock").exists()
+
+
+@pytest.mark.asyncio
+async def test_run_releases_lock_after_song(
+    app: App,
+    sample_file: File,
+    output_dir: Path,
+) -> None:
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.download_audio = AsyncMock(
+        side_effect=YoutubeDownloaderException("Download failed")
+    )
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    lock_dir = output_dir / App.STATE_DIR_NAME / "locks"
+    assert not (lock_dir / "Test - My Song.lock").exists()
+
+
+@pytest.mark.asyncio
+async def test_run_records_job_states(
+    app: App,
+    sample_file: File,
+) -> None:
+    failing_file = File(name="Test - Your Song", video_id="eQw4w9WgXcQ")
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file, failing_file]))
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.download_audio = AsyncMock(
+        side_effect=[None, YoutubeDownloaderException("Video unavailable")]
+    )
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    assert app._job_queue.status() == {JobState.DONE: 1, JobState.FAILED: 1}
+    [failure] = app._job_queue.failures()
+    assert failure.name == "Test - Your Song"
+    assert failure.error == "Video unavailable"
+
+
+@pytest.mark.asyncio
+async def test_run_resumes_without_reprocessing_done_songs(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    await app.run()
+
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    await app.run()
+
+    app._youtube_downloader.download_audio.assert_called_once()
+    mock_console.print_song_count.assert_called_with(0)
+
+
+@pytest.mark.asyncio
+async def test_run_rejects_unavailable_video_before_download(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.resolve = AsyncMock(
+        return_value=VideoInfo(
+            video_id="dQw4w9WgXcQ",
+            available=False,
+            error="Video unavailable",
+        )
+    )
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    app._youtube_downloader.download_audio.assert_not_called()
+    app._youtube_downloader.download_video.assert_not_called()
+    mock_console.print_song_error.assert_called_once_with(
+        "Video is unavailable (ID: dQw4w9WgXcQ)"
+    )
+    assert [failure.error for failure in app._job_queue.failures()] == [
+        "Video unavailable"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_run_downloads_when_resolve_fails_transiently(
+    app: App,
+    sample_file: File,
+) -> None:
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.resolve = AsyncMock(
+        side_effect=YoutubeDownloaderException("HTTP Error 429: Too Many Requests")
+    )
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    app._youtube_downloader.download_audio.assert_called_once_with(
+        video_id="dQw4w9WgXcQ",
+        output_path=ANY,
+        format_id=None,
+        on_postprocess=ANY,
+    )
+    assert app._job_queue.status() == {JobState.DONE: 1}
+    assert app._metadata_cache.get("dQw4w9WgXcQ") is None
+
+
+@pytest.mark.asyncio
+async def test_run_resolves_upcoming_songs_ahead_of_download(
+    app: App,
+    sample_file: File,
+) -> None:
+    other_file = File(name="Test - Your Song", video_id="eQw4w9WgXcQ")
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file, other_file]))
+    app._parser.write_file = MagicMock()
+    resolved_during_first_download: list[bool] = []
+
+    async def download_audio(**_: object) -> None:
+        if not resolved_during_first_download:
+            await asyncio.sleep(0)
+            resolved_during_first_download.append(
+                app._metadata_cache.get("eQw4w9WgXcQ") is not None
+            )
+
+    app._youtube_downloader.resolve = AsyncMock(side_effect=_video_info)
+    app._youtube_downloader.download_audio = AsyncMock(side_effect=download_audio)
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    assert resolved_during_first_download == [True]
+    assert app._youtube_downloader.resolve.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_run_writes_song_file_before_video_lands(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    second_file = File(name="Test - Your Song", video_id="eQw4w9WgXcQ")
+    video_release = asyncio.Event()
+    written_before_video: list[str] = []
+    write_file = MagicMock()
+
+    async def download_video(**_: object) -> None:
+        await asyncio.wait_for(video_release.wait(), timeout=5)
+
+    async def download_audio(video_id: str, **_: object) -> None:
+        # The second audio starts while the first video is still downloading.
+        if video_id == second_file.video_id:
+            written_before_video.extend(
+                file.name for (file,), _ in write_file.call_args_list
+            )
+            video_release.set()
+
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file, second_file]))
+    app._parser.write_file = write_file
+    app._youtube_downloader.download_audio = AsyncMock(side_effect=download_audio)
+    app._youtube_downloader.download_video = AsyncMock(side_effect=download_video)
+
+    await app.run()
+
+    assert written_before_video == ["Test - My Song"]
+    assert app._job_queue.status() == {JobState.DONE: 2}
+    mock_console.print_summary.assert_called_once_with(
+        processed=2,
+        failed=0,
+        skipped=0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_song_file_when_video_fails(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+    output_dir: Path,
+) -> None:
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock(
+        side_effect=YoutubeDownloaderException("Download failed")
+    )
+
+    await app.run()
+
+    assert (output_dir / "Test - My Song" / "Test - My Song.txt").is_file()
+    mock_console.print_video_error.assert_called_once_with(
+        "Test - My Song", "Failed to download video"
+    )
+    assert [failure.error for failure in app._job_queue.failures()] == [
+        "Video: Download failed"
+    ]
+    lock_dir = output_dir / App.STATE_DIR_NAME / "locks"
+    assert not (lock_dir / "Test - My Song.lock").exists()
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_other_songs_when_video_task_breaks(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    other_file = replace(
+        sample_file,
+        name="Test - Your Song",
+        video_id="abcdefghijk",
+        headers={**sample_file.headers, "TITLE": "Your Song"},
+    )
+
+    async def download_video(video_id: str, **_: object) -> None:
+        if video_id == sample_file.video_id:
+            raise OSError("Disk full")
+
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file, other_file]))
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock(side_effect=download_video)
+
+    await app.run()
+
+    mock_console.print_video_error.assert_called_once_with(
+        "Test - My Song", "Failed to finish video"
+    )
+    mock_console.print_video_success.assert_called_once_with("Test - Your Song")
+    assert [failure.error for failure in app._job_queue.failures()] == [
+        "Video: Disk full"
+    ]
+    mock_console.print_summary.assert_called_once_with(
+        processed=1,
+        failed=1,
+        skipped=0,
     )
+
+
+def test_enqueue_skips_duplicates_of_library_and_scan(
+    app: App,
+    mock_console: MagicMock,
+    sample_file: File,
+    output_dir: Path,
+) -> None:
+    app._catalog.record(sample_file, output_dir / sample_file.name)
+    renamed = File(
+        name="Test - My Song (Copy)",
+        video_id="abcdefghijk",
+        headers={"ARTIST": "test", "TITLE": "my song"},
+        lyrics=[],
+    )
+    new_song = File(
+        name="Band - Anthem",
+        video_id="ABCDEFGHIJK",
+        headers={"ARTIST": "Band", "TITLE": "Anthem"},
+        lyrics=[],
+    )
+    same_video = File(
+        name="Band - Anthem (Live)",
+        video_id="ABCDEFGHIJK",
+        headers={"ARTIST": "Band", "TITLE": "Anthem (Live)"},
+        lyrics=[],
+    )
+    app._parser.iter_files = MagicMock(
+        return_value=iter([sample_file, renamed, new_song, same_video])
+    )
+
+    assert app.enqueue() == 2
+
+    mock_console.print_duplicate.assert_any_call(
+        name="Test - My Song (Copy)", existing="Test - My Song"
+    )
+    mock_console.print_duplicate.assert_any_call(
+        name="Band - Anthem (Live)", existing="Band - Anthem"
+    )
+    assert mock_console.print_duplicate.call_count == 2
+
+
+def test_enqueue_allows_duplicates(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        allow_duplicates=True,
+    )
+    duplicate = File(
+        name="Other Name",
+        video_id=sample_file.video_id,
+        headers={},
+        lyrics=[],
+    )
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file, duplicate]))
+
+    assert app.enqueue() == 2
+    mock_console.print_duplicate.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_run_writes_into_layout(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+    mock_verifier: MagicMock,
+    sample_file: File,
+) -> None:
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        layout=Layout.INITIAL,
+        verifier=mock_verifier,
+    )
+    app._youtube_downloader.resolve = AsyncMock(
+        return_value=VideoInfo(video_id=sample_file.video_id, available=True)
+    )
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+
+    await app.run()
+
+    song_dir = output_dir / "T" / "Test - My Song"
+    assert (song_dir / "Test - My Song.txt").is_file()
+    app._youtube_downloader.download_audio.assert_called_once_with(
+        video_id=sample_file.video_id,
+        output_path=song_dir / "Test - My Song",
+        format_id=None,
+        on_postprocess=ANY,
+    )
+
+
+def test_migrate_moves_songs_and_skips_locked(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+) -> None:
+    for name in ("Test - My Song", "Band - Anthem", "Flat - Song"):
+        song_dir = output_dir / name
+        song_dir.mkdir(parents=True)
+        artist = name.partition(" - ")[0]
+        (song_dir / f"{name}.txt").write_text(f"#ARTIST:{artist}\n", encoding="utf-8")
+    (output_dir / "F" / "Flat - Song").mkdir(parents=True)
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        layout=Layout.INITIAL,
+    )
+    app._locks.acquire("Band - Anthem")
+
+    app.migrate()
+
+    assert (output_dir / "T" / "Test - My Song" / "Test - My Song.txt").is_file()
+    assert (output_dir / "Band - Anthem").is_dir()
+    mock_console.print_summary.assert_called_once_with(
+        processed=1,
+        failed=1,
+        skipped=1,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_fails_song_with_broken_media(
+    app: App,
+    mock_console: MagicMock,
+    mock_verifier: MagicMock,
+    sample_file: File,
+) -> None:
+    verification = Verification(
+        name=sample_file.name,
+        expected_duration=52.0,
+        media=(),
+        problems=("Test - My Song.mp3 is 30.0s long, but the notes end at 52.0s",),
+    )
+    mock_verifier.verify = AsyncMock(return_value=verification)
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._parser.write_file = MagicMock()
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    await app.run()
+
+    mock_verifier.quarantine.assert_called_once_with(verification)
+    mock_console.print_video_error.assert_called_once_with(
+        "Test - My Song",
+        "Verification failed: Test - My Song.mp3 is 30.0s long, "
+        "but the notes end at 52.0s",
+    )
+    [failure] = app._job_queue.failures()
+    assert failure.error == verification.problems[0]
+
+
+@pytest.mark.asyncio
+async def test_run_writes_detected_preview(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+    mock_verifier: MagicMock,
+    sample_file: File,
+) -> None:
+    analyzer = MagicMock(available=True)
+    analyzer.analyze = AsyncMock(
+        return_value=PreviewAnalysis(
+            name=sample_file.name,
+            headers={"PREVIEWSTART": "30.0"},
+        )
+    )
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        verifier=mock_verifier,
+        analyzer=analyzer,
+    )
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._youtube_downloader.resolve = AsyncMock(
+        return_value=VideoInfo(video_id=sample_file.video_id, available=True)
+    )
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    try:
+        await app.run()
+    finally:
+        app.close()
+
+    song_dir = output_dir / "Test - My Song"
+    analyzer.analyze.assert_awaited_once_with(sample_file, song_dir)
+    analyzer.close.assert_called_once()
+    text = (song_dir / "Test - My Song.txt").read_text(encoding="utf-8")
+    assert "#PREVIEWSTART:30.0\n" in text
+    mock_console.print_summary.assert_called_once_with(
+        processed=1,
+        failed=0,
+        skipped=0,
+    )
+
+
+@pytest.mark.asyncio
+async def test_run_records_replaygain_of_new_download(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+    mock_verifier: MagicMock,
+    sample_file: File,
+) -> None:
+    tagger = MagicMock(available=True)
+    tagger.tag = AsyncMock(
+        return_value=ReplayGain(
+            name=sample_file.name,
+            loudness=-12.0,
+            peak=0.9,
+            gain=-6.0,
+            audio_size=5,
+            audio_mtime=1,
+        )
+    )
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        verifier=mock_verifier,
+        tagger=tagger,
+    )
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._youtube_downloader.resolve = AsyncMock(
+        return_value=VideoInfo(video_id=sample_file.video_id, available=True)
+    )
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    try:
+        await app.run()
+        stamp = app._catalog.loudness_stamp(sample_file.name)
+    finally:
+        app.close()
+
+    song_dir = output_dir / "Test - My Song"
+    tagger.tag.assert_awaited_once_with(
+        "Test - My Song",
+        song_dir / "Test - My Song.mp3",
+    )
+    assert stamp == (5, 1, False)
+    mock_verifier.verify.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_run_keeps_song_when_analysis_fails(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+    mock_verifier: MagicMock,
+    sample_file: File,
+) -> None:
+    analyzer = MagicMock(available=True)
+    analyzer.analyze = AsyncMock(
+        return_value=PreviewAnalysis(name=sample_file.name, error="Audio is silent")
+    )
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        verifier=mock_verifier,
+        analyzer=analyzer,
+    )
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._youtube_downloader.resolve = AsyncMock(
+        return_value=VideoInfo(video_id=sample_file.video_id, available=True)
+    )
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock()
+
+    try:
+        await app.run()
+    finally:
+        app.close()
+
+    text = (output_dir / "Test - My Song" / "Test - My Song.txt").read_text(
+        encoding="utf-8"
+    )
+    assert "#PREVIEWSTART" not in text
+    mock_console.print_video_success.assert_called_once_with("Test - My Song")
+
+
+@pytest.mark.asyncio
+async def test_verify_requeues_suspicious_songs(
+    app: App,
+    mock_console: MagicMock,
+    mock_verifier: MagicMock,
+    output_dir: Path,
+) -> None:
+    songs = [
+        File(name="Good - Song", video_id="aaaaaaaaaaa", headers={"MP3": "a.mp3"}),
+        File(name="Bad - Song", video_id="bbbbbbbbbbb", headers={"MP3": "b.mp3"}),
+    ]
+    for song in songs:
+        app._parser.write_file(song)
+    missing = File(name="Gone - Song", video_id="ccccccccccc")
+    app._catalog.record(missing, output_dir / missing.name)
+
+    def verify(file: File, song_dir: Path) -> Verification:
+        probe = MediaProbe(
+            path=song_dir / file.headers["MP3"],
+            kind="audio",
+            size=3,
+            sha256="abc",
+            duration=1.0,
+        )
+        problems = ("b.mp3 has no duration",) if file.name == "Bad - Song" else ()
+        return Verification(
+            name=file.name,
+            expected_duration=None,
+            media=(probe,),
+            problems=problems,
+        )
+
+    mock_verifier.verify = AsyncMock(side_effect=verify)
+
+    await app.verify()
+
+    mock_console.print_song_suspicious.assert_called_once_with(
+        "Bad - Song", ("b.mp3 has no duration",)
+    )
+    mock_console.print_summary.assert_called_once_with(
+        processed=1,
+        failed=1,
+        skipped=1,
+    )
+    assert app._catalog.checksums("Good - Song") == {"a.mp3": "abc"}
+    job = app._job_queue.claim()
+    assert job is not None
+    assert job.file.name == "Bad - Song"
+    assert job.file.video_id == "bbbbbbbbbbb"
+    assert app._job_queue.claim() is None
+
+
+def test_rewrite_records_songs_in_catalog(
+    app: App,
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+) -> None:
+    input_dir.mkdir(parents=True)
+    (input_dir / "Test - My Song.txt").write_text(
+        "#ARTIST:Test\n#TITLE:My Song\n#VIDEO:v=dQw4w9WgXcQ\n: 0 1 2 My\n",
+        encoding="utf-8",
+    )
+    (input_dir / "Broken.txt").write_text("#ARTIST:Nobody\n", encoding="utf-8")
+    song_dir = output_dir / "Test - My Song"
+    song_dir.mkdir(parents=True)
+    (song_dir / "Test - My Song.txt").write_text("#ARTIST:Old\n", encoding="utf-8")
+
+    app.rewrite(workers=2)
+
+    entry = app._catalog.get("Test - My Song")
+    assert entry is not None
+    assert entry.artist == "Test"
+    mock_console.print_song_error.assert_called_once_with("Broken has no video ID")
+    mock_console.print_summary.assert_called_once_with(
+        processed=1,
+        failed=1,
+        skipped=0,
+    )
+
+
+def test_replaygain_resumes_with_unmeasured_songs(
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+    sample_file: File,
+) -> None:
+    measured: list[list[str]] = []
+
+    def sweep(
+        requests: Iterable[TagRequest],
+        lock_dir: Path,
+    ) -> Iterator[list[ReplayGain]]:
+        assert lock_dir == output_dir / ".usdb_downloader" / "locks"
+        measured.append([])
+        for request in requests:
+            measured[-1].append(request.name)
+            stat = request.audio.stat()
+            yield [
+                ReplayGain(
+                    name=request.name,
+                    loudness=-12.0,
+                    peak=0.9,
+                    gain=-6.0,
+                    audio_size=stat.st_size,
+                    audio_mtime=stat.st_mtime_ns,
+                    normalized=tagger.normalize,
+                )
+            ]
+
+    tagger = MagicMock(available=True, normalize=False)
+    tagger.sweep.side_effect = sweep
+    app = App(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        console=mock_console,
+        tagger=tagger,
+    )
+    songs = [sample_file, replace(sample_file, name="Test - Other Song")]
+    for song in songs:
+        song_dir = output_dir / song.name
+        song_dir.mkdir(parents=True)
+        (song_dir / f"{song.name}.mp3").write_bytes(b"audio")
+        app._catalog.record(song, song_dir)
+    try:
+        app.replaygain()
+        # Songs whose audio changed since they were measured are measured again.
+        (output_dir / "Test - Other Song" / "Test - Other Song.mp3").write_bytes(b"new")
+        app.replaygain()
+        # Switching normalisation on measures every song again.
+        tagger.normalize = True
+        app.replaygain()
+        app.replaygain()
+    finally:
+        app.close()
+
+    assert measured == [
+        ["Test - My Song", "Test - Other Song"],
+        ["Test - Other Song"],
+        ["Test - My Song", "Test - Other Song"],
+        [],
+    ]
+    assert mock_console.print_summary.call_args_list[1].kwargs == {
+        "processed": 1,
+        "failed": 0,
+        "skipped": 1,
+    }
+
+
+def test_reconcile_removes_orphaned_songs(
+    app: App,
+    input_dir: Path,
+    output_dir: Path,
+    mock_console: MagicMock,
+) -> None:
+    input_dir.mkdir(parents=True)
+    (input_dir / "Test - My Song.txt").write_text(
+        "#ARTIST:Test\n#TITLE:My Song\n#VIDEO:v=dQw4w9WgXcQ\n: 0 1 2 My\n",
+        encoding="utf-8",
+    )
+    for name in ("Test - My Song", "Gone - Song", "Busy - Song"):
+        song_dir = output_dir / name
+        song_dir.mkdir(parents=True)
+        (song_dir / f"{name}.txt").write_text("#ARTIST:Old\n", encoding="utf-8")
+        (song_dir / f"{name}.mp3").write_bytes(b"audio")
+    app._locks.acquire("Busy - Song")
+
+    app.reconcile(workers=1, dry_run=True)
+    assert (output_dir / "Gone - Song").is_dir()
+
+    app.reconcile(workers=1)
+
+    assert not (output_dir / "Gone - Song").exists()
+    assert (output_dir / "Busy - Song").is_dir()
+    assert (output_dir / "Test - My Song" / "Test - My Song.mp3").is_file()
+    mock_console.print_song_removed.assert_called_with(
+        "Gone - Song", output_dir / "Gone - Song", False
+    )
+    # The song file is rewritten by the dry run, the second run leaves it alone.
+    assert mock_console.print_summary.call_args_list[-1].kwargs == {
+        "processed": 1,
+        "failed": 0,
+        "skipped": 2,
+    }
+
+
+def test_reconcile_keeps_library_without_input(
+    app: App,
+    output_dir: Path,
+    mock_console: MagicMock,
+) -> None:
+    song_dir = output_dir / "Test - My Song"
+    song_dir.mkdir(parents=True)
+    (song_dir / "Test - My Song.txt").touch()
+
+    app.reconcile(workers=1)
+
+    assert song_dir.is_dir()
+    mock_console.print_failure.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_run_refreshes_locks_during_download(
+    app: App,
+    sample_file: File,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(App, "_LOCK_REFRESH_INTERVAL", 0.01)
+
+    async def download_video(**_: object) -> None:
+        await asyncio.sleep(0.1)
+
+    app._parser.iter_files = MagicMock(return_value=iter([sample_file]))
+    app._parser.write_file = MagicMock()
+    app._locks.refresh = MagicMock()
+    app._youtube_downloader.download_audio = AsyncMock()
+    app._youtube_downloader.download_video = AsyncMock(side_effect=download_video)
+
+    await app.run()
+
+    app._locks.refresh.assert_called()
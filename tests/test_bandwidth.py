@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import datetime
+import threading
+import time
+
+import pytest
+
+from usdb_downloader.bandwidth import (
+    BandwidthLimiter,
+    BandwidthWindow,
+    Priority,
+    parse_rate,
+)
+
+
+def test_parse_rate() -> None:
+    assert parse_rate("500") == 500
+    assert parse_rate("50K") == 50 * 1024
+    assert parse_rate("1.5MiB") == 1.5 * 1024**2
+
+    with pytest.raises(ValueError, match="positive number of bytes"):
+        parse_rate("fast")
+    with pytest.raises(ValueError, match="positive number of bytes"):
+        parse_rate("0")
+
+
+def test_parse_window() -> None:
+    window = BandwidthWindow.parse("09:00-18:00=2M")
+
+    assert window == BandwidthWindow(
+        start=datetime.time(9),
+        end=datetime.time(18),
+        rate=2 * 1024**2,
+    )
+    assert window.contains(datetime.time(12, 30))
+    assert not window.contains(datetime.time(18))
+
+    with pytest.raises(ValueError, match="09:00-18:00=2M"):
+        BandwidthWindow.parse("09:00-18:00")
+
+
+def test_window_wraps_around_midnight() -> None:
+    window = BandwidthWindow.parse("22:00-06:00=1M")
+
+    assert window.contains(datetime.time(23))
+    assert window.contains(datetime.time(5, 59))
+    assert not window.contains(datetime.time(12))
+
+
+def test_schedule_overrides_rate() -> None:
+    now = datetime.datetime(2026, 1, 5, 10, 0)
+    limiter = BandwidthLimiter(
+        rate=None,
+        schedule=[BandwidthWindow.parse("09:00-18:00=1M")],
+        now=lambda: now,
+    )
+
+    assert limiter.enabled
+    assert limiter.rate() == 1024**2
+
+    now = datetime.datetime(2026, 1, 5, 20, 0)
+    assert limiter.rate() is None
+    # Unlimited outside of the schedule.
+    limiter.consume(10 * 1024**2)
+
+
+def test_consume_limits_throughput() -> None:
+    limiter = BandwidthLimiter(rate=10_000)
+
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.consume(1_000)
+
+    # The bucket starts empty, so 4000 bytes take at least 0.4s at 10000 B/s.
+    assert time.monotonic() - started >= 0.35
+
+
+def test_audio_gets_bandwidth_before_video() -> None:
+    limiter = BandwidthLimiter(rate=1_000)
+    finished: list[Priority] = []
+
+    def consume(priority: Priority) -> None:
+        limiter.consume(100, priority)
+        finished.append(priority)
+
+    video = threading.Thread(target=consume, args=(Priority.VIDEO,))
+    audio = threading.Thread(target=consume, args=(Priority.AUDIO,))
+    video.start()
+    time.sleep(0.02)
+    audio.start()
+    video.join(5)
+    audio.join(5)
+
+    assert finished == [Priority.AUDIO, Priority.VIDEO]
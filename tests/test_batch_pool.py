@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.batch_pool import BatchPool, BatchPoolException
+
+if TYPE_CHECKING:
+    from collections.abc import Sequence
+
+
+def _square_batch(items: Sequence[int]) -> list[tuple[int, int]]:
+    if any(item < 0 for item in items):
+        raise ValueError("Items must not be negative")
+    # Every result carries the size of the batch it was computed in.
+    return [(item * item, len(items)) for item in items]
+
+
+def _square_plus_one_batch(items: Sequence[int]) -> list[tuple[int, int]]:
+    return [(square + 1, size) for square, size in _square_batch(items)]
+
+
+@pytest.mark.asyncio
+async def test_submit_batches_items() -> None:
+    pool = BatchPool(
+        _square_plus_one_batch,
+        workers=1,
+        batch_size=3,
+        delay=0.01,
+    )
+    try:
+        results = await asyncio.gather(*(pool.submit(item) for item in range(4)))
+    finally:
+        pool.close()
+
+    # Three items fill a batch, the last one is flushed after the delay.
+    assert results == [(1, 3), (2, 3), (5, 3), (10, 1)]
+
+
+@pytest.mark.asyncio
+async def test_submit_raises_batch_errors() -> None:
+    pool = BatchPool(
+        _square_batch,
+        workers=1,
+        batch_size=2,
+        delay=0.01,
+    )
+    try:
+        results = await asyncio.gather(
+            pool.submit(1),
+            pool.submit(-1),
+            return_exceptions=True,
+        )
+    finally:
+        pool.close()
+
+    assert all(isinstance(result, BatchPoolException) for result in results)
+    assert str(results[0]) == "Items must not be negative"
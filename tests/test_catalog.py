@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.catalog import Catalog
+from usdb_downloader.models import File
+from usdb_downloader.replaygain import ReplayGain
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+
+@pytest.fixture
+def catalog(tmp_path: Path) -> Generator[Catalog]:
+    catalog = Catalog(tmp_path / "state" / "catalog.sqlite3")
+    yield catalog
+    catalog.close()
+
+
+@pytest.fixture
+def sample_file() -> File:
+    return File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={
+            "ARTIST": "Test",
+            "TITLE": "My Song",
+            "MP3": "Test - My Song.mp3",
+            "VIDEO": "Test - My Song.webm",
+        },
+        lyrics=[": 0 1 2 My", ": 3 4 5 Song"],
+    )
+
+
+def test_record_stores_headers_and_media_sizes(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    song_dir = tmp_path / "output" / sample_file.name
+    song_dir.mkdir(parents=True)
+    (song_dir / "Test - My Song.txt").write_bytes(b"12345")
+    (song_dir / "Test - My Song.mp3").write_bytes(b"123")
+
+    catalog.record(sample_file, song_dir)
+
+    entry = catalog.get(sample_file.name)
+    assert entry is not None
+    assert entry.artist == "Test"
+    assert entry.title == "My Song"
+    assert entry.video_id == "dQw4w9WgXcQ"
+    assert entry.path == song_dir
+    assert entry.txt_size == 5
+    assert entry.audio_size == 3
+    assert entry.video_size is None
+
+
+def test_record_updates_existing_song(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+    catalog.record(replace(sample_file, video_id="abcdefghijk"), tmp_path)
+
+    entry = catalog.get(sample_file.name)
+    assert entry is not None
+    assert entry.video_id == "abcdefghijk"
+    assert [e.name for e in catalog.search("song")] == [sample_file.name]
+
+
+def test_find_duplicate_by_video_id(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+
+    duplicate = File(
+        name="Other Name",
+        video_id=sample_file.video_id,
+        headers={},
+        lyrics=[],
+    )
+
+    entry = catalog.find_duplicate(duplicate)
+    assert entry is not None
+    assert entry.name == sample_file.name
+
+
+def test_find_duplicate_by_artist_and_title(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+
+    duplicate = File(
+        name="test - my song (1)",
+        video_id="abcdefghijk",
+        headers={"ARTIST": " TEST ", "TITLE": "my  song"},
+        lyrics=[],
+    )
+
+    entry = catalog.find_duplicate(duplicate)
+    assert entry is not None
+    assert entry.name == sample_file.name
+
+
+def test_find_duplicate_ignores_same_name_and_other_songs(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+
+    other = File(name="Other", video_id="abcdefghijk", headers={}, lyrics=[])
+
+    assert catalog.find_duplicate(sample_file) is None
+    assert catalog.find_duplicate(other) is None
+
+
+def test_search_matches_prefixes(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+    catalog.record(
+        File(
+            name="Band - Anthem",
+            video_id="abcdefghijk",
+            headers={"ARTIST": "Band", "TITLE": "Anthem"},
+            lyrics=[],
+        ),
+        tmp_path,
+    )
+
+    assert [e.name for e in catalog.search("anth")] == ["Band - Anthem"]
+    assert [e.name for e in catalog.search('test "my')] == [sample_file.name]
+    assert catalog.search("missing") == []
+    assert catalog.search("  ") == []
+
+
+def test_remove_drops_song_from_search(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+
+    catalog.remove(sample_file.name)
+
+    assert catalog.get(sample_file.name) is None
+    assert catalog.search("song") == []
+
+
+def test_transaction_rolls_back_on_error(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    with catalog.transaction():
+        catalog.record(sample_file, tmp_path)
+
+    with pytest.raises(RuntimeError), catalog.transaction():
+        catalog.remove(sample_file.name)
+        raise RuntimeError
+
+    assert catalog.get(sample_file.name) is not None
+
+
+def test_record_loudness_stamps_audio(
+    tmp_path: Path,
+    catalog: Catalog,
+    sample_file: File,
+) -> None:
+    catalog.record(sample_file, tmp_path)
+    assert catalog.loudness_stamp(sample_file.name) is None
+
+    catalog.record_loudness(
+        ReplayGain(
+            name=sample_file.name,
+            loudness=-12.5,
+            peak=0.98,
+            gain=-5.5,
+            audio_size=1234,
+            audio_mtime=5678,
+            normalized=True,
+        )
+    )
+
+    assert catalog.loudness_stamp(sample_file.name) == (1234, 5678, True)
+    entry = catalog.get(sample_file.name)
+    assert entry is not None
+    assert entry.audio_size == 1234
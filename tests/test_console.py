@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import io
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from usdb_downloader.console import (
+    Console,
+    JsonConsole,
+    NullConsole,
+    OutputMode,
+    create_console,
+)
+
+
+class _Terminal(io.StringIO):
+    def isatty(self) -> bool:
+        return True
+
+
+def _events(stream: io.StringIO) -> list[dict[str, object]]:
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.mark.parametrize("console_type", [JsonConsole, NullConsole])
+def test_console_overrides_every_output(console_type: type[Console]) -> None:
+    # Outputs that fall back to Console would format Rich markup.
+    outputs = {name for name in vars(Console) if name.startswith("print_")}
+
+    assert outputs <= set(vars(console_type))
+
+
+def test_json_console_writes_one_event_per_line() -> None:
+    stream = io.StringIO()
+    console = JsonConsole(stream)
+
+    console.print_song_start(
+        idx=1, total=2, name="Test - My Song", video_id="dQw4w9WgXcQ"
+    )
+    with console.print_song_step_spinner("Downloading audio"):
+        console.print_song_step("Downloading audio")
+    console.print_song_error("Failed to download audio")
+    # Results after the song has finished carry no song of their own.
+    console.print_song_skipped("Test - Other Song is being downloaded")
+    console.print_song_removed("Test - Müll", Path("/songs/Test - Müll"), dry_run=True)
+    console.print_summary(processed=1, failed=1)
+
+    events = _events(stream)
+    for event in events:
+        assert isinstance(event.pop("time"), float)
+    assert events == [
+        {
+            "event": "song_start",
+            "idx": 1,
+            "total": 2,
+            "name": "Test - My Song",
+            "video_id": "dQw4w9WgXcQ",
+        },
+        {
+            "event": "song_step",
+            "name": "Test - My Song",
+            "video_id": "dQw4w9WgXcQ",
+            "message": "Downloading audio",
+        },
+        {
+            "event": "song_failure",
+            "name": "Test - My Song",
+            "video_id": "dQw4w9WgXcQ",
+            "message": "Failed to download audio",
+        },
+        {
+            "event": "song_skipped",
+            "message": "Test - Other Song is being downloaded",
+        },
+        {
+            "event": "song_removed",
+            "name": "Test - Müll",
+            "path": "/songs/Test - Müll",
+            "dry_run": True,
+        },
+        {"event": "summary", "processed": 1, "failed": 1, "skipped": 0},
+    ]
+
+
+@pytest.mark.parametrize(
+    ("enabled", "mode", "stream", "expected"),
+    [
+        (True, OutputMode.AUTO, _Terminal(), Console),
+        (True, OutputMode.AUTO, io.StringIO(), JsonConsole),
+        (True, OutputMode.JSON, _Terminal(), JsonConsole),
+        (True, OutputMode.RICH, io.StringIO(), Console),
+        (False, OutputMode.JSON, io.StringIO(), NullConsole),
+    ],
+)
+def test_create_console(
+    enabled: bool,
+    mode: OutputMode,
+    stream: io.StringIO,
+    expected: type[Console],
+) -> None:
+    console = create_console(enabled, mode=mode, stream=stream)
+
+    assert type(console) is expected
+    console.print_summary(processed=1, failed=0)
+    if expected is not JsonConsole:
+        assert stream.getvalue() == ""
+
+
+def test_null_console_writes_nothing(capsys: pytest.CaptureFixture[str]) -> None:
+    console = NullConsole()
+
+    console.print_song_count(3)
+    console.print_failure("Application failed")
+
+    assert capsys.readouterr().out == ""
+
+
+def test_null_console_formats_nothing() -> None:
+    class Unformattable:
+        def __format__(self, format_spec: str) -> str:
+            raise AssertionError("Output was formatted")
+
+    console = NullConsole()
+    value: Any = Unformattable()
+
+    console.print_header(value, value, "1.0", shard=value)
+    console.print_song_start(idx=value, total=value, name=value)
+    console.print_song_step(value)
+    console.print_song_removed(value, value, dry_run=True)
+    console.print_summary(processed=value, failed=value, skipped=value)
+    with console.print_song_step_spinner(value):
+        pass
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import os
+from dataclasses import replace
+from typing import TYPE_CHECKING, Any
+
+import pytest
+
+from usdb_downloader.job_queue import JobQueue, JobState
+from usdb_downloader.models import File
+
+if TYPE_CHECKING:
+    from collections.abc import Generator, Iterator
+    from pathlib import Path
+
+
+@pytest.fixture
+def queue_path(tmp_path: Path) -> Path:
+    return tmp_path / "state" / "queue.sqlite3"
+
+
+@pytest.fixture
+def job_queue(queue_path: Path) -> Generator[JobQueue]:
+    job_queue = JobQueue(queue_path)
+    yield job_queue
+    job_queue.close()
+
+
+@pytest.fixture
+def sample_file() -> File:
+    return File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={"ARTIST": "Test", "TITLE": "My Song"},
+        lyrics=[": 0 1 2 My", ": 3 4 5 Song"],
+    )
+
+
+def test_enqueue_returns_pending_count(job_queue: JobQueue, sample_file: File) -> None:
+    assert job_queue.enqueue([sample_file]) == 1
+    assert job_queue.status() == {JobState.PENDING: 1}
+
+
+def test_claim_returns_job_with_file(job_queue: JobQueue, sample_file: File) -> None:
+    job_queue.enqueue([sample_file])
+
+    job = job_queue.claim()
+
+    assert job is not None
+    assert job.file == sample_file
+    assert job.attempts == 1
+    assert job_queue.status() == {JobState.DOWNLOADING: 1}
+    assert job_queue.claim() is None
+
+
+def test_claim_is_exclusive_across_connections(
+    queue_path: Path,
+    job_queue: JobQueue,
+    sample_file: File,
+) -> None:
+    job_queue.enqueue([sample_file])
+    other = JobQueue(queue_path)
+
+    claims = [job_queue.claim(), other.claim()]
+    other.close()
+
+    assert sum(job is not None for job in claims) == 1
+
+
+def test_enqueue_keeps_done_and_retries_failed(
+    job_queue: JobQueue,
+    sample_file: File,
+) -> None:
+    other_file = File(name="Test - Your Song", video_id="eQw4w9WgXcQ")
+    job_queue.enqueue([sample_file, other_file])
+    done, failed = job_queue.claim(), job_queue.claim()
+    assert done is not None
+    assert failed is not None
+    job_queue.set_state(done.id, JobState.DONE)
+    job_queue.set_state(failed.id, JobState.FAILED, error="Video unavailable")
+    assert [f.error for f in job_queue.failures()] == ["Video unavailable"]
+
+    assert job_queue.enqueue([sample_file, other_file]) == 1
+
+    retried = job_queue.claim()
+    assert retried is not None
+    assert retried.file.name == "Test - Your Song"
+    assert retried.attempts == 2
+
+
+@pytest.mark.parametrize(
+    "changes",
+    [{"video_id": "eQw4w9WgXcQ"}, {"lyrics": [": 0 1 2 Your"]}],
+)
+def test_enqueue_requeues_done_song_that_changed(
+    job_queue: JobQueue,
+    sample_file: File,
+    changes: dict[str, Any],
+) -> None:
+    job_queue.enqueue([sample_file])
+    job = job_queue.claim()
+    assert job is not None
+    job_queue.set_state(job.id, JobState.DONE)
+    changed = replace(sample_file, **changes)
+
+    assert job_queue.add([sample_file]) == 0
+    assert job_queue.add([changed]) == 1
+
+    retried = job_queue.claim()
+    assert retried is not None
+    assert retried.file == changed
+
+
+def test_enqueue_requeues_jobs_of_dead_workers(
+    job_queue: JobQueue,
+    sample_file: File,
+) -> None:
+    job_queue.enqueue([sample_file])
+    job_queue.claim()
+    job_queue._conn.execute("UPDATE jobs SET worker = ?", ("other-host:1",))
+
+    assert job_queue.enqueue([]) == 1
+
+
+def test_enqueue_keeps_jobs_of_live_workers(
+    job_queue: JobQueue,
+    sample_file: File,
+) -> None:
+    job_queue.enqueue([sample_file])
+    job_queue.claim()
+
+    assert job_queue.enqueue([]) == 0
+    assert job_queue._worker.endswith(f":{os.getpid()}")
+
+
+def test_add_commits_in_batches(
+    queue_path: Path,
+    job_queue: JobQueue,
+    sample_file: File,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(JobQueue, "_ENQUEUE_BATCH_SIZE", 1)
+    other = JobQueue(queue_path)
+    seen: list[dict[JobState, int]] = []
+
+    def files() -> Iterator[File]:
+        yield sample_file
+        seen.append(other.status())
+        yield replace(sample_file, name="Test - Your Song")
+
+    try:
+        assert job_queue.add(files()) == 2
+    finally:
+        other.close()
+
+    assert seen == [{JobState.PENDING: 1}]
+
+
+def test_is_scanning_sees_scan_of_other_process(
+    queue_path: Path,
+    job_queue: JobQueue,
+) -> None:
+    other = JobQueue(queue_path)
+    other._worker = "other-host:1"
+    try:
+        with job_queue.scanning():
+            assert not job_queue.is_scanning()
+            assert other.is_scanning()
+        assert not other.is_scanning()
+    finally:
+        other.close()
+
+
+def test_is_scanning_ignores_dead_scanner(
+    queue_path: Path,
+    job_queue: JobQueue,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    other = JobQueue(queue_path)
+    other._worker = "other-host:1"
+
+    def is_alive(pid: int) -> bool:
+        return False
+
+    monkeypatch.setattr(JobQueue, "_is_alive", staticmethod(is_alive))
+    try:
+        with job_queue.scanning():
+            assert not other.is_scanning()
+    finally:
+        other.close()
+
+
+def test_requeue_resets_done_song(job_queue: JobQueue, sample_file: File) -> None:
+    job_queue.enqueue([sample_file])
+    job = job_queue.claim()
+    assert job is not None
+    job_queue.set_state(job.id, JobState.DONE)
+
+    job_queue.requeue(sample_file, error="Truncated audio")
+
+    assert job_queue.status() == {JobState.PENDING: 1}
+    requeued = job_queue.claim()
+    assert requeued is not None
+    assert requeued.attempts == 2
+
+
+def test_requeue_leaves_active_song(job_queue: JobQueue, sample_file: File) -> None:
+    job_queue.enqueue([sample_file])
+    job_queue.claim()
+
+    job_queue.requeue(sample_file, error="Truncated audio")
+
+    assert job_queue.status() == {JobState.DOWNLOADING: 1}
+
+
+def test_claim_by_name(job_queue: JobQueue, sample_file: File) -> None:
+    other = File(name="Test - Your Song", video_id="eQw4w9WgXcQ")
+    job_queue.enqueue([sample_file, other])
+
+    job = job_queue.claim(other.name)
+
+    assert job is not None
+    assert job.file == other
+    assert job_queue.claim(other.name) is None
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.catalog import Catalog
+from usdb_downloader.layout import Layout, LayoutMigrator
+from usdb_downloader.models import File
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _create_song(song_dir: Path, artist: str) -> None:
+    song_dir.mkdir(parents=True)
+    (song_dir / f"{song_dir.name}.txt").write_text(
+        f"#ARTIST:{artist}\n#TITLE:My Song\n: 0 1 2 My\n",
+        encoding="utf-8",
+    )
+    (song_dir / f"{song_dir.name}.mp3").write_bytes(b"mp3")
+
+
+@pytest.mark.parametrize(
+    ("layout", "artist", "expected"),
+    [
+        (Layout.FLAT, "Test", "Test - My Song"),
+        (Layout.INITIAL, "test", "T/Test - My Song"),
+        (Layout.INITIAL, "Édith Piaf", "E/Test - My Song"),
+        (Layout.INITIAL, "2Pac", "0-9/Test - My Song"),
+        (Layout.INITIAL, "¡Forward, Russia!", "#/Test - My Song"),
+        (Layout.ARTIST, "AC/DC", "AC_DC/Test - My Song"),
+        (Layout.ARTIST, "", "Test - My Song/Test - My Song"),
+        (Layout.HASH, "Test", "ae/Test - My Song"),
+    ],
+)
+def test_song_dir(tmp_path: Path, layout: Layout, artist: str, expected: str) -> None:
+    song_dir = layout.song_dir(tmp_path, "Test - My Song", {"ARTIST": artist})
+
+    assert song_dir == tmp_path / expected
+
+
+def test_migrate_flat_library_to_initial_layout(tmp_path: Path) -> None:
+    output_dir = tmp_path / "output"
+    _create_song(output_dir / "Test - My Song", "Test")
+    _create_song(output_dir / "Band - Anthem", "Band")
+    (output_dir / ".usdb_downloader").mkdir()
+    migrator = LayoutMigrator(output_dir, Layout.INITIAL)
+
+    moves = list(migrator.plan())
+    for move in moves:
+        assert migrator.apply(move)
+
+    assert [(m.name, m.target) for m in moves] == [
+        ("Band - Anthem", output_dir / "B" / "Band - Anthem"),
+        ("Test - My Song", output_dir / "T" / "Test - My Song"),
+    ]
+    assert (output_dir / "B" / "Band - Anthem" / "Band - Anthem.mp3").is_file()
+    assert not (output_dir / "Band - Anthem").exists()
+    assert sorted(p.name for p in output_dir.iterdir()) == [
+        ".usdb_downloader",
+        "B",
+        "T",
+    ]
+
+
+def test_migrate_back_to_flat_removes_empty_folders(tmp_path: Path) -> None:
+    output_dir = tmp_path / "output"
+    _create_song(output_dir / "AC_DC" / "AC_DC - Thunder", "AC/DC")
+    migrator = LayoutMigrator(output_dir, Layout.FLAT)
+
+    for move in migrator.plan():
+        assert migrator.apply(move)
+
+    assert (output_dir / "AC_DC - Thunder" / "AC_DC - Thunder.txt").is_file()
+    assert not (output_dir / "AC_DC").exists()
+
+
+def test_migrate_does_not_overwrite_existing_target(tmp_path: Path) -> None:
+    output_dir = tmp_path / "output"
+    _create_song(output_dir / "Test - My Song", "Test")
+    (output_dir / "T" / "Test - My Song").mkdir(parents=True)
+    migrator = LayoutMigrator(output_dir, Layout.INITIAL)
+
+    (move,) = [m for m in migrator.plan() if m.source != m.target]
+
+    assert not migrator.apply(move)
+    assert (output_dir / "Test - My Song" / "Test - My Song.txt").is_file()
+
+
+def test_migrate_updates_catalog(tmp_path: Path) -> None:
+    output_dir = tmp_path / "output"
+    _create_song(output_dir / "Test - My Song", "Test")
+    catalog = Catalog(output_dir / ".usdb_downloader" / "catalog.sqlite3")
+    catalog.record(
+        File(
+            name="Test - My Song",
+            video_id="dQw4w9WgXcQ",
+            headers={"ARTIST": "Test"},
+            lyrics=[],
+        ),
+        output_dir / "Test - My Song",
+    )
+    migrator = LayoutMigrator(output_dir, Layout.HASH, catalog)
+
+    (move,) = migrator.plan()
+    migrator.apply(move)
+
+    entry = catalog.get("Test - My Song")
+    assert entry is not None
+    assert entry.path == output_dir / "ae" / "Test - My Song"
+    catalog.close()
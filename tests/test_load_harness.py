@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.load_harness import (
+    FakeYoutubeDownloader,
+    LoadHarness,
+    LoadProfile,
+    _WorkerReport,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def test_sweep_accounts_for_every_song() -> None:
+    harness = LoadHarness(
+        songs=30,
+        profile=LoadProfile(
+            resolve_latency=0.001,
+            download_latency=0.002,
+            audio_size=1024,
+            video_size=4096,
+            unavailable_rate=0.1,
+            throttle_rate=0.1,
+            failure_rate=0.1,
+        ),
+        worker_counts=[1, 2],
+        seed=7,
+    )
+
+    reports = harness.run()
+
+    assert [report.workers for report in reports] == [1, 2]
+    for report in reports:
+        assert not report.problems
+        assert report.processed + report.failed + report.skipped == 30
+        assert report.failed > 0
+        assert len(report.latencies) == 30
+        assert report.songs_per_minute > 0
+        assert report.latency_percentile(99) >= report.latency_percentile(50)
+        assert report.peak_memory > 0
+
+
+def test_check_reports_lost_and_double_counted_songs() -> None:
+    reports = [
+        _WorkerReport(
+            processed=2,
+            failed=0,
+            skipped=0,
+            results=[("A", 0.1), ("A", 0.2)],
+            peak_memory=0,
+        )
+    ]
+
+    problems = LoadHarness._check(["A", "B"], reports)
+
+    assert problems == [
+        "A was reported 2 times",
+        "B was lost",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_transfers_share_bandwidth(tmp_path: Path) -> None:
+    profile = LoadProfile(
+        download_latency=0,
+        bandwidth=20_000,
+        audio_size=2_000,
+        video_size=2_000,
+    )
+    youtube_downloader = FakeYoutubeDownloader(profile, seed=0)
+
+    started = time.monotonic()
+    await asyncio.gather(
+        youtube_downloader.download_audio("a", tmp_path / "a"),
+        youtube_downloader.download_video("b", tmp_path / "b"),
+    )
+
+    # Each transfer alone takes 0.1s, together they share the bandwidth.
+    assert time.monotonic() - started >= 0.19
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from usdb_downloader.locks import SongLocks
+
+
+@pytest.fixture
+def lock_dir(tmp_path: Path) -> Path:
+    return tmp_path / "locks"
+
+
+def test_acquire_claims_song(lock_dir: Path) -> None:
+    locks = SongLocks(lock_dir)
+
+    assert locks.acquire("Test - My Song") is True
+    assert (lock_dir / "Test - My Song.lock").exists()
+
+
+def test_acquire_fails_when_already_claimed(lock_dir: Path) -> None:
+    assert SongLocks(lock_dir).acquire("Test - My Song") is True
+
+    assert SongLocks(lock_dir).acquire("Test - My Song") is False
+
+
+def test_release_allows_reclaiming(lock_dir: Path) -> None:
+    locks = SongLocks(lock_dir)
+    locks.acquire("Test - My Song")
+
+    locks.release("Test - My Song")
+
+    assert SongLocks(lock_dir).acquire("Test - My Song") is True
+
+
+def test_acquire_breaks_stale_lock(lock_dir: Path) -> None:
+    SongLocks(lock_dir).acquire("Test - My Song")
+    lock_path = lock_dir / "Test - My Song.lock"
+    os.utime(lock_path, (0, 0))
+
+    assert SongLocks(lock_dir, stale_after=60).acquire("Test - My Song") is True
+
+
+def test_acquire_keeps_lock_claimed_while_breaking(
+    lock_dir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    SongLocks(lock_dir).acquire("Test - My Song")
+    lock_path = lock_dir / "Test - My Song.lock"
+    os.utime(lock_path, (0, 0))
+    rename = Path.rename
+
+    def claim_then_rename(self: Path, target: Path) -> Path:
+        # Another node breaks the stale lock and claims the song first.
+        self.write_text("other:1:token\n", encoding="utf-8")
+        return rename(self, target)
+
+    monkeypatch.setattr(Path, "rename", claim_then_rename)
+
+    assert SongLocks(lock_dir, stale_after=60).acquire("Test - My Song") is False
+    assert lock_path.read_text(encoding="utf-8") == "other:1:token\n"
+    assert list(lock_dir.iterdir()) == [lock_path]
+
+
+def test_release_keeps_lock_of_another_node(lock_dir: Path) -> None:
+    locks = SongLocks(lock_dir)
+    locks.acquire("Test - My Song")
+    lock_path = lock_dir / "Test - My Song.lock"
+    lock_path.write_text("other:1:token\n", encoding="utf-8")
+
+    locks.release("Test - My Song")
+
+    assert lock_path.read_text(encoding="utf-8") == "other:1:token\n"
+
+
+def test_refresh_touches_held_locks(lock_dir: Path) -> None:
+    locks = SongLocks(lock_dir, stale_after=60)
+    locks.acquire("Test - My Song")
+    lock_path = lock_dir / "Test - My Song.lock"
+    os.utime(lock_path, (0, 0))
+
+    locks.refresh()
+
+    assert time.time() - lock_path.stat().st_mtime < 60
+    assert SongLocks(lock_dir, stale_after=60).acquire("Test - My Song") is False
+
+
+def test_refresh_skips_lock_of_another_node(lock_dir: Path) -> None:
+    locks = SongLocks(lock_dir)
+    locks.acquire("Test - My Song")
+    lock_path = lock_dir / "Test - My Song.lock"
+    lock_path.write_text("other:1:token\n", encoding="utf-8")
+    os.utime(lock_path, (0, 0))
+
+    locks.refresh()
+
+    assert lock_path.stat().st_mtime == 0
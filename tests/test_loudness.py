@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import numpy as np
+
+from usdb_downloader import loudness as loudness_module
+from usdb_downloader.loudness import (
+    _HIGH_PASS,
+    _SHELF,
+    SAMPLE_RATE,
+    Loudness,
+    LoudnessMeter,
+    measure_loudness,
+)
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _measure(frames: np.ndarray, chunk_seconds: int = 10) -> Loudness | None:
+    meter = LoudnessMeter()
+    samples = frames.astype(np.float32).reshape(-1)
+    step = chunk_seconds * SAMPLE_RATE * 2
+    for idx in range(0, len(samples), step):
+        meter.add(samples[idx : idx + step])
+    return meter.result()
+
+
+def _sine(frequency: float, seconds: float, level: float) -> np.ndarray:
+    times = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    sine = 10 ** (level / 20) * np.sin(2 * np.pi * frequency * times)
+    return np.stack([sine, sine], axis=1)
+
+
+def _k_weighted_loudness(frames: np.ndarray) -> float:
+    # Reference implementation that filters sample by sample.
+    for b, a in (_SHELF, _HIGH_PASS):
+        filtered = np.zeros_like(frames)
+        x1 = x2 = y1 = y2 = np.zeros(frames.shape[1])
+        for idx, x in enumerate(frames):
+            y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+            x1, x2, y1, y2 = x, x1, y, y1
+            filtered[idx] = y
+        frames = filtered
+    powers = (frames**2).reshape(-1, SAMPLE_RATE // 10, 2).mean(axis=1).sum(axis=1)
+    blocks = np.convolve(powers, np.full(4, 0.25), mode="valid")
+    return -0.691 + 10 * np.log10(blocks.mean())
+
+
+def test_sine_at_reference_level() -> None:
+    # A 997 Hz sine in both channels reads at its level in dBFS.
+    loudness = _measure(_sine(997, 20, -20))
+
+    assert loudness is not None
+    assert loudness.integrated == pytest.approx(-20, abs=0.05)
+    assert loudness.peak == pytest.approx(0.1, abs=1e-6)
+    assert loudness.gain == pytest.approx(2, abs=0.05)
+
+
+@pytest.mark.parametrize("frequency", [50, 997, 8000])
+def test_matches_filtering_sample_by_sample(frequency: float) -> None:
+    rng = np.random.default_rng(0)
+    frames = _sine(frequency, 1, -12) + 0.05 * rng.standard_normal((SAMPLE_RATE, 2))
+
+    loudness = _measure(frames, chunk_seconds=1)
+
+    assert loudness is not None
+    assert loudness.integrated == pytest.approx(_k_weighted_loudness(frames), abs=0.05)
+
+
+def test_silence_is_gated() -> None:
+    song = _sine(997, 20, -20)
+    silence = np.zeros((20 * SAMPLE_RATE, 2))
+
+    loudness = _measure(np.concatenate([silence, song, silence]))
+
+    assert loudness is not None
+    assert loudness.integrated == pytest.approx(-20, abs=0.1)
+    assert _measure(silence) is None
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Needs a shell script")
+def test_measure_loudness_kills_stalled_decoder(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # The decoder hangs without writing audio or closing stdout.
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nexec sleep 60\n", encoding="utf-8")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(loudness_module, "_DECODE_TIMEOUT", 0.2)
+
+    with pytest.raises(subprocess.TimeoutExpired):
+        measure_loudness(str(ffmpeg), tmp_path / "song.mp3")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="Needs a shell script")
+def test_measure_loudness_survives_noisy_decoder(tmp_path: Path) -> None:
+    # Far more errors than a pipe buffer holds, before any audio is written.
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(
+        "#!/bin/sh\nhead -c 1000000 /dev/zero | tr '\\0' 'x' >&2\nexit 1\n",
+        encoding="utf-8",
+    )
+    ffmpeg.chmod(0o755)
+
+    with pytest.raises(subprocess.CalledProcessError) as e:
+        measure_loudness(str(ffmpeg), tmp_path / "song.mp3")
+
+    assert len(e.value.stderr) == 1_000_000
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.metadata_cache import MetadataCache
+from usdb_downloader.models import VideoInfo
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.fixture
+def cache_dir(tmp_path: Path) -> Path:
+    return tmp_path / "metadata"
+
+
+@pytest.fixture
+def available_info() -> VideoInfo:
+    return VideoInfo(
+        video_id="dQw4w9WgXcQ",
+        available=True,
+        duration=212.0,
+        audio_format="140",
+        video_format="248",
+    )
+
+
+def test_get_returns_none_when_missing(cache_dir: Path) -> None:
+    assert MetadataCache(cache_dir).get("dQw4w9WgXcQ") is None
+
+
+def test_put_and_get(cache_dir: Path, available_info: VideoInfo) -> None:
+    cache = MetadataCache(cache_dir)
+
+    cache.put(available_info)
+
+    assert cache.get("dQw4w9WgXcQ") == available_info
+    assert list(cache_dir.iterdir()) == [cache_dir / "dQw4w9WgXcQ.json"]
+
+
+def test_get_returns_none_when_expired(
+    cache_dir: Path,
+    available_info: VideoInfo,
+) -> None:
+    MetadataCache(cache_dir).put(available_info)
+
+    assert MetadataCache(cache_dir, ttl=-1).get("dQw4w9WgXcQ") is None
+
+
+def test_unavailable_entries_use_their_own_ttl(cache_dir: Path) -> None:
+    MetadataCache(cache_dir).put(
+        VideoInfo(video_id="dQw4w9WgXcQ", available=False, error="Video unavailable")
+    )
+
+    assert MetadataCache(cache_dir, unavailable_ttl=-1).get("dQw4w9WgXcQ") is None
+    assert MetadataCache(cache_dir, ttl=-1).get("dQw4w9WgXcQ") is not None
+
+
+def test_get_ignores_corrupt_entries(cache_dir: Path) -> None:
+    cache_dir.mkdir()
+    (cache_dir / "dQw4w9WgXcQ.json").write_text(
+        json.dumps({"video_id": "dQw4w9WgXcQ"}), encoding="utf-8"
+    )
+
+    assert MetadataCache(cache_dir).get("dQw4w9WgXcQ") is None
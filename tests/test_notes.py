@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from usdb_downloader.models import File, Timing
+from usdb_downloader.notes import Notes, NoteType
+
+_DUET_LINES = [
+    "P1",
+    ": 0 2 5 My",
+    "* 3 2 7  Song ",
+    "- 6",
+    "F 8 1 0 hey",
+    "P2",
+    "R 0 4 -2 Your",
+    "G 5 2 3 Song",
+    "- 8 10",
+    "E",
+]
+
+
+def test_from_lines_builds_columns() -> None:
+    notes = Notes.from_lines(_DUET_LINES)
+
+    assert notes.types.tolist() == [
+        NoteType.PLAYER,
+        NoteType.NORMAL,
+        NoteType.GOLDEN,
+        NoteType.LINE_BREAK,
+        NoteType.FREESTYLE,
+        NoteType.PLAYER,
+        NoteType.RAP,
+        NoteType.RAP_GOLDEN,
+        NoteType.LINE_BREAK,
+        NoteType.END,
+    ]
+    assert notes.starts.tolist()[1:5] == [0, 3, 6, 8]
+    assert notes.pitches.tolist()[6] == -2
+    assert notes.players.tolist() == [1, 1, 1, 1, 1, 2, 2, 2, 2, 2]
+    assert notes.texts[2] == " Song "
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        _DUET_LINES,
+        [": 0  2 5 double space", ": 1 2 x broken", "#comment", "E trailing", "P 1"],
+        [": 0 1 2", "- 01", "- 5 6 7"],
+    ],
+)
+def test_to_lines_is_lossless(lines: list[str]) -> None:
+    assert Notes.from_lines(lines).to_lines() == lines
+
+
+def test_analysis_properties() -> None:
+    notes = Notes.from_lines(_DUET_LINES)
+
+    assert notes.last_beat == 9
+    assert notes.pitch_range == (-2, 7)
+    assert notes.duration(Timing(bpm=120, gap=1000)) == pytest.approx(1 + 9 * 60 / 480)
+
+
+def test_analysis_properties_without_notes() -> None:
+    notes = Notes.from_lines(["E"])
+
+    assert notes.last_beat == 0
+    assert notes.pitch_range is None
+
+
+def test_absolute_resolves_relative_beats() -> None:
+    notes = Notes.from_lines(
+        [": 0 2 5 My", "- 4", ": 1 2 5 Song", "- 4 6", ": 0 3 5 !"]
+    )
+
+    assert notes.absolute().to_lines() == [
+        ": 0 2 5 My",
+        "- 4",
+        ": 5 2 5 Song",
+        "- 8 10",
+        ": 10 3 5 !",
+    ]
+    assert notes.duration(Timing(bpm=120, relative=True)) == pytest.approx(13 / 8)
+
+
+def test_shifted_moves_notes_and_line_breaks() -> None:
+    notes = Notes.from_lines(_DUET_LINES).shifted(10)
+
+    assert notes.to_lines() == [
+        "P1",
+        ": 10 2 5 My",
+        "* 13 2 7  Song ",
+        "- 16",
+        "F 18 1 0 hey",
+        "P2",
+        "R 10 4 -2 Your",
+        "G 15 2 3 Song",
+        "- 18 20",
+        "E",
+    ]
+
+
+def test_scaled_doubles_timing() -> None:
+    notes = Notes.from_lines([": 1 1 5 My", "- 3 4", ": 5 1 5 Song"]).scaled(2)
+
+    assert notes.to_lines() == [": 2 2 5 My", "- 6 8", ": 10 2 5 Song"]
+
+
+def test_validate_reports_invalid_notes() -> None:
+    notes = Notes.from_lines(
+        [
+            ": 0 4 5 My",
+            ": 2 2 5 overlaps",
+            ": 6 0 5 empty",
+            "P2",
+            ": 0 4 5 other player",
+        ]
+    )
+
+    assert notes.validate() == [
+        "Line 2: note overlaps the previous note",
+        "Line 3: note has non-positive length",
+    ]
+
+
+def test_file_notes_are_built_lazily_and_written_back() -> None:
+    file = File(name="Test - My Song", video_id="dQw4w9WgXcQ", lyrics=_DUET_LINES)
+    assert "notes" not in vars(file)
+
+    shifted = file.with_notes(file.notes.shifted(1))
+
+    assert file.notes is file.notes
+    assert shifted.lyrics[1] == ": 1 2 5 My"
+    assert shifted.notes.last_beat == 10
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import os
+import zipfile
+from dataclasses import replace
 from typing import TYPE_CHECKING
+from unittest.mock import MagicMock
 
 import pytest
 
 from usdb_downloader.parser import File, Parser
+from usdb_downloader.shard import Shard
 
 if TYPE_CHECKING:
     from pathlib import Path
@@ -126,6 +131,136 @@ def test_iter_files_yields_multiple_files(parser: Parser, input_path: Path) -> N
     assert expected_song2 in files
 
 
+def test_iter_files_scans_nested_directories(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    nested_dir = input_path / "Test" / "2025"
+    nested_dir.mkdir(parents=True)
+    _create_test_file(
+        path=nested_dir / "Test - My Song.txt",
+        content="#ARTIST:Test\n#VIDEO:v=dQw4w9WgXcQ\n: 0 1 2 My\n",
+    )
+    hidden_dir = input_path / ".cache"
+    hidden_dir.mkdir()
+    _create_test_file(
+        path=hidden_dir / "Test - Your Song.txt",
+        content="#ARTIST:Test\n#VIDEO:v=eQw4w9WgXcQ\n: 0 1 2 Your\n",
+    )
+
+    files = list(parser.iter_files())
+
+    assert [file.name for file in files] == ["Test - My Song"]
+
+
+def test_iter_files_streams_songs_from_zip_archives(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    with zipfile.ZipFile(input_path / "export.zip", "w") as archive:
+        archive.writestr(
+            "export/Test - My Song.txt",
+            "#ARTIST:Test\n#TITLE:My Song\n#VIDEO:v=dQw4w9WgXcQ\n: 0 1 2 My\n",
+        )
+        archive.writestr("export/Test - My Song.jpg", b"not a song")
+
+    files = list(parser.iter_files())
+
+    assert files == [
+        File(
+            name="Test - My Song",
+            video_id="dQw4w9WgXcQ",
+            headers={
+                "ARTIST": "Test",
+                "COVER": "Test - My Song.jpg",
+                "MP3": "Test - My Song.mp3",
+                "TITLE": "My Song",
+                "VIDEO": "Test - My Song.webm",
+            },
+            lyrics=[": 0 1 2 My"],
+        )
+    ]
+    assert not (input_path / "export").exists()
+
+
+def test_iter_files_skips_broken_zip_archives(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    (input_path / "broken.zip").write_bytes(b"not a zip archive")
+
+    assert list(parser.iter_files()) == []
+
+
+def test_iter_files_skips_unreadable_archive_members(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    path = input_path / "export.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("Locked - Song.txt", "#ARTIST:Locked\n#VIDEO:v=eQw4w9WgXcQ\n")
+        archive.writestr("Test - My Song.txt", "#ARTIST:Test\n#VIDEO:v=dQw4w9WgXcQ\n")
+    # Marks the first member as encrypted, in its local and central header.
+    data = bytearray(path.read_bytes())
+    data[6] |= 0x1
+    data[data.index(b"PK\x01\x02") + 8] |= 0x1
+    path.write_bytes(data)
+    _create_test_file(
+        path=input_path / "Band - Anthem.txt",
+        content="#ARTIST:Band\n#VIDEO:v=fQw4w9WgXcQ\n",
+    )
+
+    files = list(parser.iter_files())
+
+    assert sorted(file.name for file in files) == ["Band - Anthem", "Test - My Song"]
+
+
+def test_iter_files_stops_scanner_when_closed_early(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    for idx in range(Parser._SCAN_BUFFER_SIZE + 10):
+        _create_test_file(
+            path=input_path / f"Test - Song {idx}.txt",
+            content="#ARTIST:Test\n#VIDEO:v=dQw4w9WgXcQ\n",
+        )
+
+    files = parser.iter_files()
+    assert next(files).video_id == "dQw4w9WgXcQ"
+
+    files.close()
+
+
+def test_iter_files_only_yields_files_in_shard(
+    input_path: Path,
+    output_path: Path,
+) -> None:
+    input_path.mkdir()
+    video_ids = ["dQw4w9WgXcQ", "eQw4w9WgXcQ", "fQw4w9WgXcQ", "gQw4w9WgXcQ"]
+    for idx, video_id in enumerate(video_ids):
+        _create_test_file(
+            path=input_path / f"Test - Song {idx}.txt",
+            content=f"#ARTIST:Test\n#VIDEO:v={video_id}\n: 0 1 2 Song\n",
+        )
+
+    shards = [Shard(index=i, count=3) for i in range(1, 4)]
+    yielded = [
+        [
+            file.video_id
+            for file in Parser(
+                input_dir=input_path,
+                output_dir=output_path,
+                shard=shard,
+            ).iter_files()
+        ]
+        for shard in shards
+    ]
+
+    assert sorted(video_id for ids in yielded for video_id in ids) == video_ids
+    for shard, ids in zip(shards, yielded, strict=True):
+        assert all(shard.contains(video_id) for video_id in ids)
+
+
 def test_write_file(parser: Parser, output_path: Path) -> None:
     file = File(
         name="Test - My Song",
@@ -178,6 +313,93 @@ def test_write_file_with_complex_name(parser: Parser, output_path: Path) -> None
     assert output_file.exists()
 
 
+def test_write_file_skips_unchanged_file(parser: Parser, output_path: Path) -> None:
+    file = File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={"ARTIST": "Test", "TITLE": "My Song"},
+        lyrics=[": 0 1 2 My"],
+    )
+    output_file = output_path / "Test - My Song" / "Test - My Song.txt"
+
+    assert parser.write_file(file)
+    os.utime(output_file, (0, 0))
+
+    assert not parser.write_file(file)
+    assert output_file.stat().st_mtime == 0
+
+    assert parser.write_file(replace(file, lyrics=[": 0 1 2 Your"]))
+    assert output_file.read_text(encoding="utf-8").endswith(": 0 1 2 Your\n")
+
+
+def test_write_file_keeps_detected_headers(parser: Parser, output_path: Path) -> None:
+    file = File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={"ARTIST": "Test", "TITLE": "My Song"},
+        lyrics=[": 0 1 2 My"],
+    )
+    output_file = output_path / "Test - My Song" / "Test - My Song.txt"
+    parser.write_file(
+        replace(file, headers={**file.headers, "PREVIEWSTART": "30.0"}),
+    )
+    os.utime(output_file, (0, 0))
+
+    assert not parser.write_file(file)
+    assert output_file.stat().st_mtime == 0
+
+    assert parser.write_file(replace(file, lyrics=[": 0 1 2 Your"]))
+    assert output_file.read_text(encoding="utf-8").splitlines() == [
+        "#ARTIST:Test",
+        "#TITLE:My Song",
+        "#PREVIEWSTART:30.0",
+        ": 0 1 2 Your",
+    ]
+
+
+def test_write_file_keeps_detected_headers_of_any_case(
+    parser: Parser,
+    output_path: Path,
+) -> None:
+    output_file = output_path / "Test - My Song" / "Test - My Song.txt"
+    output_file.parent.mkdir(parents=True)
+    output_file.write_text(
+        "#ARTIST:Test\n#previewstart: 30.0\n: 0 1 2 My\n", encoding="utf-8"
+    )
+
+    assert parser.write_file(
+        File(
+            name="Test - My Song",
+            video_id="dQw4w9WgXcQ",
+            headers={"ARTIST": "Test"},
+            lyrics=[": 0 1 2 Your"],
+        )
+    )
+    assert output_file.read_text(encoding="utf-8").splitlines() == [
+        "#ARTIST:Test",
+        "#PREVIEWSTART:30.0",
+        ": 0 1 2 Your",
+    ]
+
+
+def test_write_file_records_song_in_catalog(
+    input_path: Path,
+    output_path: Path,
+) -> None:
+    catalog = MagicMock()
+    parser = Parser(input_dir=input_path, output_dir=output_path, catalog=catalog)
+    file = File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={"ARTIST": "Test", "TITLE": "My Song"},
+        lyrics=[],
+    )
+
+    parser.write_file(file)
+
+    catalog.record.assert_called_once_with(file, output_path / "Test - My Song")
+
+
 def test_parse_file_correctly(
     parser: Parser,
     input_path: Path,
@@ -266,6 +488,35 @@ def test_parse_file_overwrites_existing_headers(
     )
 
 
+def test_parse_file_normalizes_header_case(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    test_file_path = input_path / "Test - My Song.txt"
+    _create_test_file(
+        path=test_file_path,
+        content="""
+#Artist:Test
+#title : My Song
+#Video:v=dQw4w9WgXcQ
+#mp3:Test - Your Song.mp3
+: 0 1 2 My
+""",
+    )
+
+    file = parser._parse_file(test_file_path)
+
+    assert file is not None
+    assert file.video_id == "dQw4w9WgXcQ"
+    assert file.headers == {
+        "ARTIST": "Test",
+        "COVER": "Test - My Song.jpg",
+        "MP3": "Test - My Song.mp3",
+        "TITLE": "My Song",
+        "VIDEO": "Test - My Song.webm",
+    }
+
+
 def test_parse_file_returns_none_when_video_id_is_missing(
     parser: Parser,
     input_path: Path,
@@ -290,6 +541,54 @@ def test_parse_file_returns_none_when_video_id_is_missing(
     assert file is None
 
 
+@pytest.mark.parametrize(
+    "encoding,content",
+    [
+        ("utf-8", "#ARTIST:Beyoncé\n"),
+        ("utf-8-sig", "#ARTIST:Beyoncé\n"),
+        ("utf-16", "#ARTIST:Beyoncé\n"),
+        ("utf-16-le", "#ARTIST:Beyoncé\n"),
+        ("cp1252", "#ARTIST:Beyoncé\n"),
+        ("cp1250", "#ENCODING:CP1250\n#ARTIST:Beyoncé\n"),
+        ("cp1250", "#encoding:cp1250\n#Artist:Beyoncé\n"),
+    ],
+)
+def test_parse_file_detects_encoding(
+    parser: Parser,
+    input_path: Path,
+    encoding: str,
+    content: str,
+) -> None:
+    test_file_path = input_path / "Beyoncé - My Song.txt"
+    test_file_path.write_bytes(
+        f"{content}#VIDEO:v=dQw4w9WgXcQ\r\n: 0 1 2 Café \r\n".encode(encoding)
+    )
+
+    file = parser._parse_file(test_file_path)
+
+    assert file is not None
+    assert file.headers["ARTIST"] == "Beyoncé"
+    assert "ENCODING" not in file.headers
+    assert file.lyrics == [": 0 1 2 Café "]
+
+
+def test_parse_file_keeps_video_id_when_followed_by_video_gap(
+    parser: Parser,
+    input_path: Path,
+) -> None:
+    test_file_path = input_path / "Test - My Song.txt"
+    _create_test_file(
+        path=test_file_path,
+        content="#ARTIST:Test\n#VIDEO:v=dQw4w9WgXcQ\n#VIDEOGAP:1.5\n: 0 1 2 My\n",
+    )
+
+    file = parser._parse_file(test_file_path)
+
+    assert file is not None
+    assert file.video_id == "dQw4w9WgXcQ"
+    assert "VIDEOGAP" not in file.headers
+
+
 @pytest.mark.parametrize(
     "line,expected",
     [
@@ -301,3 +600,15 @@ def test_parse_file_returns_none_when_video_id_is_missing(
 )
 def test_extract_video_id(line: str, expected: str | None) -> None:
     assert Parser._extract_video_id(line) == expected
+
+
+def test_read_written_file_round_trips(parser: Parser, output_path: Path) -> None:
+    file = File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={"ARTIST": "Test", "BPM": "300,5", "MP3": "Test - My Song.mp3"},
+        lyrics=[": 0 1 2 My", ": 3 4 5 Song "],
+    )
+    parser.write_file(file)
+
+    assert parser.read_written_file(output_path / file.name, file.video_id) == file
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import numpy as np
+
+from usdb_downloader.models import Timing
+from usdb_downloader.notes import Notes
+from usdb_downloader.preview import SAMPLE_RATE, detect_preview, medley_beats
+
+
+def _part(
+    rng: np.random.Generator,
+    frequencies: list[float],
+    seconds: float,
+    amplitude: float,
+) -> np.ndarray:
+    times = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    tones = sum(np.sin(2 * np.pi * frequency * times) for frequency in frequencies)
+    noise = 0.01 * rng.standard_normal(len(times))
+    return (amplitude * tones / len(frequencies) + noise).astype(np.float32)
+
+
+def _song(seed: int = 0) -> np.ndarray:
+    # Intro, then verse and chorus twice, a bridge and a last chorus, so the
+    # first chorus starts at 30s.
+    rng = np.random.default_rng(seed)
+    return np.concatenate(
+        [
+            _part(rng, [110], 10, 0.1),
+            _part(rng, [220, 330], 20, 0.4),
+            _part(rng, [523, 659, 784], 15, 0.8),
+            _part(rng, [220, 330], 20, 0.4),
+            _part(rng, [523, 659, 784], 15, 0.8),
+            _part(rng, [180, 900], 10, 0.5),
+            _part(rng, [523, 659, 784], 15, 0.8),
+        ]
+    )
+
+
+def test_detect_preview_finds_first_chorus() -> None:
+    preview = detect_preview(_song())
+
+    assert preview is not None
+    assert preview.start == pytest.approx(30, abs=1)
+    assert preview.end == pytest.approx(45, abs=1)
+    assert preview.repetition > 0.9
+
+
+def test_detect_preview_without_repetition_picks_loudest_part() -> None:
+    rng = np.random.default_rng(0)
+    samples = np.concatenate(
+        [
+            _part(rng, [220], 20, 0.2),
+            _part(rng, [440, 660], 20, 0.9),
+            _part(rng, [330], 20, 0.2),
+        ]
+    )
+
+    preview = detect_preview(samples)
+
+    assert preview is not None
+    assert 20 <= preview.start <= 25
+
+
+@pytest.mark.parametrize(
+    "samples",
+    [
+        np.zeros(SAMPLE_RATE * 30, dtype=np.float32),
+        np.ones(SAMPLE_RATE * 5, dtype=np.float32),
+    ],
+)
+def test_detect_preview_of_silent_or_short_audio(samples: np.ndarray) -> None:
+    assert detect_preview(samples) is None
+
+
+def test_medley_beats_snap_to_lines() -> None:
+    notes = Notes.from_lines(
+        [
+            ": 0 4 0 a",
+            "- 70",
+            ": 80 4 0 b",
+            "- 150",
+            ": 160 4 0 c",
+            ": 200 30 0 c",
+            "- 234",
+            ": 236 4 0 d",
+            ": 290 6 0 d",
+            "- 300",
+            ": 302 50 0 e",
+            "- 360",
+            ": 364 4 0 f",
+            "E",
+        ]
+    )
+
+    # 120 BPM are 8 beats per second, so 30s to 45s are beats 240 to 360.
+    assert medley_beats(notes, Timing(bpm=120), start=30, end=45) == (236, 352)
+    # #GAP delays the first beat, in milliseconds.
+    assert medley_beats(notes, Timing(bpm=120, gap=10_000), start=40, end=55) == (
+        236,
+        352,
+    )
+
+
+def test_medley_beats_without_notes() -> None:
+    notes = Notes.from_lines(["- 10", "E"])
+
+    assert medley_beats(notes, Timing(bpm=120), start=30, end=45) is None
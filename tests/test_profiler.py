@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.profiler import Profiler
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _busy_download() -> str:
+    deadline = time.monotonic() + 0.2
+    while time.monotonic() < deadline:
+        pass
+    return "done"
+
+
+@pytest.mark.asyncio
+async def test_run_profiles_worker_threads_and_loop_lag(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path / "profile", name="main", sample_interval=0.005)
+
+    result = await profiler.run(asyncio.to_thread(_busy_download))
+
+    assert result == "done"
+    stacks = profiler.stacks_path.read_text(encoding="utf-8").splitlines()
+    worker_stacks = [line for line in stacks if line.startswith("asyncio_")]
+    assert any("_busy_download (test_profiler.py:" in line for line in worker_stacks)
+    for line in stacks:
+        stack, _, count = line.rpartition(" ")
+        assert stack
+        assert int(count) > 0
+
+    lag = profiler.lag_path.read_text(encoding="utf-8")
+    assert lag.startswith("samples: ")
+    assert "p99_ms: " in lag
+
+
+@pytest.mark.asyncio
+async def test_run_writes_profile_when_awaitable_fails(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path / "profile", name="main")
+
+    async def fail() -> None:
+        await asyncio.sleep(0.02)
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await profiler.run(fail())
+
+    assert profiler.stacks_path.exists()
+    assert profiler.lag_path.exists()
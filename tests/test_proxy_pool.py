@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.proxy_pool import Proxy, ProxyPool
+from usdb_downloader.youtube_downloader import (
+    YoutubeDownloader,
+    YoutubeDownloaderException,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import AsyncGenerator
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@contextlib.asynccontextmanager
+async def _stand_in_proxy() -> AsyncGenerator[tuple[str, list[bytes]]]:
+    requests: list[bytes] = []
+
+    async def handle(
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        requests.append(await reader.readuntil(b"\r\n\r\n"))
+        writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        yield f"http://127.0.0.1:{port}", requests
+
+
+def test_parse_proxy_concurrency() -> None:
+    assert Proxy.parse("http://proxy:3128#4", 2) == Proxy(
+        url="http://proxy:3128", concurrency=4
+    )
+    assert Proxy.parse("socks5://proxy:1080", 2).concurrency == 2
+
+    with pytest.raises(ValueError, match="must be a URL"):
+        Proxy.parse("proxy", 2)
+    with pytest.raises(ValueError, match="must be positive"):
+        Proxy.parse("http://proxy:3128#0", 2)
+
+
+@pytest.mark.asyncio
+async def test_acquire_spreads_load_within_concurrency_limits() -> None:
+    pool = ProxyPool(["http://a:3128#2", "http://b:3128#1"])
+
+    async with pool.acquire() as first, pool.acquire() as second:
+        assert {first.url, second.url} == {"http://a:3128", "http://b:3128"}
+        async with pool.acquire() as third:
+            assert third.url == "http://a:3128"
+            waiting = asyncio.create_task(pool.acquire().__aenter__())
+            await asyncio.sleep(0.01)
+            assert not waiting.done()
+
+        lease = await asyncio.wait_for(waiting, 1)
+        assert lease.url == "http://a:3128"
+
+
+@pytest.mark.asyncio
+async def test_failing_proxy_cools_down() -> None:
+    clock = _Clock()
+    pool = ProxyPool(
+        ["http://a:3128", "http://b:3128"],
+        failure_threshold=2,
+        cooldown=60.0,
+        clock=clock,
+    )
+    a, b = pool.proxies
+
+    for _ in range(2):
+        async with pool.acquire() as lease:
+            assert lease.url == a.url
+            lease.fail("Tunnel connection failed")
+
+    assert a.cooldown_until == 60.0
+    async with pool.acquire() as lease:
+        assert lease.url == b.url
+
+    clock.now = 61.0
+    async with pool.acquire() as lease:
+        assert lease.url == a.url
+        lease.fail("Tunnel connection failed")
+    assert a.cooldown_until == 121.0
+
+
+@pytest.mark.asyncio
+async def test_slow_proxy_cools_down() -> None:
+    pool = ProxyPool(["http://a:3128"], max_latency=5.0, clock=_Clock())
+    [proxy] = pool.proxies
+
+    async with pool.acquire() as lease:
+        lease.latency = 2.0
+    assert proxy.latency == 2.0
+    assert proxy.cooldown_until == 0.0
+
+    async with pool.acquire() as lease:
+        lease.latency = 20.0
+    assert proxy.cooldown_until == 300.0
+
+
+@pytest.mark.asyncio
+async def test_waits_for_cooled_down_proxy() -> None:
+    pool = ProxyPool(["http://a:3128"], failure_threshold=1, cooldown=0.05)
+
+    async with pool.acquire() as lease:
+        lease.fail("HTTP Error 429: Too Many Requests")
+
+    async with asyncio.timeout(1), pool.acquire() as lease:
+        assert lease.url == "http://a:3128"
+
+
+@pytest.mark.asyncio
+async def test_resolve_through_stand_in_proxy() -> None:
+    async with _stand_in_proxy() as (url, requests):
+        pool = ProxyPool([url], failure_threshold=2)
+        youtube_downloader = YoutubeDownloader(proxy_pool=pool)
+
+        with pytest.raises(
+            YoutubeDownloaderException, match="Tunnel connection failed"
+        ):
+            await youtube_downloader.resolve("dQw4w9WgXcQ")
+
+    assert requests[0].startswith(b"CONNECT www.youtube.com:443")
+    assert pool.proxies[0].failures == 1
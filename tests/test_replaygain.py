@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import json
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import numpy as np
+
+from usdb_downloader.locks import SongLocks
+from usdb_downloader.loudness import SAMPLE_RATE
+from usdb_downloader.replaygain import (
+    ReplayGainTagger,
+    ReplayGainTaggerException,
+    TagRequest,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+
+@pytest.fixture
+def ffmpeg(tmp_path: Path) -> str:
+    # Stand-in for ffmpeg that stores raw stereo samples in the audio files.
+    # Decoding streams them, tagging copies them with the volume filter applied
+    # and records the metadata next to the input.
+    script = tmp_path / "ffmpeg"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import json, re, sys\n"
+        "import numpy as np\n"
+        "args = sys.argv[1:]\n"
+        "source = args[args.index('-i') + 1]\n"
+        "data = np.fromfile(source, dtype=np.float32)\n"
+        "if not data.size:\n"
+        "    sys.exit('Invalid data found when processing input')\n"
+        "if 'f32le' in args:\n"
+        "    sys.stdout.buffer.write(data.tobytes())\n"
+        "    sys.exit()\n"
+        "if '-af' in args:\n"
+        "    db = float(re.match(r'volume=(.*)dB', args[args.index('-af') + 1])[1])\n"
+        "    data = data * 10 ** (db / 20)\n"
+        "data.astype(np.float32).tofile(args[-1])\n"
+        "tags = [args[i + 1] for i, arg in enumerate(args) if arg == '-metadata']\n"
+        "open(source + '.tags', 'w').write(json.dumps(tags))\n",
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.fixture
+def tagger(ffmpeg: str) -> Generator[ReplayGainTagger]:
+    tagger = ReplayGainTagger(workers=1, batch_size=1, ffmpeg=ffmpeg)
+    yield tagger
+    tagger.close()
+
+
+def _write_audio(path: Path, level: float) -> Path:
+    # A 997 Hz sine in both channels, at the given level in dBFS.
+    times = np.arange(5 * SAMPLE_RATE) / SAMPLE_RATE
+    sine = 10 ** (level / 20) * np.sin(2 * np.pi * 997 * times)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.stack([sine, sine], axis=1).astype(np.float32).tofile(path)
+    return path
+
+
+def _tags(path: Path) -> list[str]:
+    return json.loads(path.with_name(path.name + ".tags").read_text(encoding="utf-8"))
+
+
+@pytest.mark.asyncio
+async def test_tag_writes_replaygain(tmp_path: Path, tagger: ReplayGainTagger) -> None:
+    audio = _write_audio(tmp_path / "Test - My Song.mp3", -10)
+
+    replay_gain = await tagger.tag("Test - My Song", audio)
+
+    assert replay_gain.ok
+    assert replay_gain.loudness == pytest.approx(-10, abs=0.05)
+    assert replay_gain.gain == pytest.approx(-8, abs=0.05)
+    assert replay_gain.applied == 0
+    assert replay_gain.audio_size == audio.stat().st_size
+    assert _tags(audio) == [
+        f"REPLAYGAIN_TRACK_GAIN={replay_gain.gain:+.2f} dB",
+        f"REPLAYGAIN_TRACK_PEAK={replay_gain.peak:.6f}",
+    ]
+    assert not (tmp_path / "Test - My Song.replaygain.mp3").exists()
+
+
+@pytest.mark.asyncio
+async def test_tag_normalizes_without_clipping(tmp_path: Path, ffmpeg: str) -> None:
+    loud = _write_audio(tmp_path / "Loud.mp3", -10)
+    quiet = _write_audio(tmp_path / "Quiet.mp3", -30)
+    # A single loud sample leaves the quiet song with less than 1 dB headroom.
+    samples = np.fromfile(quiet, dtype=np.float32)
+    samples[1000] = 0.9
+    samples.tofile(quiet)
+    tagger = ReplayGainTagger(workers=1, batch_size=2, normalize=True, ffmpeg=ffmpeg)
+    try:
+        loud_gain = await tagger.tag("Loud", loud)
+        quiet_gain = await tagger.tag("Quiet", quiet)
+    finally:
+        tagger.close()
+
+    assert loud_gain.applied == pytest.approx(-8, abs=0.05)
+    assert loud_gain.gain == pytest.approx(0, abs=0.05)
+    assert quiet_gain.gain == pytest.approx(12 - quiet_gain.applied, abs=0.05)
+    assert 0.8 < quiet_gain.applied < 0.92
+    assert np.abs(np.fromfile(quiet, dtype=np.float32)).max() <= 1.0
+    assert np.abs(np.fromfile(loud, dtype=np.float32)).max() == pytest.approx(
+        10 ** (-18 / 20), rel=0.01
+    )
+
+
+@pytest.mark.asyncio
+async def test_tag_reports_broken_audio(
+    tmp_path: Path, tagger: ReplayGainTagger
+) -> None:
+    audio = tmp_path / "Broken.mp3"
+    audio.write_bytes(b"")
+
+    replay_gain = await tagger.tag("Broken", audio)
+
+    assert not replay_gain.ok
+    assert replay_gain.error == "Invalid data found when processing input"
+
+
+def test_sweep_skips_locked_songs(tmp_path: Path, tagger: ReplayGainTagger) -> None:
+    lock_dir = tmp_path / "locks"
+    requests = [
+        TagRequest(name=name, audio=_write_audio(tmp_path / f"{name}.mp3", -20))
+        for name in ("A", "B")
+    ]
+    assert SongLocks(lock_dir).acquire("B")
+
+    [chunk] = list(tagger.sweep(requests, lock_dir))
+
+    assert [replay_gain.name for replay_gain in chunk] == ["A", "B"]
+    assert chunk[0].ok
+    assert chunk[1].locked
+    assert not (tmp_path / "B.mp3.tags").exists()
+
+
+@pytest.mark.asyncio
+async def test_tag_without_ffmpeg(tmp_path: Path) -> None:
+    tagger = ReplayGainTagger(ffmpeg=None)
+    tagger._ffmpeg = None
+
+    assert not tagger.available
+    with pytest.raises(ReplayGainTaggerException, match="ffmpeg is not installed"):
+        await tagger.tag("Test - My Song", tmp_path / "Test - My Song.mp3")
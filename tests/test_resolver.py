@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from usdb_downloader.metadata_cache import MetadataCache
+from usdb_downloader.models import VideoInfo
+from usdb_downloader.resolver import Resolver
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _video_info(video_id: str) -> VideoInfo:
+    return VideoInfo(video_id=video_id, available=True)
+
+
+@pytest.mark.asyncio
+async def test_prefetch_drops_finished_songs_beyond_limit(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(Resolver, "_MAX_PREFETCHED", 2)
+    youtube_downloader = MagicMock()
+    youtube_downloader.resolve = AsyncMock(side_effect=_video_info)
+    resolver = Resolver(youtube_downloader, MetadataCache(tmp_path))
+
+    # None of these songs is resolved here, as if other workers claimed them.
+    for idx in range(5):
+        resolver.prefetch([f"video{idx}"])
+        await asyncio.sleep(0)
+
+    try:
+        assert list(resolver._tasks) == ["video3", "video4"]
+        assert await resolver.resolve("video0") == _video_info("video0")
+    finally:
+        await resolver.aclose()
+    # Dropped songs are resolved from the metadata cache.
+    assert youtube_downloader.resolve.await_count == 5
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+from usdb_downloader.layout import Layout
+from usdb_downloader.locks import SongLocks
+from usdb_downloader.rewriter import LibraryRewriter, RewriteState
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def _create_song(path: Path, artist: str, video_id: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        f"#ARTIST:{artist}\n#TITLE:My Song\n#VIDEO:v={video_id}\n: 0 1 2 My\n",
+        encoding="utf-8",
+    )
+
+
+def test_rewrite_only_touches_downloaded_songs(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    output_dir = tmp_path / "output"
+    lock_dir = tmp_path / "locks"
+    _create_song(input_dir / "Test - My Song.txt", "Test", "dQw4w9WgXcQ")
+    _create_song(input_dir / "nested" / "Band - Anthem.txt", "Band", "eQw4w9WgXcQ")
+    _create_song(input_dir / "New - Song.txt", "New", "fQw4w9WgXcQ")
+    (input_dir / "Broken.txt").write_text("#ARTIST:Nobody\n", encoding="utf-8")
+    for name in ("Test - My Song", "Band - Anthem"):
+        song_dir = output_dir / name
+        song_dir.mkdir(parents=True)
+        (song_dir / f"{name}.txt").write_text("#ARTIST:Old\n", encoding="utf-8")
+        (song_dir / f"{name}.mp3").write_bytes(b"audio")
+    SongLocks(lock_dir).acquire("Band - Anthem")
+
+    rewriter = LibraryRewriter(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        lock_dir=lock_dir,
+        layout=Layout.FLAT,
+        workers=2,
+    )
+    rewrites = {rewrite.name: rewrite for chunk in rewriter.run() for rewrite in chunk}
+
+    assert {name: rewrite.state for name, rewrite in rewrites.items()} == {
+        "Test - My Song": RewriteState.REWRITTEN,
+        "Band - Anthem": RewriteState.LOCKED,
+        "New - Song": RewriteState.NOT_DOWNLOADED,
+        "Broken": RewriteState.INVALID,
+    }
+    song_dir = output_dir / "Test - My Song"
+    assert rewrites["Test - My Song"].song_dir == song_dir
+    assert (
+        (song_dir / "Test - My Song.txt")
+        .read_text(encoding="utf-8")
+        .startswith("#ARTIST:Test\n")
+    )
+    assert (song_dir / "Test - My Song.mp3").read_bytes() == b"audio"
+    assert (output_dir / "Band - Anthem" / "Band - Anthem.txt").read_text(
+        encoding="utf-8"
+    ) == "#ARTIST:Old\n"
+    assert not (output_dir / "New - Song").exists()
+
+
+def test_rewrite_leaves_unchanged_songs_alone(tmp_path: Path) -> None:
+    input_dir = tmp_path / "input"
+    output_dir = tmp_path / "output"
+    _create_song(input_dir / "Test - My Song.txt", "Test", "dQw4w9WgXcQ")
+    rewriter = LibraryRewriter(
+        input_dir=input_dir,
+        output_dir=output_dir,
+        lock_dir=tmp_path / "locks",
+        layout=Layout.FLAT,
+        workers=1,
+    )
+    (output_dir / "Test - My Song").mkdir(parents=True)
+    (output_dir / "Test - My Song" / "Test - My Song.txt").touch()
+
+    first = [rewrite.state for chunk in rewriter.run() for rewrite in chunk]
+    second = [rewrite.state for chunk in rewriter.run() for rewrite in chunk]
+
+    assert first == [RewriteState.REWRITTEN]
+    assert second == [RewriteState.UNCHANGED]
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import TYPE_CHECKING, Any
+from unittest.mock import AsyncMock, MagicMock
+from urllib.parse import urlsplit
+
+import pytest
+
+from usdb_downloader.api import Downloader
+from usdb_downloader.models import VideoInfo
+from usdb_downloader.server import JobServer
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+_SONG = b"#ARTIST:Test\n#TITLE:My Song\n#VIDEO:v=dQw4w9WgXcQ\n: 0 1 2 My\n"
+
+
+@pytest.fixture
+def downloader(tmp_path: Path) -> Generator[Downloader]:
+    downloader = Downloader(
+        input_dir=tmp_path / "input",
+        output_dir=tmp_path / "output",
+    )
+
+    def resolve(video_id: str) -> VideoInfo:
+        return VideoInfo(video_id=video_id, available=True)
+
+    youtube_downloader = downloader._app._youtube_downloader
+    youtube_downloader.resolve = AsyncMock(side_effect=resolve)
+    youtube_downloader.download_audio = AsyncMock()
+    youtube_downloader.download_video = AsyncMock()
+    downloader._app._verifier = MagicMock(available=False)
+    yield downloader
+    downloader.close()
+
+
+async def _request(
+    server: JobServer,
+    method: str,
+    target: str,
+    body: bytes = b"",
+) -> tuple[int, bytes]:
+    url = urlsplit(server.url)
+    reader, writer = await asyncio.open_connection(url.hostname, url.port)
+    writer.write(
+        f"{method} {target} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode()
+        + body
+    )
+    await writer.drain()
+    response = await asyncio.wait_for(reader.read(), 5)
+    writer.close()
+    await writer.wait_closed()
+
+    head, _, payload = response.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    if b"Transfer-Encoding: chunked" in head:
+        payload = _dechunk(payload)
+    return status, payload
+
+
+def _dechunk(payload: bytes) -> bytes:
+    data = b""
+    while True:
+        size, _, payload = payload.partition(b"\r\n")
+        if (length := int(size, 16)) == 0:
+            return data
+        data += payload[:length]
+        payload = payload[length + 2 :]
+
+
+def _events(payload: bytes) -> list[dict[str, Any]]:
+    return [json.loads(line) for line in payload.splitlines()]
+
+
+@pytest.mark.asyncio
+async def test_upload_streams_job_status(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0)
+    await server.start()
+    try:
+        status, payload = await _request(
+            server, "POST", "/jobs?name=Test%20-%20My%20Song", _SONG
+        )
+    finally:
+        await server.aclose()
+
+    events = _events(payload)
+    assert status == 200
+    assert [event["state"] for event in events] == ["queued", "running", "done"]
+    assert events[-1]["video_id"] == "dQw4w9WgXcQ"
+    assert events[-1]["song_dir"] == str(tmp_path / "output" / "Test - My Song")
+    assert (tmp_path / "output" / "Test - My Song" / "Test - My Song.txt").is_file()
+    assert not any((tmp_path / "uploads").iterdir())
+
+
+@pytest.mark.asyncio
+async def test_upload_without_video_id_fails(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0)
+    await server.start()
+    try:
+        _, payload = await _request(server, "POST", "/jobs?name=Broken", b"#ARTIST:X\n")
+    finally:
+        await server.aclose()
+
+    result = _events(payload)[-1]
+    assert result["state"] == "failed"
+    assert result["error"] == "Song file has no video ID"
+
+
+@pytest.mark.asyncio
+async def test_queued_job_can_be_polled(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0)
+    await server.start()
+    try:
+        status, payload = await _request(
+            server, "POST", "/jobs?name=Test%20-%20My%20Song&stream=0", _SONG
+        )
+        job_id = json.loads(payload)["id"]
+        _, events = await _request(server, "GET", f"/jobs/{job_id}/events")
+        _, snapshot = await _request(server, "GET", f"/jobs/{job_id}")
+        not_found, _ = await _request(server, "GET", "/jobs/unknown")
+    finally:
+        await server.aclose()
+
+    assert status == 202
+    assert _events(events)[-1]["state"] == "done"
+    assert json.loads(snapshot)["state"] == "done"
+    assert not_found == 404
+
+
+def test_full_queue_rejects_uploads(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0, queue_size=1)
+    # The worker is not started, so the first upload stays queued.
+    server._submit("First", _SONG)
+
+    with pytest.raises(Exception, match="Job queue is full"):
+        server._submit("Second", _SONG)
+    with pytest.raises(Exception, match="already queued"):
+        server._submit("First", _SONG)
+
+
+@pytest.mark.asyncio
+async def test_invalid_song_name_is_rejected(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0)
+    await server.start()
+    try:
+        status, payload = await _request(server, "POST", "/jobs?name=../x", _SONG)
+    finally:
+        await server.aclose()
+
+    assert status == 400
+    assert json.loads(payload) == {"error": "A valid song name is required"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("content_length", ["abc", "-1", "1e3"])
+async def test_invalid_content_length_is_rejected(
+    tmp_path: Path,
+    downloader: Downloader,
+    content_length: str,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0)
+    await server.start()
+    try:
+        url = urlsplit(server.url)
+        reader, writer = await asyncio.open_connection(url.hostname, url.port)
+        writer.write(
+            b"POST /jobs?name=x HTTP/1.1\r\n"
+            + f"Content-Length: {content_length}\r\n\r\n".encode()
+        )
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+    finally:
+        await server.aclose()
+
+    head, _, payload = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.1 400")
+    assert json.loads(payload) == {"error": "Invalid Content-Length"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("request_head", "status", "error"),
+    [
+        (b"GET /" + b"x" * 70_000 + b" HTTP/1.1\r\n\r\n", 400, "Request"),
+        (b"GET / HTTP/1.1\r\nX-Long: " + b"x" * 70_000 + b"\r\n\r\n", 431, "Header"),
+    ],
+    ids=["request_line", "header"],
+)
+async def test_overlong_lines_are_rejected(
+    tmp_path: Path,
+    downloader: Downloader,
+    request_head: bytes,
+    status: int,
+    error: str,
+) -> None:
+    server = JobServer(downloader, tmp_path / "uploads", port=0)
+    await server.start()
+    try:
+        url = urlsplit(server.url)
+        reader, writer = await asyncio.open_connection(url.hostname, url.port)
+        writer.write(request_head)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        await writer.wait_closed()
+    finally:
+        await server.aclose()
+
+    head, _, payload = response.partition(b"\r\n\r\n")
+    assert head.startswith(f"HTTP/1.1 {status}".encode())
+    assert json.loads(payload) == {"error": f"{error} line is too long"}
+
+
+def test_failed_upload_write_is_not_queued(
+    tmp_path: Path,
+    downloader: Downloader,
+) -> None:
+    # The spool directory is a file, so storing the upload fails.
+    spool_dir = tmp_path / "uploads"
+    spool_dir.touch()
+    server = JobServer(downloader, spool_dir, port=0)
+
+    with pytest.raises(Exception, match="Failed to store upload"):
+        server._submit("Test - My Song", _SONG)
+    assert server._queue.empty()
+    assert not server._jobs
@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+import pytest
+
+from usdb_downloader.shard import Shard
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("1/1", Shard(index=1, count=1)),
+        ("2/4", Shard(index=2, count=4)),
+    ],
+)
+def test_parse(value: str, expected: Shard) -> None:
+    assert Shard.parse(value) == expected
+
+
+@pytest.mark.parametrize("value", ["", "1", "0/2", "3/2", "1/0", "a/b"])
+def test_parse_raises_on_invalid_value(value: str) -> None:
+    with pytest.raises(ValueError):
+        Shard.parse(value)
+
+
+def test_contains_assigns_each_video_id_to_exactly_one_shard() -> None:
+    shards = [Shard(index=i, count=4) for i in range(1, 5)]
+    video_ids = [f"dQw4w9WgX{i:02d}" for i in range(50)]
+
+    for video_id in video_ids:
+        assert sum(shard.contains(video_id) for shard in shards) == 1
+
+
+def test_contains_is_stable() -> None:
+    # The assignment must never change, otherwise nodes would reshuffle songs.
+    assert Shard(index=1, count=2).contains("dQw4w9WgXcQ") is True
+    assert Shard(index=2, count=2).contains("dQw4w9WgXcQ") is False
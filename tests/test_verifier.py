@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sys
+from typing import TYPE_CHECKING
+
+import pytest
+
+from usdb_downloader.models import File
+from usdb_downloader.verifier import MediaVerifier, MediaVerifierException
+
+if TYPE_CHECKING:
+    from collections.abc import Generator
+    from pathlib import Path
+
+
+@pytest.fixture
+def ffprobe(tmp_path: Path) -> str:
+    # Stand-in for ffprobe that prints the JSON stored in the probed file.
+    script = tmp_path / "ffprobe"
+    script.write_text(
+        f"#!{sys.executable}\n"
+        "import sys\n"
+        "data = open(sys.argv[-1], encoding='utf-8').read()\n"
+        "if not data.startswith('{'):\n"
+        "    sys.exit('Invalid data found when processing input')\n"
+        "print(data)\n",
+        encoding="utf-8",
+    )
+    script.chmod(0o755)
+    return str(script)
+
+
+@pytest.fixture
+def verifier(ffprobe: str) -> Generator[MediaVerifier]:
+    verifier = MediaVerifier(workers=2, ffprobe=ffprobe)
+    yield verifier
+    verifier.close()
+
+
+@pytest.fixture
+def sample_file() -> File:
+    # 120 BPM: a beat lasts 0.125s, so the notes end at 2s + 400 * 0.125s = 52s.
+    return File(
+        name="Test - My Song",
+        video_id="dQw4w9WgXcQ",
+        headers={
+            "BPM": "120",
+            "GAP": "2000",
+            "MP3": "Test - My Song.mp3",
+            "VIDEO": "Test - My Song.webm",
+        },
+        lyrics=[": 0 4 5 My", "- 10", "* 396 4 5 Song", "E"],
+    )
+
+
+def _write_media(path: Path, codec_type: str, duration: float | None) -> None:
+    info: dict[str, object] = {"streams": [{"codec_type": codec_type}], "format": {}}
+    if duration is not None:
+        info["format"] = {"duration": f"{duration:.6f}"}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(info), encoding="utf-8")
+
+
+@pytest.mark.parametrize(
+    ("headers", "lyrics", "expected"),
+    [
+        ({"BPM": "120", "GAP": "2000"}, [": 0 4 5 a", "* 396 4 5 b"], 52.0),
+        ({"BPM": "150,5", "GAP": ""}, ["F 10 2 0 a", "R 2 3 0 b"], 12 * 60 / 602),
+        ({"BPM": "120"}, ["- 10", "E"], None),
+        ({"GAP": "2000"}, [": 0 4 5 a"], None),
+        ({"BPM": "fast"}, [": 0 4 5 a"], None),
+        ({"BPM": "0"}, [": 0 4 5 a"], None),
+        ({"BPM": "120", "RELATIVE": "YES"}, [": 0 4 5 a", "- 8", ": 0 4 5 b"], 1.5),
+    ],
+)
+def test_expected_duration(
+    headers: dict[str, str],
+    lyrics: list[str],
+    expected: float | None,
+) -> None:
+    pytest.importorskip("numpy")
+    file = File(name="Test - My Song", video_id="", headers=headers, lyrics=lyrics)
+
+    assert MediaVerifier.expected_duration(file) == (
+        pytest.approx(expected) if expected is not None else None
+    )
+
+
+@pytest.mark.asyncio
+async def test_verify_accepts_complete_media(
+    tmp_path: Path,
+    verifier: MediaVerifier,
+    sample_file: File,
+) -> None:
+    pytest.importorskip("numpy")
+    _write_media(tmp_path / "Test - My Song.mp3", "audio", 53.0)
+    _write_media(tmp_path / "Test - My Song.webm", "video", 54.0)
+
+    verification = await verifier.verify(sample_file, tmp_path)
+
+    assert verification.ok
+    assert verification.expected_duration == pytest.approx(52.0)
+    audio, video = verification.media
+    assert audio.kind == "audio"
+    assert audio.duration == pytest.approx(53.0)
+    assert audio.sha256 == hashlib.sha256(audio.path.read_bytes()).hexdigest()
+    assert video.size == video.path.stat().st_size
+
+
+@pytest.mark.asyncio
+async def test_verify_reports_truncated_and_mismatched_media(
+    tmp_path: Path,
+    verifier: MediaVerifier,
+    sample_file: File,
+) -> None:
+    pytest.importorskip("numpy")
+    _write_media(tmp_path / "Test - My Song.mp3", "audio", 30.0)
+    _write_media(tmp_path / "Test - My Song.webm", "audio", 54.0)
+
+    verification = await verifier.verify(sample_file, tmp_path)
+
+    assert verification.problems == (
+        "Test - My Song.mp3 is 30.0s long, but the notes end at 52.0s",
+        "Test - My Song.webm has no video stream",
+        "Audio and video lengths differ by 24.0s",
+    )
+
+
+@pytest.mark.asyncio
+async def test_verify_reports_missing_and_unreadable_media(
+    tmp_path: Path,
+    verifier: MediaVerifier,
+    sample_file: File,
+) -> None:
+    (tmp_path / "Test - My Song.webm").write_bytes(b"\x00\x01")
+
+    verification = await verifier.verify(sample_file, tmp_path)
+
+    assert verification.problems == (
+        "Test - My Song.mp3 is missing",
+        "Test - My Song.webm cannot be read: Invalid data found when processing input",
+    )
+
+
+@pytest.mark.asyncio
+async def test_verify_without_ffprobe_fails(tmp_path: Path, sample_file: File) -> None:
+    verifier = MediaVerifier()
+    verifier._ffprobe = None
+
+    assert not verifier.available
+    with pytest.raises(MediaVerifierException, match="ffprobe is not installed"):
+        await verifier.verify(sample_file, tmp_path)
+
+
+@pytest.mark.asyncio
+async def test_quarantine_renames_media(
+    tmp_path: Path,
+    verifier: MediaVerifier,
+    sample_file: File,
+) -> None:
+    _write_media(tmp_path / "Test - My Song.mp3", "audio", 10.0)
+    verification = await verifier.verify(sample_file, tmp_path)
+
+    verifier.quarantine(verification)
+
+    assert not (tmp_path / "Test - My Song.mp3").exists()
+    assert (tmp_path / "Test - My Song.mp3.suspect").is_file()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("video", "quarantined"),
+    [
+        (("video", 20.0), {"Test - My Song.webm"}),
+        (("audio", 54.0), {"Test - My Song.webm"}),
+        (("video", 80.0), {"Test - My Song.mp3", "Test - My Song.webm"}),
+    ],
+)
+async def test_quarantine_keeps_media_that_passed(
+    tmp_path: Path,
+    verifier: MediaVerifier,
+    sample_file: File,
+    video: tuple[str, float],
+    quarantined: set[str],
+) -> None:
+    _write_media(tmp_path / "Test - My Song.mp3", "audio", 53.0)
+    _write_media(tmp_path / "Test - My Song.webm", *video)
+    verification = await verifier.verify(sample_file, tmp_path)
+
+    verifier.quarantine(verification)
+
+    assert {path.stem for path in tmp_path.glob("*.suspect")} == quarantined
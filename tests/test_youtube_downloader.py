@@ -1,14 +1,21 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING, Any
 from unittest.mock import MagicMock, patch
 
 import pytest
 from yt_dlp.utils import DownloadError
 
+from usdb_downloader.bandwidth import Priority
+from usdb_downloader.models import VideoInfo
+from usdb_downloader.proxy_pool import ProxyPool
 from usdb_downloader.youtube_downloader import (
     YoutubeDownloader,
     YoutubeDownloaderException,
+    _DownloadMonitor,
 )
 
 if TYPE_CHECKING:
@@ -158,3 +165,323 @@ async def test_download_video_with_complex_name(
     expected_outtmpl = f"{output_path}.%(ext)s"
     assert opts["outtmpl"] == expected_outtmpl
     assert "feat" in str(opts["outtmpl"])
+
+
+@pytest.mark.asyncio
+async def test_download_audio_reports_postprocessing(
+    youtube_downloader: YoutubeDownloader,
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    on_postprocess = MagicMock()
+
+    await youtube_downloader.download_audio(
+        video_id=video_id,
+        output_path=output_path,
+        on_postprocess=on_postprocess,
+    )
+
+    args, _ = mock_yt_dlp.call_args
+    [hook] = args[0]["postprocessor_hooks"]
+    hook({"status": "finished"})
+    on_postprocess.assert_not_called()
+    hook({"status": "started"})
+    on_postprocess.assert_called_once_with()
+
+
+@pytest.mark.asyncio
+async def test_download_audio_uses_resolved_format(
+    youtube_downloader: YoutubeDownloader,
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+
+    await youtube_downloader.download_audio(
+        video_id=video_id,
+        output_path=output_path,
+        format_id="140",
+    )
+
+    args, _ = mock_yt_dlp.call_args
+    assert args[0]["format"] == "140/bestaudio[ext=m4a]/bestaudio"
+
+
+@pytest.mark.asyncio
+async def test_resolve_returns_metadata(
+    youtube_downloader: YoutubeDownloader,
+    mock_yt_dlp: MagicMock,
+    video_id: str,
+) -> None:
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    formats = [
+        {"format_id": "140", "acodec": "mp4a", "vcodec": "none"},
+        {"format_id": "248", "acodec": "none", "vcodec": "vp9"},
+    ]
+    yt_dlp_instance.extract_info.return_value = {
+        "duration": 212,
+        "format_id": "248",
+        "formats": formats,
+    }
+    select_audio = yt_dlp_instance.build_format_selector.return_value
+    select_audio.return_value = iter([formats[0]])
+
+    info = await youtube_downloader.resolve(video_id)
+
+    assert info == VideoInfo(
+        video_id=video_id,
+        available=True,
+        duration=212,
+        audio_format="140",
+        video_format="248",
+    )
+    yt_dlp_instance.extract_info.assert_called_once_with(
+        f"https://www.youtube.com/watch?v={video_id}", download=False
+    )
+    yt_dlp_instance.build_format_selector.assert_called_once_with(
+        "bestaudio[ext=m4a]/bestaudio"
+    )
+    select_audio.assert_called_once_with(
+        {"formats": formats, "has_merged_format": False, "incomplete_formats": False}
+    )
+
+
+@pytest.mark.asyncio
+async def test_resolve_returns_unavailable_on_download_error(
+    youtube_downloader: YoutubeDownloader,
+    mock_yt_dlp: MagicMock,
+    video_id: str,
+) -> None:
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    yt_dlp_instance.extract_info.side_effect = DownloadError("Private video")
+
+    info = await youtube_downloader.resolve(video_id)
+
+    assert info == VideoInfo(
+        video_id=video_id,
+        available=False,
+        error="Private video",
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "error",
+    [
+        "HTTP Error 429: Too Many Requests",
+        "Video unavailable. This content isn't available, try again later.",
+        "Unable to connect to proxy",
+    ],
+)
+async def test_resolve_raises_exception_on_transient_error(
+    youtube_downloader: YoutubeDownloader,
+    mock_yt_dlp: MagicMock,
+    video_id: str,
+    error: str,
+) -> None:
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    yt_dlp_instance.extract_info.side_effect = DownloadError(error)
+
+    with pytest.raises(YoutubeDownloaderException, match="resolve metadata"):
+        await youtube_downloader.resolve(video_id)
+
+
+def _hooked_download(
+    mock_yt_dlp: MagicMock,
+    report_progress: bool,
+    steps: int = 500,
+) -> threading.Event:
+    stopped = threading.Event()
+
+    def download(urls: list[str]) -> None:
+        args, _ = mock_yt_dlp.call_args
+        [progress_hook] = args[0]["progress_hooks"]
+        try:
+            for _ in range(steps):
+                if report_progress:
+                    progress_hook({"status": "downloading"})
+                time.sleep(0.01)
+        finally:
+            stopped.set()
+
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    yt_dlp_instance.download.side_effect = download
+    return stopped
+
+
+@pytest.mark.asyncio
+async def test_download_video_raises_exception_when_deadline_exceeded(
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    stopped = _hooked_download(mock_yt_dlp, report_progress=True)
+
+    with pytest.raises(YoutubeDownloaderException) as e:
+        await YoutubeDownloader(deadline=0.05).download_video(
+            video_id=video_id,
+            output_path=output_path,
+        )
+
+    assert "Failed to download video: deadline of 0.05s exceeded" in str(e.value)
+    assert stopped.wait(timeout=1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(("report_progress", "failures"), [(True, 0), (False, 1)])
+async def test_deadline_blames_proxy_only_without_progress(
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+    report_progress: bool,
+    failures: int,
+) -> None:
+    _hooked_download(mock_yt_dlp, report_progress=report_progress, steps=20)
+    pool = ProxyPool(["http://proxy:3128"])
+
+    with pytest.raises(YoutubeDownloaderException, match="deadline"):
+        await YoutubeDownloader(deadline=0.05, proxy_pool=pool).download_video(
+            video_id=video_id,
+            output_path=output_path,
+        )
+
+    assert pool.proxies[0].failures == failures
+
+
+@pytest.mark.asyncio
+async def test_download_audio_raises_exception_when_stalled(
+    monkeypatch: pytest.MonkeyPatch,
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    monkeypatch.setattr(YoutubeDownloader, "_STALL_CHECK_INTERVAL", 0.01)
+    _hooked_download(mock_yt_dlp, report_progress=False, steps=20)
+
+    with pytest.raises(YoutubeDownloaderException) as e:
+        await YoutubeDownloader(stall_timeout=0.05).download_audio(
+            video_id=video_id,
+            output_path=output_path,
+        )
+
+    assert "download stalled for more than 0.05s" in str(e.value)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_download_stops_worker_thread(
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    stopped = _hooked_download(mock_yt_dlp, report_progress=True)
+    task: asyncio.Task[Any] = asyncio.create_task(
+        YoutubeDownloader().download_video(video_id=video_id, output_path=output_path)
+    )
+    await asyncio.sleep(0.05)
+
+    task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert stopped.wait(timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_download_video_uses_proxy_from_pool(
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    yt_dlp_instance.download.side_effect = DownloadError("HTTP Error 429")
+    pool = ProxyPool(["http://proxy:3128"])
+    youtube_downloader = YoutubeDownloader(proxy_pool=pool)
+
+    with pytest.raises(YoutubeDownloaderException):
+        await youtube_downloader.download_video(
+            video_id=video_id,
+            output_path=output_path,
+        )
+
+    args, _ = mock_yt_dlp.call_args
+    assert args[0]["proxy"] == "http://proxy:3128"
+    assert pool.proxies[0].failures == 1
+    assert pool.proxies[0].active == 0
+
+
+def test_download_monitor_throttles_new_bytes() -> None:
+    throttle = MagicMock()
+    monitor = _DownloadMonitor(throttle=throttle)
+
+    monitor.progress_hook({"filename": "a.f1", "downloaded_bytes": 100})
+    monitor.progress_hook({"filename": "a.f1", "downloaded_bytes": 250})
+    monitor.progress_hook({"filename": "a.f2", "downloaded_bytes": 50})
+
+    assert [call.args[0] for call in throttle.call_args_list] == [100, 150, 50]
+
+
+@pytest.mark.asyncio
+async def test_download_audio_is_throttled_with_audio_priority(
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    limiter = MagicMock(enabled=True)
+
+    def download(urls: list[str]) -> None:
+        args, _ = mock_yt_dlp.call_args
+        [progress_hook] = args[0]["progress_hooks"]
+        progress_hook({"filename": "a.m4a", "downloaded_bytes": 1000})
+
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    yt_dlp_instance.download.side_effect = download
+
+    await YoutubeDownloader(bandwidth_limiter=limiter).download_audio(
+        video_id=video_id,
+        output_path=output_path,
+    )
+
+    limiter.consume.assert_called_once_with(1000, priority=Priority.AUDIO)
+
+
+@pytest.mark.asyncio
+async def test_waiting_for_bandwidth_is_no_stall(
+    monkeypatch: pytest.MonkeyPatch,
+    mock_yt_dlp: MagicMock,
+    output_path: Path,
+    video_id: str,
+) -> None:
+    monkeypatch.setattr(YoutubeDownloader, "_STALL_CHECK_INTERVAL", 0.01)
+
+    def consume(size: int, priority: Priority) -> None:
+        time.sleep(0.2)
+
+    limiter = MagicMock(enabled=True)
+    limiter.consume.side_effect = consume
+
+    def download(urls: list[str]) -> None:
+        args, _ = mock_yt_dlp.call_args
+        [progress_hook] = args[0]["progress_hooks"]
+        progress_hook({"filename": "a.webm", "downloaded_bytes": 1000})
+
+    yt_dlp_instance = mock_yt_dlp.return_value
+    yt_dlp_instance.__enter__.return_value = yt_dlp_instance
+    yt_dlp_instance.download.side_effect = download
+
+    await YoutubeDownloader(
+        stall_timeout=0.05,
+        bandwidth_limiter=limiter,
+    ).download_video(video_id=video_id, output_path=output_path)
+
+    limiter.consume.assert_called_once_with(1000, priority=Priority.VIDEO)